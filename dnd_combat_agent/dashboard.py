@@ -0,0 +1,453 @@
+"""
+D&D Combat Agent - Live Terminal Dashboard
+
+A curses view of the combat for `python main.py --dashboard`. The screen
+is split into panes:
+
+    +----------------------+--------------------+
+    |                      | Combat status      |
+    | Map                  +--------------------+
+    |                      | Turn tracker       |
+    +----------------------+--------------------+
+    | Log                  | Narration          |
+    +----------------------+--------------------+
+    | 🧙 command line / what the agents are doing |
+
+The game loop does not draw. It reports state changes (update() with a
+full state, apply() with an event's state delta), log lines and narration,
+and a render task draws at most `fps` frames a second. Each report
+recomputes the affected panes' lines and marks a pane dirty only when its
+lines changed, so a frame redraws the changed panes and nothing else.
+Reports arriving within one frame are drawn together.
+
+Keys are read when the terminal has input (an event loop reader, not a
+blocking input() call), so commands can be typed while a model call is in
+flight; they are queued and run in order. Anything printed while the
+dashboard is open goes to the log pane, except the agents' [INFO] progress
+lines, which replace the activity line under the command line.
+
+Needs a terminal with curses (on Windows, the windows-curses package).
+"""
+
+import asyncio
+import atexit
+import contextlib
+import sys
+import textwrap
+import time
+import unicodedata
+from collections import deque
+
+try:
+    import curses
+except ImportError:  # Windows without windows-curses
+    curses = None
+
+from subagents.encounter import USER_ID, display_name, get_position, monster_ids
+from subagents.grid import get_grid, render_viewport
+
+# Frames drawn per second at most
+FRAME_RATE = 20
+
+# Lines kept in the log pane
+LOG_LINES = 500
+
+# Log lines printed to the terminal when the dashboard closes
+TAIL_LINES = 12
+
+# Width of the right-hand column
+SIDE_WIDTH = 44
+
+PANES = ('map', 'status', 'turn', 'log', 'narration', 'input')
+
+# Emoji presentation selector, drawn with the character before it
+VARIATION_SELECTOR = '\ufe0f'
+
+
+def display_width(text: str) -> int:
+    """Terminal columns of a string (emoji and other wide characters take two)."""
+    width = 0
+    for ch in text:
+        if unicodedata.east_asian_width(ch) in 'WF':
+            width += 2
+        elif not unicodedata.combining(ch) and ch != VARIATION_SELECTOR:
+            width += 1
+    return width
+
+
+def clip(text: str, width: int) -> str:
+    """
+    The longest prefix of `text` that fits in `width` columns. Variation
+    selectors are dropped: terminals disagree on whether they widen the
+    character before them, and curses must know where the cursor is.
+    """
+    text = text.replace(VARIATION_SELECTOR, '')
+    used = 0
+    for i, ch in enumerate(text):
+        used += display_width(ch)
+        if used > width:
+            return text[:i]
+    return text
+
+
+# ============================================================
+# PANE CONTENTS
+# ============================================================
+
+def map_lines(state: dict, rows: int, cols: int) -> list[str]:
+    """The map around the user, sized to fit `rows` x `cols` columns."""
+    battleground = state.get('battleground', {})
+    if not battleground.get('size'):
+        return ['No battleground yet']
+    markers = {}
+    for cid in monster_ids(state):
+        if state.get(cid, {}).get('hp', 0) > 0:
+            markers[tuple(get_position(state, cid))] = state[cid].get('monster_emoji', '👾')
+    user_position = get_position(state, USER_ID)
+    markers[tuple(user_position)] = '🧙'
+    # Row labels, borders and the header lines take the rest of the pane
+    viewport = (max(1, rows - 4), max(1, (cols - 5) // 2))
+    return render_viewport(get_grid(battleground), user_position, markers, viewport)
+
+
+def status_lines(state: dict) -> list[str]:
+    """HP, AC and position of every combatant, and the wizard's spell slots."""
+    user = state.get('user_attributes', {})
+    lines = [
+        f"🧙 YOU ({user.get('class', 'fighter').upper()})",
+        f"   HP {user.get('hp', 0)}/{user.get('max_hp', user.get('hp', 0))}  AC {user.get('ac', 0)}"
+        f"  at {get_position(state, USER_ID)}",
+    ]
+    if user.get('spell_slots'):
+        slots = user['spell_slots']
+        maximum = user.get('max_spell_slots', slots)
+        lines.append(
+            f"   Slots Lv1 {slots.get('level_1', 0)}/{maximum.get('level_1', 0)}"
+            f"  Lv2 {slots.get('level_2', 0)}/{maximum.get('level_2', 0)}"
+        )
+    user_position = get_position(state, USER_ID)
+    for cid in monster_ids(state):
+        attributes = state.get(cid, {})
+        position = get_position(state, cid)
+        distance = abs(position[0] - user_position[0]) + abs(position[1] - user_position[1])
+        health = f"HP {attributes.get('hp', 0)}" if attributes.get('hp', 0) > 0 else 'DEFEATED'
+        lines.append(f"{attributes.get('monster_emoji', '👾')} {display_name(state, cid)}")
+        lines.append(f"   {health}  AC {attributes.get('ac', 0)}  at {position}  dist {distance}")
+    battleground = state.get('battleground', {})
+    lines.append(f"Terrain: {battleground.get('environment_emoji', '')} {battleground.get('environment', 'Normal')}")
+    return lines
+
+
+def turn_lines(state: dict) -> list[str]:
+    """Round, whose turn it is, the user's action economy and initiative."""
+    tracker = state.get('turn_tracker', {})
+    speed = state.get('user_attributes', {}).get('speed', 0)
+    current = tracker.get('current_turn', USER_ID)
+
+    def used(flag):
+        return 'used' if tracker.get(flag, False) else 'ready'
+
+    return [
+        f"Round {tracker.get('round', 1)}  -  {display_name(state, current)} to act",
+        f"Movement {max(0, speed - tracker.get('movement_used', 0))}/{speed}",
+        f"Action {used('action_used')}  Bonus {used('bonus_action_used')}",
+        "Order: " + ' > '.join(
+            ('*' if cid == current else '') + cid for cid in tracker.get('initiative', [])
+        ),
+    ]
+
+
+# ============================================================
+# DASHBOARD
+# ============================================================
+
+class PaneWriter:
+    """File-like object that turns printed text into dashboard lines."""
+
+    def __init__(self, dashboard):
+        self.dashboard = dashboard
+        self.pending = ''
+
+    def write(self, text: str) -> int:
+        self.pending += text
+        *lines, self.pending = self.pending.split('\n')
+        for line in lines:
+            self.dashboard.printed(line)
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+    def isatty(self) -> bool:
+        return False
+
+
+class Dashboard:
+    """Curses panes redrawn from state-change reports at a capped frame rate."""
+
+    def __init__(self, fps: int = FRAME_RATE):
+        self.frame_time = 1 / max(1, fps)
+        self.state: dict = {}
+        self.log_lines: deque = deque(maxlen=LOG_LINES)
+        self.narration = ''
+        self.activity = ''
+        self.buffer = ''
+        self.commands: asyncio.Queue = asyncio.Queue()
+        self.contents = {name: None for name in PANES}
+        self.dirty = set(PANES)
+        self.windows = {}
+        self.changed = asyncio.Event()
+        self.frames = 0
+        self.reports = 0
+        self.draw_seconds = 0.0
+        self.screen = None
+        self.keys = None  # window keys are read through
+        self._renderer = None
+        self._redirect = contextlib.ExitStack()
+
+    # ============================================================
+    # LIFECYCLE
+    # ============================================================
+
+    def start(self) -> None:
+        """Takes over the terminal and starts drawing."""
+        if curses is None:
+            raise RuntimeError("The dashboard needs the curses module (pip install windows-curses on Windows)")
+        if not sys.stdin.isatty() or not sys.stdout.isatty():
+            raise RuntimeError("The dashboard needs an interactive terminal")
+        self.screen = curses.initscr()
+        curses.noecho()
+        curses.cbreak()
+        with contextlib.suppress(curses.error):
+            curses.curs_set(1)
+        if curses.has_colors():
+            curses.start_color()
+            curses.use_default_colors()
+            curses.init_pair(1, curses.COLOR_CYAN, -1)  # pane titles
+            curses.init_pair(2, curses.COLOR_YELLOW, -1)  # narration
+        atexit.register(self.close)
+        self._layout()
+        loop = asyncio.get_running_loop()
+        loop.add_reader(sys.stdin.fileno(), self._read_keys)
+        self._renderer = asyncio.create_task(self._render())
+        writer = PaneWriter(self)
+        self._redirect.enter_context(contextlib.redirect_stdout(writer))
+        self._redirect.enter_context(contextlib.redirect_stderr(writer))
+
+    async def stop(self) -> None:
+        """Draws the last frame, gives the terminal back and prints the end of the log."""
+        if self.screen is None:
+            return
+        self._redirect.close()
+        asyncio.get_running_loop().remove_reader(sys.stdin.fileno())
+        self._renderer.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._renderer
+        self._draw()
+        self.close()
+        print("\n".join(list(self.log_lines)[-TAIL_LINES:]))
+
+    def close(self) -> None:
+        """Gives the terminal back; also run at exit, e.g. after Ctrl-C."""
+        if self.screen is None:
+            return
+        curses.nocbreak()
+        curses.echo()
+        curses.endwin()
+        self.screen = None
+
+    def summary(self) -> str:
+        average = self.draw_seconds / self.frames * 1000 if self.frames else 0.0
+        return f"{self.reports} updates drawn in {self.frames} frames, {average:.1f} ms per frame"
+
+    # ============================================================
+    # REPORTS FROM THE GAME
+    # ============================================================
+
+    def update(self, state: dict) -> None:
+        """The game state changed; redraw the panes that show something new."""
+        self.state = state
+        self._refresh_panes(('map', 'status', 'turn'))
+
+    def apply(self, delta: dict) -> None:
+        """An event changed part of the state (e.g. a DM tool call mid-turn)."""
+        self.update({**self.state, **delta})
+
+    def log(self, *lines: str) -> None:
+        self.log_lines.extend(lines)
+        self._mark('log')
+
+    def narrate(self, text: str) -> None:
+        self.narration = text
+        self._mark('narration')
+
+    def set_activity(self, text: str) -> None:
+        self.activity = text
+        self._mark('input')
+
+    def printed(self, line: str) -> None:
+        """A line printed by the game: progress lines go to the activity line, the rest to the log."""
+        text = line.strip()
+        if text.startswith('[INFO]'):
+            self.set_activity(text.removeprefix('[INFO]').strip())
+        elif text and set(text) - set('=-'):
+            self.log(text)
+
+    async def read_command(self) -> str:
+        """The next command typed, waiting for one if none is queued."""
+        if self.commands.empty():
+            self.set_activity('')
+        return await self.commands.get()
+
+    # ============================================================
+    # DRAWING
+    # ============================================================
+
+    def _mark(self, pane: str) -> None:
+        self.dirty.add(pane)
+        self.reports += 1
+        self.changed.set()
+
+    def _refresh_panes(self, panes) -> None:
+        for pane in panes:
+            lines = self._lines(pane)
+            if lines != self.contents[pane]:
+                self.contents[pane] = lines
+                self._mark(pane)
+
+    def _lines(self, pane: str) -> list[str]:
+        if not self.state:
+            return []
+        if pane == 'map':
+            rows, cols = self.windows['map'].getmaxyx() if 'map' in self.windows else (20, 40)
+            return map_lines(self.state, rows - 2, cols - 2)
+        if pane == 'status':
+            return status_lines(self.state)
+        return turn_lines(self.state)
+
+    def _layout(self) -> None:
+        """Creates the pane windows for the current terminal size."""
+        height, width = self.screen.getmaxyx()
+        side = min(SIDE_WIDTH, width // 2)
+        top = max(6, (height - 1) * 3 // 5)
+        status_height = max(3, top * 3 // 5)
+        bottom = max(3, height - 1 - top)
+        spans = {
+            'map': (top, width - side, 0, 0),
+            'status': (status_height, side, 0, width - side),
+            'turn': (max(3, top - status_height), side, status_height, width - side),
+            'log': (bottom, width - side, top, 0),
+            'narration': (bottom, side, top, width - side),
+            'input': (1, width, height - 1, 0),
+        }
+        self.windows = {}
+        for pane, (h, w, y, x) in spans.items():
+            try:
+                self.windows[pane] = curses.newwin(h, w, y, x)
+            except curses.error:
+                pass  # terminal too small for this pane
+        # Keys are read through the command line: reading through the
+        # (never drawn) main screen would refresh it over the panes. A
+        # terminal too small for the command line is read through the main
+        # screen, so typed keys are still taken off stdin and a resize
+        # still brings the panes back.
+        self.keys = self.windows.get('input', self.screen)
+        self.keys.keypad(True)
+        self.keys.nodelay(True)
+        self.contents = {name: None for name in PANES}
+        self._refresh_panes(('map', 'status', 'turn'))
+        self.dirty = set(PANES)
+        self.changed.set()
+
+    async def _render(self) -> None:
+        """Draws the dirty panes whenever something changed, at most once per frame time."""
+        while True:
+            await self.changed.wait()
+            self.changed.clear()
+            started = time.perf_counter()
+            self._draw()
+            elapsed = time.perf_counter() - started
+            self.frames += 1
+            self.draw_seconds += elapsed
+            await asyncio.sleep(max(0.0, self.frame_time - elapsed))
+
+    def _draw(self) -> None:
+        dirty, self.dirty = self.dirty, set()
+        for pane in PANES:
+            if pane in dirty and pane in self.windows:
+                with contextlib.suppress(curses.error):
+                    self._draw_pane(pane, self.windows[pane])
+        # The cursor stays on the command line
+        if 'input' in self.windows:
+            window = self.windows['input']
+            with contextlib.suppress(curses.error):
+                window.move(0, min(window.getmaxyx()[1] - 1, display_width('🧙 ' + self.buffer)))
+                window.noutrefresh()
+        curses.doupdate()
+
+    def _draw_pane(self, pane: str, window) -> None:
+        height, width = window.getmaxyx()
+        window.erase()
+        if pane == 'input':
+            line = f"🧙 {self.buffer}"
+            if self.activity:
+                note = f"  ⏳ {self.activity}"
+                if self.commands.qsize():
+                    note += f" ({self.commands.qsize()} queued)"
+                line = clip(line, width - 1).ljust(max(0, width - 1 - display_width(note)))
+                line = clip(line + note, width - 1)
+            window.addstr(0, 0, clip(line, width - 1))
+            window.noutrefresh()
+            return
+
+        window.box()
+        titles = {'map': 'Map', 'status': 'Combat status', 'turn': 'Turn', 'log': 'Log', 'narration': 'Narration'}
+        window.addstr(0, 2, f" {titles[pane]} ", curses.color_pair(1) | curses.A_BOLD)
+        inner = width - 2
+        if pane == 'log':
+            # Only the lines that can still be on screen are wrapped
+            tail = list(self.log_lines)[-(height - 2):]
+            wrapped = [part for line in tail for part in textwrap.wrap(line, inner) or ['']]
+            lines = wrapped[-(height - 2):]
+            attribute = curses.A_NORMAL
+        elif pane == 'narration':
+            lines = textwrap.wrap(self.narration, inner)[:height - 2]
+            attribute = curses.color_pair(2)
+        else:
+            lines = self.contents[pane] or []
+            attribute = curses.A_NORMAL
+        for row, line in enumerate(lines[:height - 2], start=1):
+            window.addstr(row, 1, clip(line, inner), attribute)
+        window.noutrefresh()
+
+    # ============================================================
+    # INPUT
+    # ============================================================
+
+    def _read_keys(self) -> None:
+        """Reads every key the terminal has ready (called by the event loop)."""
+        while True:
+            try:
+                key = self.keys.get_wch()
+            except curses.error:
+                return  # nothing more to read
+            if key == curses.KEY_RESIZE:
+                curses.update_lines_cols()
+                self._layout()
+            elif 'input' not in self.windows:
+                continue  # no command line to type into
+            elif key in ('\n', '\r', curses.KEY_ENTER):
+                command, self.buffer = self.buffer.strip(), ''
+                if command:
+                    self.log(f"🧙 > {command}")
+                    self.commands.put_nowait(command)
+                self._mark('input')
+            elif key in ('\b', '\x7f', curses.KEY_BACKSPACE):
+                self.buffer = self.buffer[:-1]
+                self._mark('input')
+            elif key == '\x15':  # Ctrl-U clears the line
+                self.buffer = ''
+                self._mark('input')
+            elif isinstance(key, str) and key.isprintable():
+                self.buffer += key
+                self._mark('input')
@@ -0,0 +1,344 @@
+"""
+D&D Combat Agent - Load Test
+
+Simulated players send command streams (the move / attack / cast /
+end turn grammar of main.py) through the real agent runner, session
+service, tools and callbacks. The model is replaced by a local fake
+with configurable latency, so no API key or network is needed and the
+numbers measure the orchestration, not the model.
+
+The fake plays each agent the way the real one does: the root agent
+transfers to the DM on the first command, and the DM calls one tool per
+model turn (a step per square moved; for "end turn" the user's turn end,
+a monster move and attack, and the turn bookkeeping) before answering in
+text. Its calls still pass through ResilientGemini's rate limiter,
+hedging and metrics.
+
+Concurrency is ramped in stages, after an unreported warm-up. Each stage
+reports throughput, command latency percentiles, event-loop lag, and
+memory per session (process RSS growth and serialized session size).
+Failed commands are counted per exception type, and the first traceback
+of each type is printed after the table.
+
+Usage:
+    python loadtest.py --players 1 10 50 100 --commands 20 --latency 0.3
+    python loadtest.py --players 200 --latency 0.05 --jitter 0.02 --think 0.5
+"""
+
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import resource
+import time
+import traceback
+import uuid
+from collections import Counter
+
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.runners import Runner
+from google.genai import types
+
+from subagents.dm_agent import dm_agent
+from subagents.latency import LatencyStats
+from subagents.memory import BoundedSessionService
+from subagents.pipeline import parse_command
+from subagents.rules import DIRECTION_DELTAS
+from subagents.resilience import ResilientGemini, metrics, rate_limiter, turn_budget
+from subagents.subagents import root_agent
+from tournament import CLASSES, new_match_state
+
+APP_NAME = 'dnd_loadtest'
+
+# Samples kept per statistic, enough for every command of a stage
+SAMPLE_WINDOW = 1_000_000
+
+# How often the lag monitor wakes up
+LAG_INTERVAL = 0.01
+
+# Relative frequency of each kind of player command
+COMMAND_WEIGHTS = {'move': 4, 'attack': 3, 'cast': 2, 'end_turn': 2, 'status': 1}
+
+
+def parse_args():
+    """
+    Parses command line options.
+    """
+    parser = argparse.ArgumentParser(description="D&D Combat Agent - load test with a fake model")
+    parser.add_argument(
+        '--players', type=int, nargs='+', default=[1, 10, 50],
+        help="Concurrent players per stage, one stage per value (default: 1 10 50)",
+    )
+    parser.add_argument(
+        '--commands', type=int, default=10,
+        help="Commands each player sends per stage (default: 10)",
+    )
+    parser.add_argument(
+        '--latency', type=float, default=0.3,
+        help="Mean fake model latency in seconds (default: 0.3)",
+    )
+    parser.add_argument(
+        '--jitter', type=float, default=0.1,
+        help="Standard deviation of the fake model latency (default: 0.1)",
+    )
+    parser.add_argument(
+        '--think', type=float, default=0.0,
+        help="Mean player think time between commands in seconds (default: 0)",
+    )
+    parser.add_argument(
+        '--rate', type=float, default=None,
+        help="Model calls per second allowed by the rate limiter (default: unlimited)",
+    )
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help="Seed of the battlegrounds and command streams",
+    )
+    return parser.parse_args()
+
+
+# ============================================================
+# FAKE MODEL
+# ============================================================
+
+def _call(name: str, **args) -> types.Part:
+    return types.Part(function_call=types.FunctionCall(name=name, args=args))
+
+
+def dm_script(text: str) -> list[types.Part]:
+    """The tool calls the DM makes for a player command, in order."""
+    command = parse_command(text)
+    if command is None:
+        return []
+    verb = command['verb']
+    if verb == 'move':
+        return [_call('move_character', character='user', direction=command['direction'])] * command['steps']
+    if verb == 'attack':
+        return [_call('attack', source='user', target=command['target'] or 'monster')]
+    if verb == 'cast':
+        return [_call('cast_spell', spell_name=command['spell'], target=command['target'] or 'monster')]
+    if verb == 'end_turn':
+        return [
+            _call('end_user_turn'),
+            _call('move_character', character='monster', direction='west'),
+            _call('attack', source='monster', target='user'),
+            _call('advance_turn'),
+            _call('reset_turn'),
+        ]
+    if verb == 'status':
+        return [_call('check_turn_status')]
+    return [_call('get_available_actions', character='user')]
+
+
+class FakeGemini(ResilientGemini):
+    """
+    ResilientGemini whose requests are answered locally after a random
+    delay instead of by the API. Everything around the request (rate
+    limiter, hedging, metrics) runs as usual.
+    """
+
+    latency: float = 0.3
+    jitter: float = 0.1
+
+    async def _collect(self, llm_request: LlmRequest) -> list[LlmResponse]:
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        labels = (llm_request.config.labels if llm_request.config else None) or {}
+        agent = labels.get('adk_agent_name')
+
+        # The player's latest command and the tool calls answered since
+        contents = llm_request.contents or []
+        text, answered = '', 0
+        for content in reversed(contents):
+            parts = content.parts or []
+            if any(part.function_response for part in parts):
+                answered += 1
+            elif content.role == 'user' and any(part.text for part in parts):
+                text = next(part.text for part in parts if part.text)
+                break
+
+        if agent == 'root_agent':
+            script = [_call('transfer_to_agent', agent_name='dm_agent')]
+        else:
+            script = dm_script(text)
+        part = script[answered] if answered < len(script) else types.Part(text=f"The DM resolves: {text}")
+        # Rough token counts (4 characters a token), as the API would report
+        prompt_tokens = sum(len(p.text or '') for c in contents for p in (c.parts or [])) // 4
+        return [LlmResponse(
+            content=types.Content(role='model', parts=[part]),
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=prompt_tokens, candidates_token_count=16, total_token_count=prompt_tokens + 16,
+            ),
+        )]
+
+
+def use_fake_model(latency: float, jitter: float) -> None:
+    """Puts the fake model on the agents a combat turn goes through."""
+    for agent in (root_agent, dm_agent):
+        agent.model = FakeGemini(model=agent.model.model, latency=latency, jitter=jitter)
+
+
+def unlimited_rate() -> None:
+    rate_limiter.max_rate = rate_limiter.rate = float('inf')
+    rate_limiter.capacity = rate_limiter.tokens = float('inf')
+
+
+# ============================================================
+# PLAYERS
+# ============================================================
+
+def next_command(rng: random.Random, user_class: str) -> str:
+    """A random command in main.py's grammar."""
+    kinds = [kind for kind in COMMAND_WEIGHTS if kind != 'cast' or user_class == 'wizard']
+    kind = rng.choices(kinds, weights=[COMMAND_WEIGHTS[kind] for kind in kinds])[0]
+    if kind == 'move':
+        direction = rng.choice([d for d in DIRECTION_DELTAS if len(d) <= 5])
+        steps = rng.randint(1, 3)
+        return f"move {direction} {steps}" if steps > 1 else f"move {direction}"
+    if kind == 'attack':
+        return rng.choice(["attack", "attack monster"])
+    if kind == 'cast':
+        return rng.choice(["cast magic missile at monster", "cast fireball at monster", "cast heal"])
+    if kind == 'end_turn':
+        return rng.choice(["end turn", "done"])
+    return "status"
+
+
+async def player(runner, session_service, index: int, args, stats: dict, rng: random.Random) -> None:
+    """One simulated player: a session and a stream of commands."""
+    user_class = CLASSES[index % len(CLASSES)]
+    user_id = f'player_{index}'
+    session = await session_service.create_session(
+        app_name=APP_NAME, user_id=user_id, session_id=str(uuid.uuid4()),
+        state=new_match_state(user_class, args.seed * 1000 + index, 1),
+    )
+    for _ in range(args.commands):
+        if args.think:
+            await asyncio.sleep(rng.expovariate(1 / args.think))
+        message = types.Content(role='user', parts=[types.Part(text=next_command(rng, user_class))])
+        started = time.perf_counter()
+        try:
+            with turn_budget():
+                async for _ in runner.run_async(user_id=user_id, session_id=session.id, new_message=message):
+                    pass
+        except Exception as exc:
+            name = type(exc).__name__
+            stats['errors'][name] += 1
+            stats['tracebacks'].setdefault(name, traceback.format_exc())
+            continue
+        stats['latency'].record(time.perf_counter() - started)
+
+
+async def monitor_lag(lag: LatencyStats, stop: asyncio.Event) -> None:
+    """Records how late the event loop wakes a task that sleeps LAG_INTERVAL."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        lag.record(max(0.0, time.perf_counter() - started - LAG_INTERVAL))
+
+
+def rss_bytes() -> int:
+    """Resident memory of this process."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # Peak, not current, where /proc is missing; KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def run_stage(players: int, args) -> dict:
+    """Plays one stage with `players` concurrent players in fresh sessions."""
+    # Every player stays resident, so memory per session is measurable
+    session_service = BoundedSessionService(max_resident=players + 1)
+    runner = Runner(app_name=APP_NAME, agent=root_agent, session_service=session_service)
+    stats = {'latency': LatencyStats(SAMPLE_WINDOW), 'errors': Counter(), 'tracebacks': {}}
+    lag = LatencyStats(SAMPLE_WINDOW)
+    stop = asyncio.Event()
+    calls_before = metrics.calls
+    rss_before = rss_bytes()
+
+    monitor = asyncio.create_task(monitor_lag(lag, stop))
+    started = time.perf_counter()
+    # The agent callbacks print progress lines; keep them off the report
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        await asyncio.gather(*(
+            player(runner, session_service, i, args, stats, random.Random(args.seed * 1000 + i))
+            for i in range(players)
+        ))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+
+    sessions = session_service.stats()
+    completed = stats['latency'].total
+    return {
+        'players': players,
+        'commands': completed,
+        'errors': sum(stats['errors'].values()),
+        'error_types': dict(stats['errors']),
+        'tracebacks': stats['tracebacks'],
+        'seconds': elapsed,
+        'throughput': completed / elapsed if elapsed else 0.0,
+        'latency': stats['latency'].summary(),
+        'lag': dict(lag.summary(), max=max(lag.samples, default=None)),
+        'model_calls': metrics.calls - calls_before,
+        'rss_per_session': max(0, rss_bytes() - rss_before) / players,
+        'bytes_per_session': sessions['resident_bytes'] / max(1, sessions['resident_sessions']),
+    }
+
+
+def format_stages(results: list[dict]) -> list[str]:
+    def ms(value):
+        return f"{value * 1000:.0f}" if value is not None else '-'
+
+    lines = [
+        f"{'players':>8}{'cmds':>7}{'errors':>7}{'cmd/s':>8}{'calls/s':>9}"
+        f"{'p50 ms':>8}{'p95 ms':>8}{'p99 ms':>8}{'lag p99':>9}{'lag max':>9}{'RSS/sess':>10}{'state/sess':>12}"
+    ]
+    for r in results:
+        lines.append(
+            f"{r['players']:8}{r['commands']:7}{r['errors']:7}{r['throughput']:8.1f}"
+            f"{r['model_calls'] / r['seconds']:9.1f}"
+            f"{ms(r['latency']['p50']):>8}{ms(r['latency']['p95']):>8}{ms(r['latency']['p99']):>8}"
+            f"{ms(r['lag']['p99']):>9}{ms(r['lag']['max']):>9}"
+            f"{r['rss_per_session'] / 1024:9.0f}K{r['bytes_per_session'] / 1024:11.1f}K"
+        )
+    return lines
+
+
+def format_errors(results: list[dict]) -> list[str]:
+    """Failed commands per stage and exception type, with the first traceback of each."""
+    lines = []
+    for r in results:
+        for name, count in sorted(r['error_types'].items(), key=lambda item: -item[1]):
+            lines.append(f"{r['players']} player(s): {count} x {name}, first one:")
+            lines.extend('    ' + line for line in r['tracebacks'][name].rstrip().splitlines())
+    return lines
+
+
+async def main(args):
+    use_fake_model(args.latency, args.jitter)
+    if args.rate is None:
+        unlimited_rate()
+    else:
+        rate_limiter.max_rate = rate_limiter.rate = args.rate
+    random.seed(args.seed)
+
+    # First imports, agent setup and caches are not part of any stage
+    await run_stage(1, argparse.Namespace(**dict(vars(args), commands=2, think=0.0)))
+
+    results = []
+    for players in args.players:
+        print(f"Stage: {players} player(s) x {args.commands} commands...")
+        results.append(await run_stage(players, args))
+    print()
+    print("\n".join(format_stages(results)))
+    errors = format_errors(results)
+    if errors:
+        print()
+        print("\n".join(errors))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
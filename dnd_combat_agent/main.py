@@ -12,19 +12,156 @@ Features:
 - AI-controlled monsters
 """
 
+import argparse
 import asyncio
 import uuid
 
 from dotenv import load_dotenv
-from google.adk.runners import Runner
-from google.adk.sessions import InMemorySessionService
-from subagents.subagents import root_agent
-from utils import call_agent, show_battle_ground, create_character, display_combat_state
+from subagents.startup import startup
+from subagents.encounter import roll_initiative
+from subagents.speculation import speculation
+from subagents.latency import format_report
+from subagents.tiering import tiering
+from subagents.profiler import profiler, format_report as format_profile
+from subagents.limits import MAX_EVENTS_PER_SESSION, MAX_RESIDENT_SESSIONS
+from dashboard import FRAME_RATE, Dashboard
+from utils import (
+    call_agent,
+    show_battle_ground,
+    create_character,
+    display_combat_state,
+    extra_monsters,
+    extra_monster_markers,
+)
 
 load_dotenv()
 
 
-async def main():
+def parse_args():
+    """
+    Parses command line options.
+    """
+    parser = argparse.ArgumentParser(description="D&D Combat Agent")
+    parser.add_argument(
+        '--monsters', type=int, default=1,
+        help="Number of monsters in the encounter (default: 1)",
+    )
+    parser.add_argument(
+        '--offline', action='store_true',
+        help="Generate the battle scenario locally, without calling the model",
+    )
+    parser.add_argument(
+        '--seed', type=int, default=None,
+        help="Seed for the offline scenario generator (reproducible battles)",
+    )
+    parser.add_argument(
+        '--hedge', action='store_true',
+        help="Send a duplicate model request when a call is slower than the recent p95",
+    )
+    parser.add_argument(
+        '--rules-first', action='store_true',
+        help="Resolve turns with the Python rules and use the model only for narration",
+    )
+    parser.add_argument(
+        '--async-narration', action='store_true',
+        help="With --rules-first, print narration when it arrives instead of waiting for it",
+    )
+    parser.add_argument(
+        '--difficulty', choices=('easy', 'normal', 'hard', 'deadly'), default='normal',
+        help="With --rules-first, how the monsters pick their moves: greedy, pathfinding, "
+             "expectimax search, or search with parallel rollouts (default: normal)",
+    )
+    parser.add_argument(
+        '--no-tiering', action='store_true',
+        help="Always use the model configured on each agent instead of per-request model tiers",
+    )
+    parser.add_argument(
+        '--max-events', type=int, default=None,
+        help=f"Events kept per session (default: {MAX_EVENTS_PER_SESSION})",
+    )
+    parser.add_argument(
+        '--max-resident-sessions', type=int, default=None,
+        help=f"Sessions kept in memory before idle ones are hibernated to disk (default: {MAX_RESIDENT_SESSIONS})",
+    )
+    parser.add_argument(
+        '--profile-startup', action='store_true',
+        help="Print import and agent construction time per module",
+    )
+    parser.add_argument(
+        '--dashboard', action='store_true',
+        help="Play in a live terminal dashboard (map, status, turn, log and narration panes)",
+    )
+    parser.add_argument(
+        '--fps', type=int, default=FRAME_RATE,
+        help=f"Dashboard frames per second at most (default: {FRAME_RATE})",
+    )
+    return parser.parse_args()
+
+
+def show_state(state, dashboard=None):
+    """
+    Shows the battleground and combat status, or hands the state to the
+    dashboard, which redraws only the panes that changed.
+    """
+    if dashboard:
+        dashboard.update(state)
+        return
+    battleground = state['battleground']
+    show_battle_ground(
+        battleground['size'],
+        battleground['rectangle_position'],
+        battleground['environment_emoji'],
+        battleground['user_position'],
+        battleground['monster_position'],
+        state['monster']['monster_emoji'],
+        terrain_layers=battleground.get('terrain_layers'),
+        other_monsters=extra_monster_markers(state),
+    )
+    display_combat_state(
+        state['user_attributes'],
+        state['monster'],
+        battleground,
+        extra_monsters(state),
+    )
+
+
+async def restore_state(session_service, app_name, user_id, session_id, state):
+    """
+    Makes a saved or earlier state the session's state again.
+    """
+    from google.adk.events import Event, EventActions
+
+    session = await session_service.get_session(
+        user_id=user_id,
+        app_name=app_name,
+        session_id=session_id,
+    )
+    await session_service.append_event(
+        session,
+        Event(author='user', actions=EventActions(state_delta=state)),
+    )
+    return state
+
+
+async def narrate(runner, user_id, session_id, session_service, prompt, dashboard=None):
+    """
+    Makes the single narration model call of a rules-first turn and prints it
+    (or shows it in the dashboard's narration pane).
+    """
+    response, _ = await call_agent(
+        runner=runner,
+        session_id=session_id,
+        user_id=user_id,
+        user_input=prompt,
+        session_service=session_service,
+    )
+    if response and dashboard:
+        dashboard.narrate(' '.join(response))
+    elif response:
+        print(f"\n📜 {' '.join(response)}\n")
+
+
+async def main(args):
     """
     Main game function that handles:
     1. Class selection (Fighter/Wizard)
@@ -33,6 +170,10 @@ async def main():
     4. Turn-based combat loop
     """
     
+    # Import the ADK stack and build the agents in the background while
+    # the player picks a class
+    loading = asyncio.get_running_loop().run_in_executor(None, startup.load_modules)
+    
     # ===== WELCOME AND CLASS SELECTION =====
     print("\n" + "="*70)
     print("🎮 D&D COMBAT AGENT")
@@ -47,6 +188,7 @@ async def main():
     print("  2. Wizard - Spell casting, ranged attacks, lower HP\n")
     
     # Get user class choice
+    startup.mark('class menu shown')
     user_class = ''
     while user_class not in ['fighter', 'wizard', '1', '2']:
         choice = input("Choose your class (fighter/wizard or 1/2): ").strip().lower()
@@ -63,17 +205,46 @@ async def main():
     user_attributes = create_character(user_class)
     
     print("Generating your battle scenario...\n")
+    
+    await loading
+    startup.mark('game ready')
+    if args.profile_startup:
+        print("⏱️  Startup profile:")
+        print("\n".join(startup.report()))
+        print()
+    
+    # Already loaded by the background import, so these are instant
+    from google.adk.events import Event, EventActions
+    from google.adk.runners import Runner
+    from subagents.subagents import root_agent
+    from subagents import hints, search, snapshot
+    from subagents.analytics import combat_store, outcome_row
+    from subagents.history import StateHistory
+    from subagents.pipeline import format_log, narration_prompt, play_turn
+    from subagents.narrator import narrator_agent
+    from subagents.procedural import generate_scenario
+    from subagents.resilience import metrics as model_metrics, hedging, request_latency, call_latency
+    from subagents.memory import BoundedSessionService
+    from subagents.connections import model_clients
+    
+    hedging.enabled = args.hedge
+    tiering.enabled = not args.no_tiering
 
 
     # ===== SESSION SETUP =====
-    # Create an in-memory session service to manage game state
-    session_service = InMemorySessionService()
+    # Create an in-memory session service to manage game state, with bounded
+    # event history and idle sessions hibernated to disk
+    limits = {'max_events': args.max_events, 'max_resident': args.max_resident_sessions}
+    session_service = BoundedSessionService(
+        **{name: value for name, value in limits.items() if value is not None}
+    )
 
     # Initialize game state with user character
     initial_state = {
         'user:user_name': 'abc',
         'user:strategy': '',
         'user_attributes': user_attributes,  # Character stats (HP, AC, spells, etc.)
+        'encounter_size': max(1, args.monsters),  # Number of monsters to generate
     }
 
     # Create unique session identifiers
@@ -97,16 +268,59 @@ async def main():
         agent=root_agent,  # Root agent handles routing to bg_initializer or dm_agent
         session_service=session_service,
     )
+    
+    # Narrator for the rules-first pipeline, in its own session so the
+    # narration calls carry no combat history
+    NARRATION_SESSION_ID = f'{SESSION_ID}-narration'
+    narrator_runner = None
+    pending_narrations = set()
+    if args.rules_first:
+        await session_service.create_session(
+            user_id=USER_ID,
+            app_name=APP_NAME,
+            session_id=NARRATION_SESSION_ID,
+        )
+        narrator_runner = Runner(
+            app_name=APP_NAME,
+            agent=narrator_agent,
+            session_service=session_service,
+        )
 
     # ===== BATTLE SCENARIO GENERATION =====
-    # Call root agent to generate theme, monster, and battleground
-    response, initial_state = await call_agent(
-        runner=root_runner,
-        session_id=SESSION_ID,
-        user_id=USER_ID,
-        user_input="Generate a D&D combat theme.",
-        session_service=session_service,
-    )
+    # Call root agent to generate theme, monster, and battleground,
+    # unless the scenario is generated locally
+    generated_state = None
+    if not args.offline:
+        response, generated_state = await call_agent(
+            runner=root_runner,
+            session_id=SESSION_ID,
+            user_id=USER_ID,
+            user_input="Generate a D&D combat theme.",
+            session_service=session_service,
+        )
+
+    generated_state = generated_state or {}
+    if not (generated_state.get('theme') and generated_state.get('monster') and generated_state.get('battleground')):
+        # Offline mode, or the model is unavailable: build the scenario locally
+        if not args.offline:
+            print("⚠️  Model scenario unavailable, using the offline generator instead")
+        scenario = generate_scenario(encounter_size=initial_state['encounter_size'], seed=args.seed)
+        session = await session_service.get_session(
+            user_id=USER_ID,
+            app_name=APP_NAME,
+            session_id=SESSION_ID,
+        )
+        await session_service.append_event(
+            session,
+            Event(author='user', actions=EventActions(state_delta=scenario)),
+        )
+        session = await session_service.get_session(
+            user_id=USER_ID,
+            app_name=APP_NAME,
+            session_id=SESSION_ID,
+        )
+        generated_state = session.state
+    initial_state = generated_state
 
     # Extract generated battle components
     theme = initial_state.get('theme', '')  # Background story
@@ -132,7 +346,9 @@ async def main():
         battle_ground['environment_emoji'],  # Terrain emoji (🔥, 🌳, etc.)
         battle_ground['user_position'], 
         battle_ground['monster_position'], 
-        monster['monster_emoji']
+        monster['monster_emoji'],
+        terrain_layers=battle_ground.get('terrain_layers'),
+        other_monsters=extra_monster_markers(initial_state),
     )
     
     # ===== TURN TRACKER INITIALIZATION =====
@@ -148,19 +364,38 @@ async def main():
     
     # Create turn tracker to manage movement, action, and bonus action per turn
     if 'turn_tracker' not in initial_state:
+        initiative = roll_initiative(initial_state)
         initial_state['turn_tracker'] = {
-            'current_turn': 'user',  # Whose turn it is
+            'current_turn': 'user',  # Whose turn it is (combat opens on the user's turn)
             'movement_used': 0,  # How many squares moved this turn
             'action_used': False,  # Whether main action was used
             'bonus_action_used': False,  # Whether bonus action was used
+            'initiative': initiative,  # Turn order of all combatants
+            'round': 1,
         }
+        print(f"🎲 Initiative order: {', '.join(initiative)}")
+        
+        # Persist the tracker so the DM agent sees the initiative order
+        session = await session_service.get_session(
+            user_id=USER_ID,
+            app_name=APP_NAME,
+            session_id=SESSION_ID,
+        )
+        await session_service.append_event(
+            session,
+            Event(
+                author='user',
+                actions=EventActions(state_delta={'turn_tracker': initial_state['turn_tracker']}),
+            ),
+        )
     
     # ===== DISPLAY COMBAT STATUS =====
     # Show HP, AC, positions, and spell slots
     display_combat_state(
         initial_state.get('user_attributes', {}),
         initial_state.get('monster', {}),
-        initial_state.get('battleground', {})
+        initial_state.get('battleground', {}),
+        extra_monsters(initial_state),
     )
     
     # ===== COMBAT INSTRUCTIONS =====
@@ -192,13 +427,16 @@ async def main():
     
     print("    • 'end turn' - Finish your turn (monster will act)")
     print("    • 'status' - Check current battle state")
+    print("    • 'hint' - Recommend the best plan for this turn")
+    print("    • 'save [name]' / 'load [name]' - Save or restore the battle")
+    print("    • 'undo' / 'rewind N' - Take back the last command(s)")
     print("    • 'quit' - Exit combat")
     print("  ")
     
     # Show class-specific tips
     if user_class == 'wizard':
-        print("  💡 TIP: Use heal as a bonus action after attacking!")
-        print("      Example: 'cast fireball' → 'cast heal' → 'end turn'")
+        print("  💡 TIP: Fireball never hits you, and heal is a bonus action once you are hurt!")
+        print("      Example: 'cast fireball' → 'end turn', later 'cast magic_missile' → 'cast heal'")
     else:
         print("  💡 TIP: You can move AND attack in the same turn!")
         print("      Example: 'move north' → 'attack' → 'end turn'")
@@ -209,10 +447,35 @@ async def main():
     # Loop continues until combat ends (victory, defeat, or quit)
     combat_active = True
     current_state = initial_state  # Track current state across turns
+    history = StateHistory()  # Earlier states for undo / rewind
+    history.push(current_state)
+    
+    # The live dashboard takes over the terminal for the combat
+    dashboard = None
+    if args.dashboard:
+        dashboard = Dashboard(args.fps)
+        try:
+            dashboard.start()
+        except RuntimeError as e:
+            print(f"⚠️  {e}; using the plain terminal instead")
+            dashboard = None
+        else:
+            dashboard.update(current_state)
+            dashboard.log(theme)
     
+    speculating = None
     while combat_active:
-        # Get user input for their action
-        user_action = input("🧙 Your action: ").strip()
+        # Plan the monster phase while the player is thinking (one planner
+        # at a time, since it fills a shared cache)
+        if args.rules_first and args.difficulty == 'normal' and (speculating is None or speculating.done()):
+            speculating = asyncio.create_task(asyncio.to_thread(speculation.speculate, current_state))
+        
+        # Get user input for their action (off the event loop, so async
+        # narration can print while waiting)
+        if dashboard:
+            user_action = (await dashboard.read_command()).strip()
+        else:
+            user_action = (await asyncio.to_thread(input, "🧙 Your action: ")).strip()
         
         # Handle quit command
         if user_action.lower() in ['quit', 'exit']:
@@ -224,55 +487,154 @@ async def main():
             print("⚠️  Please enter an action!")
             continue
         
-        # ===== PROCESS USER ACTION =====
-        # Send action to DM agent which will:
-        # 1. Execute user's action (move/attack/cast spell)
-        # 2. Update game state
-        # 3. Execute monster turn if user ended their turn
-        # 4. Return updated state
-        response, current_state = await call_agent(
-            runner=root_runner,
-            session_id=SESSION_ID,
-            user_id=USER_ID,
-            user_input=user_action,
-            session_service=session_service,
-        )
+        # Save and load the game as a binary snapshot
+        words = user_action.split()
+        if words[0].lower() in ('save', 'load') and len(words) <= 2:
+            name = words[1] if len(words) == 2 else snapshot.DEFAULT_SAVE
+            if words[0].lower() == 'save':
+                print(f"💾 Saved to {snapshot.save(current_state, name)}\n")
+                continue
+            try:
+                loaded = snapshot.load(name)
+            except (OSError, snapshot.SnapshotError) as e:
+                print(f"⚠️  Could not load '{name}': {e}\n")
+                continue
+            print(f"📂 Loaded '{name}'\n")
+            current_state = await restore_state(session_service, APP_NAME, USER_ID, SESSION_ID, loaded)
+            show_state(current_state, dashboard)
+            history.push(current_state)
+            continue
         
-        # Display DM's response (what happened, results, etc.)
-        print(f"\n{'='*70}")
-        print(response)
-        print(f"{'='*70}\n")
+        # Take back commands without calling the model again
+        if words[0].lower() in ('undo', 'rewind') and len(words) <= 2:
+            steps = int(words[1]) if len(words) == 2 and words[1].isdigit() else 1
+            before = history.available()
+            previous = history.rewind(steps)
+            if previous is None:
+                print("⚠️  Nothing to undo\n")
+                continue
+            print(f"⏪ Rewound {before - history.available()} step(s), {history.available()} more available\n")
+            current_state = await restore_state(session_service, APP_NAME, USER_ID, SESSION_ID, previous)
+            show_state(current_state, dashboard)
+            continue
         
-        # ===== STATUS CHECK HANDLING =====
-        # If user requested status, show current combat state
-        if 'status' in user_action.lower():
-            # Debug: Show positions
-            print(f"[DEBUG] Current state - User: {current_state.get('battleground', {}).get('user_position')}, Monster: {current_state.get('battleground', {}).get('monster_position')}")
-            
-            # Redisplay battleground
-            show_battle_ground(
-                current_state.get('battleground', {}).get('size', [8, 8]),
-                current_state.get('battleground', {}).get('rectangle_position', []),
-                current_state.get('battleground', {}).get('environment_emoji', ''),
-                current_state.get('battleground', {}).get('user_position', [0, 0]),
-                current_state.get('battleground', {}).get('monster_position', [0, 0]),
-                current_state.get('monster', {}).get('monster_emoji', '👾')
+        # Turn advice from the rules, without a model call
+        if user_action.lower() == 'hint':
+            advice = hints.hint(current_state)
+            print()
+            for line in advice['lines']:
+                print(f"💡 {line}")
+            print(f"   (computed in {advice['seconds'] * 1000:.1f} ms)\n")
+            continue
+        
+        # ===== RULES-FIRST PIPELINE =====
+        # Resolve the command with the Python rules, show the result right
+        # away, and make a single narration-only model call
+        # Monster plans still being computed are dropped, not waited for.
+        # The turn runs off the event loop, since the search AI of the
+        # harder difficulties thinks for up to a second per monster
+        ready = speculating is None or speculating.done()
+        turn = None
+        if args.rules_first:
+            turn = await asyncio.to_thread(play_turn, current_state, user_action, args.difficulty, ready)
+        if turn is not None:
+            session = await session_service.get_session(
+                user_id=USER_ID,
+                app_name=APP_NAME,
+                session_id=SESSION_ID,
+            )
+            await session_service.append_event(
+                session,
+                Event(author='user', actions=EventActions(state_delta=turn['delta'])),
             )
+            current_state = turn['state']
+            history.push(current_state)
             
-            # Display combat status (HP, spell slots, etc.)
-            display_combat_state(
-                current_state.get('user_attributes', {}),
-                current_state.get('monster', {}),
-                current_state.get('battleground', {})
+            print(f"\n{'='*70}")
+            print("\n".join(format_log(turn['log'])))
+            print(f"{'='*70}\n")
+            show_state(current_state, dashboard)
+            
+            narration = narrate(narrator_runner, USER_ID, NARRATION_SESSION_ID, session_service,
+                                narration_prompt(user_action, turn['log'], current_state), dashboard)
+            if args.async_narration or dashboard:
+                # Printed whenever it arrives; the next command can be typed meanwhile
+                task = asyncio.create_task(narration)
+                pending_narrations.add(task)
+                task.add_done_callback(pending_narrations.discard)
+            else:
+                await narration
+        else:
+            # ===== PROCESS USER ACTION =====
+            # Send action to DM agent which will:
+            # 1. Execute user's action (move/attack/cast spell)
+            # 2. Update game state
+            # 3. Execute monster turn if user ended their turn
+            # 4. Return updated state
+            response, turn_state = await call_agent(
+                runner=root_runner,
+                session_id=SESSION_ID,
+                user_id=USER_ID,
+                user_input=user_action,
+                session_service=session_service,
+                on_state_delta=dashboard.apply if dashboard else None,
             )
         
+            # The model stayed unavailable for the whole turn budget
+            if turn_state is None:
+                print("⚠️  The Dungeon Master is unavailable right now, please try again.")
+                continue
+            current_state = turn_state
+            history.push(current_state)
+            if dashboard:
+                dashboard.update(current_state)
+        
+            # Display DM's response (what happened, results, etc.)
+            print(f"\n{'='*70}")
+            print(response)
+            print(f"{'='*70}\n")
+        
+            # ===== STATUS CHECK HANDLING =====
+            # If user requested status, show current combat state
+            if 'status' in user_action.lower() and not dashboard:
+                # Debug: Show positions
+                print(f"[DEBUG] Current state - User: {current_state.get('battleground', {}).get('user_position')}, Monster: {current_state.get('battleground', {}).get('monster_position')}")
+            
+                # Redisplay battleground
+                show_battle_ground(
+                    current_state.get('battleground', {}).get('size', [8, 8]),
+                    current_state.get('battleground', {}).get('rectangle_position', []),
+                    current_state.get('battleground', {}).get('environment_emoji', ''),
+                    current_state.get('battleground', {}).get('user_position', [0, 0]),
+                    current_state.get('battleground', {}).get('monster_position', [0, 0]),
+                    current_state.get('monster', {}).get('monster_emoji', '👾'),
+                    terrain_layers=current_state.get('battleground', {}).get('terrain_layers'),
+                    other_monsters=extra_monster_markers(current_state),
+                )
+            
+                # Display combat status (HP, spell slots, etc.)
+                display_combat_state(
+                    current_state.get('user_attributes', {}),
+                    current_state.get('monster', {}),
+                    current_state.get('battleground', {}),
+                    extra_monsters(current_state),
+                )
+        
         # ===== CHECK FOR COMBAT END =====
         # Check if combat has ended (victory or defeat)
         combat_status = current_state.get('combat_status', 'ongoing')
+        if combat_status in ('user_won', 'monster_won'):
+            combat_store.record(outcome_row(
+                initial_state, current_state, 'game', combat_status.removesuffix('_won'),
+                monster_policy=args.difficulty if args.rules_first else 'dm',
+                seed=args.seed,
+            ))
         
         if combat_status == 'user_won':
             # User won - display victory message
             monster_name = current_state.get('monster', {}).get('name', 'the monster')
+            if extra_monsters(current_state):
+                monster_name += " and its allies"
             print(f"\n🎉 Congratulations! You have defeated {monster_name}!")
             print("=" * 70)
             break
@@ -281,7 +643,44 @@ async def main():
             print("\n💀 You have been defeated!")
             print("=" * 70)
             break
+    
+    if dashboard:
+        await dashboard.stop()
+        print(f"🖥️  Dashboard: {dashboard.summary()}")
+    if args.rules_first:
+        print(f"🔮 Monster plans: {speculation.summary()}")
+        if args.difficulty != 'normal':
+            print(f"🔮 Monster search: {search.summary()}")
+            search.shutdown()
+    print(f"🧠 Sessions: {session_service.summary()}")
+    print(f"⏪ History: {history.summary()}")
+    
+    # Let narration still on its way finish printing
+    if pending_narrations:
+        await asyncio.gather(*pending_narrations)
+    
+    # Retry and throttling statistics of the session's model calls
+    if model_metrics.calls:
+        print(f"📈 Model calls: {model_metrics.summary()}")
+        if hedging.enabled:
+            print(f"📈 Hedging: {hedging.summary()}")
+        print(f"📈 Connection pool: {model_clients.summary()}")
+        print("📈 Single request latency per agent:")
+        print("\n".join(format_report(request_latency.report())))
+        print("📈 Call latency per agent (as the agent waited, with hedging):")
+        print("\n".join(format_report(call_latency.report())))
+        if tiering.enabled:
+            print(f"📈 Model tiers, {tiering.summary()}:")
+            print("\n".join(format_report(tiering.latency.report())))
+    
+    # Redundant and wasted DM tool calls, costed at the DM's median model latency
+    if profiler.sessions:
+        print("🔍 DM tool calls:")
+        print("\n".join(format_profile(profiler.report(request_latency.get('dm_agent').percentile(50)))))
+    
+    combat_store.close()
+    await model_clients.aclose()
 
 if __name__ == "__main__":
     # Run the async main function
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main(parse_args()))
\ No newline at end of file
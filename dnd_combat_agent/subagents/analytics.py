@@ -0,0 +1,259 @@
+"""
+D&D Combat Agent - Combat Analytics Store
+
+Every finished combat, played (main.py) or simulated (tournament.py), is
+appended as one row to a local SQLite database: the user's class and
+policy, the monsters, the battleground, rounds played, damage dealt and
+taken, and the winner. Rows are never updated or deleted.
+
+Writes are batched. record() only buffers the row; the buffer is written
+in one transaction every BATCH_SIZE rows, on flush() and at exit. The
+database runs in WAL mode with relaxed syncing, so appending does not
+wait for the disk on every commit and queries can read while a writer
+appends.
+
+Queries aggregate with one GROUP BY scan over the table, which SQLite
+does over millions of rows in a second or two:
+
+    python -m subagents.analytics --by user_class
+    python -m subagents.analytics --by environment monster_hp_band --source tournament
+"""
+
+import argparse
+import atexit
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from .encounter import USER_ID, get_attributes, monster_ids
+
+DEFAULT_DB = Path(os.environ.get('DND_ANALYTICS_DB', Path.home() / '.dnd_combat_agent' / 'combats.db'))
+
+# Rows buffered before they are written
+BATCH_SIZE = 500
+
+# Width of the monster HP bands used in queries
+HP_BAND = 10
+
+COLUMNS = (
+    ('recorded_at', 'REAL'),
+    ('source', 'TEXT'),  # 'game' or 'tournament'
+    ('user_class', 'TEXT'),
+    ('user_policy', 'TEXT'),  # 'player' in played games
+    ('monster_policy', 'TEXT'),
+    ('environment', 'TEXT'),  # terrain type: BLOCKED, DAMAGE, ...
+    ('environment_emoji', 'TEXT'),
+    ('map_rows', 'INTEGER'),
+    ('map_cols', 'INTEGER'),
+    ('monster_name', 'TEXT'),
+    ('monster_count', 'INTEGER'),
+    ('monster_hp', 'INTEGER'),  # total starting HP of the monsters
+    ('user_hp', 'INTEGER'),  # starting HP
+    ('rounds', 'INTEGER'),
+    ('damage_dealt', 'INTEGER'),
+    ('damage_taken', 'INTEGER'),
+    ('winner', 'TEXT'),  # 'user', 'monster' or 'draw'
+    ('seed', 'INTEGER'),
+)
+COLUMN_NAMES = tuple(name for name, _ in COLUMNS)
+
+# Dimensions queries can group by: column name or SQL expression
+DIMENSIONS = {
+    'source': 'source',
+    'user_class': 'user_class',
+    'user_policy': 'user_policy',
+    'monster_policy': 'monster_policy',
+    'environment': 'environment',
+    'environment_emoji': 'environment_emoji',
+    'monster_count': 'monster_count',
+    'monster_hp_band': f"(monster_hp / {HP_BAND}) * {HP_BAND}",
+    'map_size': "map_rows || 'x' || map_cols",
+    'winner': 'winner',
+}
+
+
+def outcome_row(initial: dict, final: dict, source: str, winner: str, **extra) -> dict:
+    """
+    The store row of a finished combat, from its starting and final state.
+
+    Args:
+        winner: 'user', 'monster' or 'draw'
+        extra: other columns (user_policy, monster_policy, seed)
+    """
+    monsters = monster_ids(initial)
+    battleground = initial.get('battleground', {})
+    rows, cols = battleground.get('size', [None, None])
+    monster_hp = sum(get_attributes(initial, cid)['hp'] for cid in monsters)
+    final_hp = sum(get_attributes(final, cid)['hp'] for cid in monster_ids(final))
+    user_hp = get_attributes(initial, USER_ID)['hp']
+    row = {
+        'recorded_at': time.time(),
+        'source': source,
+        'user_class': get_attributes(initial, USER_ID).get('class'),
+        'user_policy': 'player',
+        'monster_policy': None,
+        'environment': battleground.get('environment'),
+        'environment_emoji': battleground.get('environment_emoji'),
+        'map_rows': rows,
+        'map_cols': cols,
+        'monster_name': initial.get('monster', {}).get('name'),
+        'monster_count': len(monsters),
+        'monster_hp': monster_hp,
+        'user_hp': user_hp,
+        'rounds': final.get('turn_tracker', {}).get('round'),
+        'damage_dealt': monster_hp - final_hp,
+        'damage_taken': max(0, user_hp - get_attributes(final, USER_ID)['hp']),
+        'winner': winner,
+        'seed': None,
+    }
+    row.update(extra)
+    return row
+
+
+class CombatStore:
+    """Append-only SQLite table of combat outcomes with batched writes."""
+
+    def __init__(self, path: Path | str = DEFAULT_DB, batch_size: int = BATCH_SIZE):
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.buffer: list[tuple] = []
+        self.written = 0
+        self._connection = None
+        atexit.register(self.close)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(self.path)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            columns = ', '.join(f"{name} {kind}" for name, kind in COLUMNS)
+            self._connection.execute(f"CREATE TABLE IF NOT EXISTS combats ({columns})")
+        return self._connection
+
+    def record(self, row: dict) -> None:
+        """Buffers a row (see outcome_row), writing the batch when it is full."""
+        self.buffer.append(tuple(row.get(name) for name in COLUMN_NAMES))
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def record_many(self, rows) -> None:
+        for row in rows:
+            self.record(row)
+
+    def flush(self) -> None:
+        """Writes the buffered rows in one transaction."""
+        if not self.buffer:
+            return
+        placeholders = ', '.join('?' for _ in COLUMN_NAMES)
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT INTO combats ({', '.join(COLUMN_NAMES)}) VALUES ({placeholders})", self.buffer,
+            )
+        self.written += len(self.buffer)
+        self.buffer = []
+
+    def close(self) -> None:
+        self.flush()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    # ============================================================
+    # QUERIES
+    # ============================================================
+
+    def aggregate(self, by: list[str], where: dict | None = None) -> list[dict]:
+        """
+        Win rate and averages per group.
+
+        Args:
+            by: keys of DIMENSIONS
+            where: {column: value} equality filters
+
+        Returns:
+            list[dict]: One dict per group, in dimension order: the dimension
+            values plus 'combats', 'win_rate', 'draw_rate', 'avg_rounds',
+            'avg_damage_dealt' and 'avg_damage_taken'
+        """
+        unknown = [name for name in by if name not in DIMENSIONS]
+        if unknown:
+            raise ValueError(f"Unknown dimensions {unknown}, expected some of {sorted(DIMENSIONS)}")
+        where = where or {}
+        unknown = [name for name in where if name not in COLUMN_NAMES]
+        if unknown:
+            raise ValueError(f"Unknown columns {unknown}")
+
+        self.flush()
+        groups = [f"{DIMENSIONS[name]} AS {name}" for name in by]
+        select = ', '.join(groups + [
+            "COUNT(*)",
+            "AVG(winner = 'user')",
+            "AVG(winner = 'draw')",
+            "AVG(rounds)",
+            "AVG(damage_dealt)",
+            "AVG(damage_taken)",
+        ])
+        sql = f"SELECT {select} FROM combats"
+        if where:
+            sql += " WHERE " + ' AND '.join(f"{name} = ?" for name in where)
+        if by:
+            sql += f" GROUP BY {', '.join(by)} ORDER BY {', '.join(by)}"
+
+        results = []
+        for values in self.connection.execute(sql, list(where.values())):
+            result = dict(zip(by, values))
+            result.update(zip(
+                ('combats', 'win_rate', 'draw_rate', 'avg_rounds', 'avg_damage_dealt', 'avg_damage_taken'),
+                values[len(by):],
+            ))
+            results.append(result)
+        return results
+
+    def count(self) -> int:
+        self.flush()
+        return self.connection.execute("SELECT COUNT(*) FROM combats").fetchone()[0]
+
+
+def format_aggregate(results: list[dict], by: list[str]) -> list[str]:
+    lines = [''.join(f"{name:>18}" for name in by) + f"{'combats':>10}{'win':>7}{'draw':>7}{'rounds':>8}{'dealt':>8}{'taken':>8}"]
+    for result in results:
+        lines.append(
+            ''.join(f"{str(result[name]):>18}" for name in by)
+            + f"{result['combats']:10}{result['win_rate']:7.0%}{result['draw_rate']:7.0%}"
+            + f"{result['avg_rounds'] or 0:8.1f}{result['avg_damage_dealt'] or 0:8.1f}{result['avg_damage_taken'] or 0:8.1f}"
+        )
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="D&D Combat Agent - combat analytics")
+    parser.add_argument('--db', default=str(DEFAULT_DB), help=f"Database file (default: {DEFAULT_DB})")
+    parser.add_argument(
+        '--by', nargs='*', choices=sorted(DIMENSIONS), default=['user_class'],
+        help="Dimensions to group by (default: user_class)",
+    )
+    parser.add_argument('--source', choices=('game', 'tournament'), help="Only played or simulated combats")
+    parser.add_argument('--user-class', help="Only one user class")
+    args = parser.parse_args()
+
+    where = {}
+    if args.source:
+        where['source'] = args.source
+    if args.user_class:
+        where['user_class'] = args.user_class
+    store = CombatStore(args.db)
+    started = time.perf_counter()
+    results = store.aggregate(args.by, where)
+    elapsed = time.perf_counter() - started
+    print("\n".join(format_aggregate(results, args.by)))
+    print(f"\n{sum(r['combats'] for r in results)} combats in {elapsed * 1000:.0f} ms")
+
+
+combat_store = CombatStore()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,11 @@ from google.genai import types
 from typing import Dict, Any, Optional
 import re
 
+from .encounter import monster_id, monster_ids, place_monsters
+from .grid import get_grid
+from .profiler import profiler
+from .validation import validate_battleground
+
 def before_agent_callback(callback_context: CallbackContext) -> Optional[types.Content]:
     agent_name = callback_context.agent_name
     print(f'[INFO] Agent {agent_name} is thinking...')
@@ -40,22 +45,33 @@ def _extract_first_emoji(text: str) -> str:
 def after_agent_callback(callback_context: CallbackContext) -> Optional[types.Content]:
     agent_name = callback_context.agent_name
     
-    # Special handling for Monster_generator to ensure single emoji
+    # Special handling for Monster_generator: unpack the encounter into one
+    # state key per monster and ensure each has a single emoji
     if agent_name == 'Monster_generator':
         state = callback_context.state
-        if state and 'monster' in state:
-            monster = state.get('monster', {})
-            if isinstance(monster, dict) and 'monster_emoji' in monster:
-                original_emoji = monster.get('monster_emoji', '👾')
+        if state and 'encounter' in state:
+            encounter = state.get('encounter', {})
+            monsters = encounter.get('monsters', []) if isinstance(encounter, dict) else []
+            ids = []
+            for monster in monsters:
+                if not isinstance(monster, dict):
+                    continue
+                monster_copy = dict(monster)
+                original_emoji = monster_copy.get('monster_emoji', '👾')
                 # Ensure only one emoji character
                 clean_emoji = _extract_first_emoji(original_emoji)
                 
                 if clean_emoji != original_emoji:
                     print(f'[INFO] Cleaned monster emoji: "{original_emoji}" -> "{clean_emoji}"')
-                    # Update the state with cleaned emoji
-                    monster_copy = dict(monster)
                     monster_copy['monster_emoji'] = clean_emoji
-                    state['monster'] = monster_copy
+                
+                cid = monster_id(len(ids))
+                state[cid] = monster_copy
+                ids.append(cid)
+            
+            if ids:
+                state['monster_ids'] = ids
+                print(f'[INFO] Encounter generated with {len(ids)} monster(s): {ids}')
     
     # Special handling for battleground_design_agent to ensure single environment emoji
     if agent_name == 'battleground_design_agent':
@@ -73,6 +89,27 @@ def after_agent_callback(callback_context: CallbackContext) -> Optional[types.Co
                     battleground_copy = dict(battleground)
                     battleground_copy['environment_emoji'] = clean_emoji
                     state['battleground'] = battleground_copy
+            
+            # Check bounds, terrain count, start positions and connectivity,
+            # repairing the design locally instead of asking the model again
+            battleground = state.get('battleground', {})
+            if isinstance(battleground, dict):
+                repaired, repairs = validate_battleground(battleground)
+                if repairs:
+                    for repair in repairs:
+                        print(f'[INFO] Battleground check: {repair}')
+                    state['battleground'] = repaired
+            
+            # Give every extra monster a free square next to the lead monster
+            battleground = state.get('battleground', {})
+            ids = monster_ids(state)
+            if isinstance(battleground, dict) and len(ids) > 1:
+                placed = place_monsters(battleground, ids, get_grid(battleground))
+                if placed:
+                    print(f'[INFO] Placed extra monsters: {placed}')
+                    battleground_copy = dict(battleground)
+                    battleground_copy.update(placed)
+                    state['battleground'] = battleground_copy
     
     print(f'[INFO] Agent {agent_name} has finished thinking.')
     return None
@@ -81,11 +118,13 @@ def before_tool_callback(tool: BaseTool, args: Dict[str, Any], tool_context: Too
     tool_name = tool.name
     agent_name = tool_context.agent_name
     print(f'[INFO] Agent {agent_name} is using tool {tool_name} with args {args}')
+    profiler.start(tool_name, args, tool_context)
     return None
 
 def after_tool_callback(tool: BaseTool, args: Dict[str, Any], tool_context: ToolContext, tool_response: Dict) -> Optional[Dict]:
     tool_name = tool.name
     agent_name = tool_context.agent_name
     print(f'[INFO] Agent {agent_name} has finished using tool {tool_name} with response {tool_response}')
+    profiler.finish(tool_name, tool_context, tool_response)
     return None
     
@@ -0,0 +1,147 @@
+"""
+D&D Combat Agent - Shared Model Client and Connection Pool
+
+Left alone, every Gemini model object builds its own google.genai Client,
+and with it its own HTTP connection pool. The theme, monster,
+battleground, root, DM and narrator calls then each open (and TLS
+handshake) their own connections. ResilientGemini still builds its
+genai Client the way ADK does (base URL, API version, headers, retry
+options, one client per event loop), but puts the httpx client of the
+process-wide factory here into its http_options. The factory keeps one
+pooled, keep-alive httpx client per event loop, which every agent and
+every session share. Headers and retry options stay with each genai
+Client; the httpx client only carries the connections.
+
+Every request is traced through httpcore's trace hook. The pool stats
+count new versus reused connections and measure how long a request
+waited before its headers could be sent: a pool slot, plus TCP and TLS
+setup when a new connection was needed. They also report the
+connections currently open.
+"""
+
+import asyncio
+import time
+import weakref
+
+import httpx
+
+from .latency import LatencyStats
+
+# Connections per event loop, idle connections kept alive, and for how long
+POOL_MAX_CONNECTIONS = 20
+POOL_MAX_KEEPALIVE = 10
+KEEPALIVE_SECONDS = 60.0
+
+# Sending the request headers marks the end of the wait for a connection
+HEADERS_SENT_EVENTS = ('http11.send_request_headers.started', 'http2.send_request_headers.started')
+CONNECT_EVENT = 'connection.connect_tcp.started'
+
+
+class PoolStats:
+    """Counters for pooled requests and how they got their connection."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.requests = 0
+        self.new_connections = 0
+        self.reused = 0
+        self.wait = LatencyStats()  # seconds until the request headers could be sent
+
+    def reuse_rate(self) -> float | None:
+        connected = self.new_connections + self.reused
+        return self.reused / connected if connected else None
+
+
+class ModelClientFactory:
+    """
+    Process-wide source of pooled httpx clients for the genai Clients. One
+    is kept per event loop, because an async HTTP pool cannot be shared
+    across loops.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = POOL_MAX_CONNECTIONS,
+        max_keepalive: int = POOL_MAX_KEEPALIVE,
+        keepalive_seconds: float = KEEPALIVE_SECONDS,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_seconds,
+        )
+        self.stats = PoolStats()
+        # event loop -> pooled httpx client
+        self._clients = weakref.WeakKeyDictionary()
+
+    async def _trace_request(self, request: httpx.Request) -> None:
+        """httpx request hook: attaches a trace that times the connection wait."""
+        started = time.monotonic()
+        connecting = False
+        self.stats.requests += 1
+
+        async def trace(event: str, info: dict) -> None:
+            nonlocal connecting
+            if event == CONNECT_EVENT:
+                connecting = True
+            elif event in HEADERS_SENT_EVENTS:
+                self.stats.wait.record(time.monotonic() - started)
+                if connecting:
+                    self.stats.new_connections += 1
+                else:
+                    self.stats.reused += 1
+
+        request.extensions.setdefault('trace', trace)
+
+    def http_client(self) -> httpx.AsyncClient:
+        """
+        Returns the pooled httpx client of the running event loop, creating
+        it on first use.
+
+        Raises:
+            RuntimeError: Outside an event loop; a pool built there could
+            never be reused or closed
+        """
+        loop = asyncio.get_running_loop()
+        http = self._clients.get(loop)
+        if http is None:
+            http = httpx.AsyncClient(
+                limits=self.limits,
+                event_hooks={'request': [self._trace_request]},
+            )
+            self._clients[loop] = http
+        return http
+
+    def open_connections(self) -> int:
+        """Connections currently held by the pools, idle or busy."""
+        total = 0
+        for http in list(self._clients.values()):
+            pool = getattr(getattr(http, '_transport', None), '_pool', None)
+            total += len(getattr(pool, 'connections', ()))
+        return total
+
+    async def aclose(self) -> None:
+        """Closes the pool of the running event loop."""
+        http = self._clients.pop(asyncio.get_running_loop(), None)
+        if http is not None:
+            await http.aclose()
+
+    def summary(self) -> str:
+        stats = self.stats
+        rate = stats.reuse_rate()
+        wait = stats.wait.summary()
+
+        def ms(value):
+            return f"{value * 1000:.0f}" if value is not None else '-'
+
+        return (
+            f"{stats.requests} requests, {self.open_connections()} connections open, "
+            f"{stats.new_connections} opened, {stats.reused} reused "
+            f"({f'{rate:.0%}' if rate is not None else '-'} reuse), "
+            f"connection wait p50 {ms(wait['p50'])} ms, p95 {ms(wait['p95'])} ms"
+        )
+
+
+model_clients = ModelClientFactory()
@@ -1,6 +1,5 @@
 from google.adk.agents import Agent
-from google.genai import types
-from google.adk.models.google_llm import Gemini
+from .resilience import ResilientGemini
 from .tools import (
     check_battleground_info_tool,
     check_monster_info_tool,
@@ -17,6 +16,10 @@ from .tools import (
     end_user_turn_tool,
     cast_spell_tool,
     check_spell_slots_tool,
+    advance_turn_tool,
+    check_encounter_info_tool,
+    find_targets_in_range_tool,
+    check_line_of_sight_tool,
 )
 from .callbacks import (
     before_agent_callback,
@@ -26,19 +29,11 @@ from .callbacks import (
 )
 
 
-retry_config = types.HttpRetryOptions(
-    attempts=5,
-    exp_base=7,
-    initial_delay=1,
-    http_status_codes=[429, 500, 503, 504],
-)
-
 dm_agent = Agent(
     name='dm_agent',
     description='A Dungeon Master agent that manages D&D combat using ReAct thinking.',
-    model=Gemini(
+    model=ResilientGemini(
         model='gemini-2.5-flash',
-        retry_options=retry_config,
     ),
     tools=[
         check_battleground_info_tool,
@@ -56,6 +51,10 @@ dm_agent = Agent(
         end_user_turn_tool,
         cast_spell_tool,
         check_spell_slots_tool,
+        advance_turn_tool,
+        check_encounter_info_tool,
+        find_targets_in_range_tool,
+        check_line_of_sight_tool,
     ],
     instruction="""
     You are an expert Dungeon Master (DM) for a D&D combat encounter using turn-based action economy.
@@ -82,13 +81,23 @@ dm_agent = Agent(
     **Spell Casting (Wizards Only)**:
     - Check if user is wizard: `check_user_info()` → look for 'class': 'wizard'
     - Available spells:
-      - **magic_missile**: Level 1 damage spell (action, 6-10 damage, 3 slots)
-      - **fireball**: Level 2 damage spell (action, 12-24 damage, 2 slots)
-      - **heal**: Level 1 healing spell (BONUS ACTION, 6-10 HP, 3 slots)
+      - **magic_missile**: Level 1 damage spell (action, 6-10 damage, range 24, 3 slots)
+      - **fireball**: Level 2 damage spell (action, 12-24 damage, range 30, hits every monster within 4 squares of the target, never the user, 2 slots)
+      - **heal**: Level 1 healing spell (BONUS ACTION, 6-10 HP, self, 3 slots)
+    - Damage spells need line of sight: BLOCKED terrain between caster and target stops the spell
+    - Use `check_line_of_sight(source, target)` to see whether a spell can reach a target
     - Use `check_spell_slots()` to view remaining spell slots
     - Use `cast_spell(spell_name, target)` to cast spells
     - Spell casting uses spell slots (limited resource!)
     
+    **Multiple Monsters & Initiative**:
+    - An encounter can have several monsters. Each has an id: 'monster' (the leader), 'monster_2', 'monster_3', ...
+    - Use the monster id as `source`/`target`/`character` in tools (e.g. `attack('user', 'monster_2')`)
+    - Use `check_encounter_info()` to see every monster's HP and position, the initiative order and whose turn it is
+    - Use `find_targets_in_range(source, attack_range)` to see which enemies are in reach (attack_range=1 for melee)
+    - If the user does not name a target, attack the nearest monster in range
+    - Monsters act one at a time in initiative order; defeated monsters (HP 0) are skipped
+    
     **End Turn Detection**:
     User says any of: "end turn", "done", "finish turn", "end", "pass", "that's it"
     → Call `end_user_turn()` and proceed with monster turn
@@ -108,17 +117,16 @@ dm_agent = Agent(
     4. NARRATE: Describe what happened, show remaining actions
     
     **When User Ends Turn**:
-    1. Call `end_user_turn()`
-    2. OBSERVE: Check battleground, positions, HP
-    3. THINK: Best monster strategy (move closer? attack?)
-    4. ACT: 
-       - Move monster if needed
-       - Attack if in range
-       - Apply terrain effects to both
-       - Check combat status
-    5. NARRATE: Dramatic description of monster turn
-    6. Call `reset_turn()` to start new user turn
-    7. Prompt user for their next action
+    1. Call `end_user_turn()` - it returns the id of the monster whose turn it is
+    2. For the current monster (repeat until `advance_turn()` returns 'user'):
+       - OBSERVE: Check battleground, positions, HP
+       - THINK: Best monster strategy (move closer? attack?)
+       - ACT: Move the monster if needed, attack if in range, apply terrain effects to it
+       - Call `advance_turn()` to pass to the next combatant
+    3. Apply terrain effects to the user and check combat status
+    4. NARRATE: Dramatic description of the monsters' turns
+    5. Call `reset_turn()` to start new user turn
+    6. Prompt user for their next action
     
     ## Combat Rules
     - **Movement**: Track cumulative movement per turn (speed - movement_used)
@@ -127,7 +135,8 @@ dm_agent = Agent(
     - **Terrain Types**:
       - **BLOCKED**: Impassable terrain (walls, pillars, rocks). Cannot move through these positions.
       - **DAMAGE**: Hazardous terrain (fire, lava, acid, spikes). Deals 1d4 damage at end of turn if standing on it.
-    - **Victory**: Combat ends when any HP ≤ 0
+    - **Occupied Squares**: Two combatants cannot share a square
+    - **Victory**: The user wins when every monster's HP ≤ 0; the monsters win when the user's HP ≤ 0
     
     ## Monster AI Strategy
     - If distance > 1: Move closer (up to monster speed)
@@ -0,0 +1,338 @@
+"""
+D&D Combat Agent - Encounter Helpers
+
+Supports encounters with any number of monsters while keeping the original
+single-monster state layout working unchanged.
+
+Combatant ids:
+- 'user': attributes in state['user_attributes'], position in battleground['user_position']
+- 'monster': the lead monster, state['monster'] / battleground['monster_position']
+- 'monster_2', 'monster_3', ...: extra monsters, state['monster_2'] / battleground['monster_2_position']
+
+state['monster_ids'] lists the monster ids of the encounter; when it is
+missing the encounter is the classic single 'monster'.
+"""
+
+import random
+from collections import deque
+
+from .grid import get_grid
+
+USER_ID = 'user'
+LEAD_MONSTER_ID = 'monster'
+
+# Side length of one spatial hash bucket, in grid squares
+SPATIAL_BUCKET_SIZE = 4
+
+
+def monster_id(index: int) -> str:
+    """Returns the state key of the index-th monster (0-based)."""
+    return LEAD_MONSTER_ID if index == 0 else f'monster_{index + 1}'
+
+
+def monster_ids(state) -> list[str]:
+    """Returns the ids of every monster in the encounter, dead or alive."""
+    return list(state.get('monster_ids') or [LEAD_MONSTER_ID])
+
+
+def attributes_key(combatant: str) -> str:
+    return 'user_attributes' if combatant == USER_ID else combatant
+
+
+def position_key(combatant: str) -> str:
+    return f'{combatant}_position'
+
+
+def get_attributes(state, combatant: str) -> dict:
+    return state.get(attributes_key(combatant), {})
+
+
+def get_position(state, combatant: str) -> list[int]:
+    return state.get('battleground', {}).get(position_key(combatant), [0, 0])
+
+
+def display_name(state, combatant: str) -> str:
+    if combatant == USER_ID:
+        return "You"
+    return get_attributes(state, combatant).get('name', 'Monster')
+
+
+def resolve_combatant(name: str, state) -> str | None:
+    """
+    Maps a name used by the model ('user', 'monster', 'monster_2', or a
+    monster's display name) to a combatant id.
+
+    Returns:
+        str | None: The combatant id, or None if nothing matches
+    """
+    key = name.strip().lower()
+    if 'user' in key or key in ('you', 'player'):
+        return USER_ID
+    ids = monster_ids(state)
+    normalized = key.replace(' ', '_')
+    if normalized in ids:
+        return normalized
+    for cid in ids:
+        if get_attributes(state, cid).get('name', '').lower() == key:
+            return cid
+    # Anything else that mentions a monster means the lead monster,
+    # which is how the single-monster tools always behaved
+    if 'monster' in key or len(ids) == 1:
+        return ids[0]
+    return None
+
+
+def is_alive(state, combatant: str) -> bool:
+    return get_attributes(state, combatant).get('hp', 0) > 0
+
+
+def living_monsters(state) -> list[str]:
+    return [cid for cid in monster_ids(state) if is_alive(state, cid)]
+
+
+def living_combatants(state) -> list[str]:
+    combatants = [USER_ID] if is_alive(state, USER_ID) else []
+    return combatants + living_monsters(state)
+
+
+def enemies_of(state, combatant: str) -> list[str]:
+    """Monsters fight the user; the user fights every living monster."""
+    if combatant == USER_ID:
+        return living_monsters(state)
+    return [USER_ID] if is_alive(state, USER_ID) else []
+
+
+# ============================================================
+# INITIATIVE
+# ============================================================
+
+def roll_initiative(state) -> list[str]:
+    """
+    Rolls a d20 for every combatant and returns ids in turn order.
+    Ties are broken by speed, then by a coin flip.
+
+    Returns:
+        list[str]: Combatant ids, highest initiative first
+    """
+    rolls = []
+    for cid in [USER_ID] + monster_ids(state):
+        speed = get_attributes(state, cid).get('speed', 1)
+        rolls.append((random.randint(1, 20), speed, random.random(), cid))
+    rolls.sort(reverse=True)
+    return [cid for _, _, _, cid in rolls]
+
+
+def next_in_initiative(state, current: str) -> str:
+    """
+    Returns the next living combatant after `current` in initiative order,
+    wrapping around to the start of the round.
+    """
+    order = state.get('turn_tracker', {}).get('initiative') or ([USER_ID] + monster_ids(state))
+    if current not in order:
+        return order[0]
+    start = order.index(current)
+    for step in range(1, len(order) + 1):
+        candidate = order[(start + step) % len(order)]
+        if is_alive(state, candidate):
+            return candidate
+    return current
+
+
+# ============================================================
+# SPATIAL INDEX
+# ============================================================
+
+class SpatialIndex:
+    """
+    Spatial hash of combatant positions for range and adjacency queries.
+
+    Combatants are bucketed into SPATIAL_BUCKET_SIZE squares, so a query
+    only visits the buckets that overlap its radius instead of every
+    combatant on the map.
+    """
+
+    def __init__(self, bucket_size: int = SPATIAL_BUCKET_SIZE):
+        self.bucket_size = bucket_size
+        self.buckets: dict[tuple[int, int], list[str]] = {}
+        self.positions: dict[str, tuple[int, int]] = {}
+
+    def _bucket(self, row: int, col: int) -> tuple[int, int]:
+        return row // self.bucket_size, col // self.bucket_size
+
+    def insert(self, combatant: str, position: list[int]) -> None:
+        pos = (position[0], position[1])
+        self.positions[combatant] = pos
+        self.buckets.setdefault(self._bucket(*pos), []).append(combatant)
+
+    def remove(self, combatant: str) -> None:
+        pos = self.positions.pop(combatant, None)
+        if pos is not None:
+            bucket = self.buckets.get(self._bucket(*pos), [])
+            if combatant in bucket:
+                bucket.remove(combatant)
+
+    def occupant(self, position: list[int]) -> str | None:
+        """Returns the combatant standing on a cell, if any."""
+        pos = (position[0], position[1])
+        for cid in self.buckets.get(self._bucket(*pos), []):
+            if self.positions[cid] == pos:
+                return cid
+        return None
+
+    def within(self, position: list[int], radius: int, candidates=None) -> list[tuple[int, str]]:
+        """
+        Finds combatants within a Manhattan radius of a position.
+
+        Args:
+            position: [row, col] to measure from
+            radius: maximum Manhattan distance (inclusive)
+            candidates: optional collection of ids to restrict the search to
+
+        Returns:
+            list[tuple[int, str]]: (distance, id) pairs sorted by distance
+        """
+        row, col = position
+        b0r, b0c = self._bucket(row - radius, col - radius)
+        b1r, b1c = self._bucket(row + radius, col + radius)
+        found = []
+        for br in range(b0r, b1r + 1):
+            for bc in range(b0c, b1c + 1):
+                for cid in self.buckets.get((br, bc), ()):
+                    if candidates is not None and cid not in candidates:
+                        continue
+                    r, c = self.positions[cid]
+                    distance = abs(r - row) + abs(c - col)
+                    if distance <= radius:
+                        found.append((distance, cid))
+        found.sort()
+        return found
+
+    def nearest(self, position: list[int], candidates, max_radius: int = 1000) -> tuple[int, str] | None:
+        """
+        Finds the closest combatant among `candidates`, doubling the search
+        radius until something is found.
+
+        Returns:
+            tuple[int, str] | None: (distance, id) of the nearest candidate
+        """
+        if not candidates:
+            return None
+        radius = self.bucket_size
+        while True:
+            found = self.within(position, radius, candidates)
+            if found:
+                return found[0]
+            if radius >= max_radius:
+                return None
+            radius = min(max_radius, radius * 2)
+
+
+_index_cache: dict = {}
+
+
+def get_spatial_index(state) -> SpatialIndex:
+    """
+    Returns a spatial index of all living combatants, rebuilt only when a
+    position or the set of living combatants has changed.
+    """
+    entries = tuple(
+        (cid, tuple(get_position(state, cid))) for cid in living_combatants(state)
+    )
+    index = _index_cache.get(entries)
+    if index is None:
+        index = SpatialIndex()
+        for cid, pos in entries:
+            index.insert(cid, pos)
+        _index_cache.clear()
+        _index_cache[entries] = index
+    return index
+
+
+# ============================================================
+# PLACEMENT
+# ============================================================
+
+def place_monsters(battleground: dict, ids: list[str], grid) -> dict:
+    """
+    Gives every monster without a position a free, passable cell as close
+    as possible to the lead monster (breadth-first search outward).
+
+    Args:
+        battleground: battleground dict (not modified)
+        ids: monster ids of the encounter
+        grid: BattleGrid for the battleground
+
+    Returns:
+        dict: {position_key: [row, col]} for the monsters that were placed
+    """
+    occupied = {tuple(battleground.get('user_position', [0, 0]))}
+    missing = []
+    for cid in ids:
+        pos = battleground.get(position_key(cid))
+        if pos is None:
+            missing.append(cid)
+        else:
+            occupied.add(tuple(pos))
+    if not missing:
+        return {}
+
+    start = tuple(battleground.get('monster_position', [0, 0]))
+    placed = {}
+    seen = {start}
+    queue = deque([start])
+    while queue and len(placed) < len(missing):
+        r, c = queue.popleft()
+        if (r, c) not in occupied and grid.is_passable(r, c):
+            placed[position_key(missing[len(placed)])] = [r, c]
+            occupied.add((r, c))
+        for dr, dc in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            nxt = (r + dr, c + dc)
+            if nxt not in seen and grid.in_bounds(*nxt):
+                seen.add(nxt)
+                queue.append(nxt)
+    return placed
+
+
+# ============================================================
+# PATHFINDING
+# ============================================================
+
+def path_to_enemy(state, combatant: str) -> list[tuple[int, int]]:
+    """
+    Shortest path (orthogonal steps, free squares only) from a combatant to
+    a square next to its nearest reachable enemy. Empty if already adjacent
+    or no enemy can be reached.
+    """
+    grid = get_grid(state.get('battleground', {}))
+    start = tuple(get_position(state, combatant))
+    enemies = {tuple(get_position(state, cid)) for cid in enemies_of(state, combatant)}
+    occupied = {pos for cid, pos in get_spatial_index(state).positions.items() if cid != combatant}
+    goals = {
+        (r + dr, c + dc)
+        for r, c in enemies
+        for dr, dc in ((1, 0), (-1, 0), (0, 1), (0, -1))
+    }
+    if start in goals or not enemies:
+        return []
+
+    previous = {start: None}
+    queue = deque([start])
+    while queue:
+        cell = queue.popleft()
+        if cell in goals:
+            path = []
+            while cell != start:
+                path.append(cell)
+                cell = previous[cell]
+            return path[::-1]
+        for dr, dc in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            nxt = (cell[0] + dr, cell[1] + dc)
+            if (
+                nxt not in previous
+                and grid.in_bounds(*nxt)
+                and not grid.is_blocked(*nxt)
+                and nxt not in occupied
+            ):
+                previous[nxt] = cell
+                queue.append(nxt)
+    return []
@@ -0,0 +1,298 @@
+"""
+D&D Combat Agent - Array-Backed Battleground Grid
+
+Battlegrounds are stored in session state as sparse JSON (a size plus lists
+of terrain positions). The tools need fast per-cell lookups on maps up to
+500x500, so this module turns that sparse description into a flat
+``bytearray`` once and caches it.
+
+Each cell holds two bytes of information in two parallel arrays:
+- ``flags``: rule-relevant bits (BLOCKED, DAMAGE) used by movement and terrain effects
+- ``layer``: which terrain layer painted the cell (used for rendering emoji)
+
+Battleground terrain formats understood here:
+- ``rectangle_position`` + ``environment`` + ``environment_emoji``: the primary
+  layer produced by the battleground designer (list of [row, col], or the old
+  [[r1, c1], [r2, c2]] rectangle format)
+- ``terrain_layers``: optional extra layers, each
+  {'environment', 'environment_emoji', 'positions', 'rectangles'}
+"""
+
+from collections import OrderedDict
+
+# Terrain flag bits
+BLOCKED = 1
+DAMAGE = 2
+
+ENVIRONMENT_FLAGS = {
+    'BLOCKED': BLOCKED,
+    'DAMAGE': DAMAGE,
+}
+
+# Maximum supported map dimension (rows or cols)
+MAX_GRID_SIZE = 500
+
+# Rendering window used for maps larger than the terminal can show
+VIEWPORT_SIZE = (21, 31)
+
+_CACHE_SIZE = 16
+
+
+class BattleGrid:
+    """
+    Flat array representation of a battleground.
+
+    Cells are addressed row-major: index = row * cols + col.
+    """
+
+    __slots__ = ('rows', 'cols', 'flags', 'layer', 'layers', 'key')
+
+    def __init__(self, rows: int, cols: int):
+        self.rows = rows
+        self.cols = cols
+        self.flags = bytearray(rows * cols)
+        self.layer = bytearray(rows * cols)
+        # Index 0 means "no terrain"; real layers start at 1
+        self.layers = [{'environment': '', 'environment_emoji': ''}]
+        # terrain_key of the battleground the grid was built from; stable
+        # across cache evictions, unlike id(grid)
+        self.key = None
+
+    def in_bounds(self, row: int, col: int) -> bool:
+        return 0 <= row < self.rows and 0 <= col < self.cols
+
+    def index(self, row: int, col: int) -> int:
+        return row * self.cols + col
+
+    def flags_at(self, row: int, col: int) -> int:
+        """Returns the terrain flags of a cell (0 when out of bounds)."""
+        if not self.in_bounds(row, col):
+            return 0
+        return self.flags[row * self.cols + col]
+
+    def is_blocked(self, row: int, col: int) -> bool:
+        return bool(self.flags_at(row, col) & BLOCKED)
+
+    def is_damage(self, row: int, col: int) -> bool:
+        return bool(self.flags_at(row, col) & DAMAGE)
+
+    def is_passable(self, row: int, col: int) -> bool:
+        """True when the cell is on the map and not BLOCKED."""
+        return self.in_bounds(row, col) and not self.flags[row * self.cols + col] & BLOCKED
+
+    def layer_at(self, row: int, col: int) -> dict | None:
+        """Returns the terrain layer painted on a cell, or None for normal ground."""
+        if not self.in_bounds(row, col):
+            return None
+        layer_id = self.layer[row * self.cols + col]
+        return self.layers[layer_id] if layer_id else None
+
+    def add_layer(self, environment: str, environment_emoji: str, cells) -> None:
+        """
+        Paints a terrain layer onto the grid. Later layers draw over earlier
+        ones for rendering, but flags accumulate.
+
+        Args:
+            environment: 'BLOCKED', 'DAMAGE' or any descriptive name
+            environment_emoji: emoji used when rendering the layer
+            cells: iterable of (row, col); out-of-bounds cells are ignored
+        """
+        self.layers.append({'environment': environment, 'environment_emoji': environment_emoji})
+        layer_id = len(self.layers) - 1
+        flag = ENVIRONMENT_FLAGS.get(environment, 0)
+        rows, cols = self.rows, self.cols
+        for r, c in cells:
+            if 0 <= r < rows and 0 <= c < cols:
+                i = r * cols + c
+                self.flags[i] |= flag
+                self.layer[i] = layer_id
+
+
+def _is_rectangle_format(positions: list) -> bool:
+    """
+    Detects the old [[r1, c1], [r2, c2]] rectangle format (top-left, bottom-right).
+    """
+    return (
+        len(positions) == 2
+        and isinstance(positions[0], list) and len(positions[0]) == 2
+        and isinstance(positions[1], list) and len(positions[1]) == 2
+        and positions[1][0] >= positions[0][0]
+        and positions[1][1] >= positions[0][1]
+    )
+
+
+def _rectangle_cells(top_left: list[int], bottom_right: list[int]):
+    for r in range(top_left[0], bottom_right[0] + 1):
+        for c in range(top_left[1], bottom_right[1] + 1):
+            yield r, c
+
+
+def _position_cells(positions: list):
+    for pos in positions:
+        if isinstance(pos, (list, tuple)) and len(pos) == 2:
+            yield pos[0], pos[1]
+
+
+def primary_terrain_cells(battleground: dict):
+    """
+    Yields (row, col) for every cell of the primary terrain layer,
+    expanding the old rectangle format if present.
+    """
+    positions = battleground.get('rectangle_position', []) or []
+    if _is_rectangle_format(positions):
+        yield from _rectangle_cells(positions[0], positions[1])
+    else:
+        yield from _position_cells(positions)
+
+
+def _layer_cells(layer: dict):
+    yield from _position_cells(layer.get('positions', []) or [])
+    for rect in layer.get('rectangles', []) or []:
+        if len(rect) == 2:
+            yield from _rectangle_cells(rect[0], rect[1])
+
+
+def build_grid(battleground: dict) -> BattleGrid:
+    """
+    Builds a BattleGrid from a battleground dict. Cost is proportional to the
+    number of terrain cells plus one allocation of rows * cols bytes.
+    """
+    rows, cols = battleground.get('size', [5, 5])
+    grid = BattleGrid(rows, cols)
+    grid.add_layer(
+        battleground.get('environment', ''),
+        battleground.get('environment_emoji', ''),
+        primary_terrain_cells(battleground),
+    )
+    for layer in battleground.get('terrain_layers', []) or []:
+        grid.add_layer(
+            layer.get('environment', ''),
+            layer.get('environment_emoji', ''),
+            _layer_cells(layer),
+        )
+    grid.key = terrain_key(battleground)
+    return grid
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+def terrain_key(battleground: dict) -> tuple:
+    """
+    Hashable key describing everything that shapes the grid (size and terrain).
+    Character positions are not part of the key.
+    """
+    return (
+        _freeze(battleground.get('size', [5, 5])),
+        battleground.get('environment', ''),
+        battleground.get('environment_emoji', ''),
+        _freeze(battleground.get('rectangle_position', []) or []),
+        _freeze(battleground.get('terrain_layers', []) or []),
+    )
+
+
+_grid_cache: OrderedDict = OrderedDict()
+_identity_cache: dict = {}
+
+
+def get_grid(battleground: dict) -> BattleGrid:
+    """
+    Returns the cached BattleGrid for a battleground.
+
+    Tools replace the battleground dict on every move (shallow copy), but the
+    terrain lists are shared between copies, so the first lookup is by
+    identity of those lists and only falls back to hashing the terrain.
+    Terrain lists are never mutated in place, which keeps this safe.
+    """
+    positions = battleground.get('rectangle_position')
+    layers = battleground.get('terrain_layers')
+    size = battleground.get('size', [5, 5])
+    identity = (
+        id(positions), id(layers), tuple(size),
+        battleground.get('environment', ''), battleground.get('environment_emoji', ''),
+    )
+    hit = _identity_cache.get(identity)
+    if hit is not None and hit[0] is positions and hit[1] is layers:
+        return hit[2]
+
+    key = terrain_key(battleground)
+    grid = _grid_cache.get(key)
+    if grid is None:
+        grid = build_grid(battleground)
+        _grid_cache[key] = grid
+        if len(_grid_cache) > _CACHE_SIZE:
+            _grid_cache.popitem(last=False)
+    else:
+        _grid_cache.move_to_end(key)
+
+    if len(_identity_cache) >= _CACHE_SIZE:
+        _identity_cache.clear()
+    _identity_cache[identity] = (positions, layers, grid)
+    return grid
+
+
+def viewport_bounds(size: list[int], center: list[int], viewport=VIEWPORT_SIZE) -> tuple[int, int, int, int]:
+    """
+    Computes the visible window of a map, centred on a position and clamped
+    to the map edges.
+
+    Returns:
+        tuple: (row_start, row_end, col_start, col_end), end exclusive
+    """
+    rows, cols = size
+    view_rows = min(rows, viewport[0])
+    view_cols = min(cols, viewport[1])
+    row_start = min(max(0, center[0] - view_rows // 2), rows - view_rows)
+    col_start = min(max(0, center[1] - view_cols // 2), cols - view_cols)
+    return row_start, row_start + view_rows, col_start, col_start + view_cols
+
+
+def render_viewport(grid: BattleGrid, center: list[int], markers: dict, viewport=VIEWPORT_SIZE) -> list[str]:
+    """
+    Renders the part of the grid around `center` as terminal lines.
+    Cost depends only on the viewport size, not the map size.
+
+    Args:
+        grid: BattleGrid to render
+        center: [row, col] to keep in the middle of the view (usually the player)
+        markers: {(row, col): emoji} drawn over terrain, e.g. characters
+        viewport: (rows, cols) of the visible window
+
+    Returns:
+        list[str]: lines ready to print
+    """
+    r0, r1, c0, c1 = viewport_bounds([grid.rows, grid.cols], center, viewport)
+    label_width = len(str(r1 - 1))
+
+    lines = []
+    if (r1 - r0, c1 - c0) != (grid.rows, grid.cols):
+        lines.append(f" Rows {r0}-{r1 - 1}, Cols {c0}-{c1 - 1} of {grid.rows}x{grid.cols}")
+    # Only one digit fits above a 2-char cell, so wide maps show the last digit
+    if c1 > 10:
+        header_nums = " ".join(str(c % 10) for c in range(c0, c1))
+    else:
+        header_nums = " ".join(str(c) for c in range(c0, c1))
+    lines.append(" " * (label_width + 2) + header_nums)
+    lines.append(" " * (label_width + 1) + "+" + "--" * (c1 - c0) + "+")
+
+    layer_ids = grid.layer
+    layers = grid.layers
+    cols = grid.cols
+    for r in range(r0, r1):
+        row_cells = []
+        base = r * cols
+        for c in range(c0, c1):
+            marker = markers.get((r, c))
+            if marker is not None:
+                row_cells.append(marker)
+                continue
+            layer_id = layer_ids[base + c]
+            row_cells.append(layers[layer_id]['environment_emoji'] if layer_id else ' .')
+        lines.append(f" {str(r).rjust(label_width)}|{''.join(row_cells)}|")
+    lines.append(" " * (label_width + 1) + "+" + "--" * (c1 - c0) + "+")
+    return lines
@@ -0,0 +1,413 @@
+"""
+D&D Combat Agent - Turn Hints
+
+The `hint` command recommends the best plan for the rest of the player's
+turn: where to move, whether to attack, cast fireball or magic missile,
+and whether to heal with the bonus action. Each plan comes with the
+expected damage dealt, the chance to defeat the target and the chance
+to survive the monsters' next round.
+
+Hints must come back in a few milliseconds, with no model call:
+
+- Distance fields (breadth-first search from a square over free squares)
+  are cached per terrain, start square and occupied squares. The player's
+  field gives every reachable square and its path; each monster's field
+  gives the squares it can reach to attack the player next round. Fields
+  stay valid while only the player moves, so repeated hints in a turn
+  reuse the monsters' fields.
+- Dice distributions (one attack's damage including a miss, the total
+  damage of a group of monsters, healing, the terrain hazard) are
+  computed once per set of dice and kept.
+
+Plans are ranked like the lookahead policy in policies.py: expected
+damage dealt, minus RISK_WEIGHT times the expected damage taken, with
+ties going to the square closer to the nearest monster.
+"""
+
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache
+
+from .encounter import (
+    USER_ID,
+    display_name,
+    enemies_of,
+    get_attributes,
+    get_position,
+    get_spatial_index,
+)
+from .grid import get_grid
+from .policies import ORTHOGONAL_STEPS, RISK_WEIGHT, hit_chance
+from .rules import SPELL_DATA
+from .visibility import get_visibility, in_area
+
+# Distance fields kept
+FIELD_CACHE_SIZE = 256
+
+# The 1d4 terrain hazard
+TERRAIN_DAMAGE = (1, 4)
+
+# Gain in survival odds that makes a heal worth a spell slot above half HP
+HEAL_GAIN = 0.05
+
+# Plans shown after the recommendation
+ALTERNATIVES = 2
+
+
+# ============================================================
+# DISTANCE FIELDS
+# ============================================================
+
+class FieldCache:
+    """LRU cache of distance fields, with hit metrics."""
+
+    def __init__(self, size: int = FIELD_CACHE_SIZE):
+        self.size = size
+        self.fields: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def field(self, grid, start: tuple, occupied: frozenset) -> dict:
+        """
+        Breadth-first search from `start` over free squares.
+
+        Returns:
+            dict: {(row, col): (steps, previous square)}
+        """
+        key = (grid.key, start, occupied)
+        field = self.fields.get(key)
+        if field is not None:
+            self.hits += 1
+            self.fields.move_to_end(key)
+            return field
+        self.misses += 1
+        field = {start: (0, None)}
+        queue = deque([start])
+        while queue:
+            cell = queue.popleft()
+            steps = field[cell][0] + 1
+            for dr, dc in ORTHOGONAL_STEPS:
+                nxt = (cell[0] + dr, cell[1] + dc)
+                if (
+                    nxt not in field
+                    and grid.in_bounds(*nxt)
+                    and not grid.is_blocked(*nxt)
+                    and nxt not in occupied
+                ):
+                    field[nxt] = (steps, cell)
+                    queue.append(nxt)
+        self.fields[key] = field
+        if len(self.fields) > self.size:
+            self.fields.popitem(last=False)
+        return field
+
+    def summary(self) -> str:
+        return f"{len(self.fields)} fields, {self.hits} hits, {self.misses} misses"
+
+
+fields = FieldCache()
+
+
+def path_from(field: dict, cell: tuple) -> list:
+    """Squares from the step after the start to `cell`."""
+    path = []
+    while field[cell][1] is not None:
+        path.append(cell)
+        cell = field[cell][1]
+    return path[::-1]
+
+
+# ============================================================
+# DICE DISTRIBUTIONS
+# ============================================================
+
+@lru_cache(maxsize=None)
+def uniform(low: int, high: int) -> tuple:
+    """((value, probability), ...) of a uniform roll from low to high."""
+    return tuple((value, 1 / (high - low + 1)) for value in range(low, high + 1))
+
+
+@lru_cache(maxsize=None)
+def attack_distribution(chance: float, low: int, high: int) -> tuple:
+    """Damage of one attack, 0 on a miss."""
+    outcomes = {0: 1 - chance}
+    for value, p in uniform(low, high):
+        outcomes[value] = outcomes.get(value, 0.0) + chance * p
+    return tuple(sorted(outcomes.items()))
+
+
+def _convolve(a: tuple, b: tuple) -> tuple:
+    outcomes = {}
+    for x, p in a:
+        for y, q in b:
+            outcomes[x + y] = outcomes.get(x + y, 0.0) + p * q
+    return tuple(sorted(outcomes.items()))
+
+
+@lru_cache(maxsize=4096)
+def total_damage(attacks: tuple, terrain: bool) -> tuple:
+    """
+    Total damage of a round: every attack, given as a sorted tuple of
+    (hit chance, low, high), plus the terrain hazard where the target stands.
+    """
+    total = ((0, 1.0),)
+    for attack in attacks:
+        total = _convolve(total, attack_distribution(*attack))
+    if terrain:
+        total = _convolve(total, uniform(*TERRAIN_DAMAGE))
+    return total
+
+
+def survival(distribution: tuple, hp: int) -> float:
+    """Chance that the damage of a distribution leaves hp above 0."""
+    return sum(p for damage, p in distribution if damage < hp)
+
+
+def mean(distribution: tuple) -> float:
+    return sum(value * p for value, p in distribution)
+
+
+# ============================================================
+# PLANS
+# ============================================================
+
+def _threats(state, cell: tuple, monsters: list, occupied: frozenset) -> list:
+    """Monsters that can reach a square next to `cell` next round."""
+    grid = get_grid(state.get('battleground', {}))
+    threats = []
+    for cid in monsters:
+        start = tuple(get_position(state, cid))
+        field = fields.field(grid, start, occupied - {start})
+        speed = get_attributes(state, cid)['speed']
+        for dr, dc in ORTHOGONAL_STEPS:
+            reached = field.get((cell[0] + dr, cell[1] + dc))
+            if reached is not None and reached[0] <= speed:
+                threats.append(cid)
+                break
+    return threats
+
+
+def _attacks(state, monsters: list) -> tuple:
+    ac = get_attributes(state, USER_ID)['ac']
+    return tuple(sorted(
+        (hit_chance(ac), *get_attributes(state, cid)['damage']) for cid in monsters
+    ))
+
+
+def _actions(state, cell: tuple, visibility) -> list[dict]:
+    """
+    Every useful action from a square, with the damage distribution per
+    target: [{'action', 'target', 'damage': {monster id: ((damage, p), ...)}}]
+    """
+    user = state['user_attributes']
+    actions = []
+    for cid in enemies_of(state, USER_ID):
+        if abs(cell[0] - get_position(state, cid)[0]) + abs(cell[1] - get_position(state, cid)[1]) == 1:
+            chance = hit_chance(get_attributes(state, cid)['ac'])
+            actions.append({
+                'action': 'attack', 'target': cid,
+                'damage': {cid: attack_distribution(chance, *user['damage'])},
+            })
+
+    if user.get('class') != 'wizard':
+        return actions
+    slots = user.get('spell_slots', {})
+    grid = get_grid(state.get('battleground', {}))
+    for spell_name in ('fireball', 'magic_missile'):
+        spell = SPELL_DATA[spell_name]
+        if spell_name not in user.get('spells_known', []) or slots.get(f"level_{spell['level']}", 0) <= 0:
+            continue
+        for cid in enemies_of(state, USER_ID):
+            target = get_position(state, cid)
+            if abs(cell[0] - target[0]) + abs(cell[1] - target[1]) > spell['range']:
+                continue
+            if not visibility.visible(list(cell), target):
+                continue
+            hit = [cid]
+            if 'area' in spell:
+                shape, radius = spell['area']['shape'], spell['area']['radius']
+                hit = [m for m in enemies_of(state, USER_ID)
+                       if in_area(grid, target, shape, radius, get_position(state, m))]
+            # Spells always hit; one roll is shared by everyone in the blast
+            actions.append({
+                'action': spell_name, 'target': cid,
+                'damage': {m: uniform(*spell['damage']) for m in hit}, 'shared': True,
+            })
+    return actions
+
+
+def _survival(state, taken: tuple, heal: bool) -> float:
+    """Survival odds against a damage distribution, after an optional heal."""
+    user = state['user_attributes']
+    if not heal:
+        return survival(taken, user['hp'])
+    max_hp = user.get('max_hp', user['hp'])
+    return sum(
+        p * survival(taken, min(max_hp, user['hp'] + value))
+        for value, p in uniform(*SPELL_DATA['heal']['healing'])
+    )
+
+
+def _outcome(state, action: dict | None, threats: list, terrain: bool, heal: bool) -> dict:
+    """
+    Expected damage dealt, chance to defeat the target, expected damage
+    taken and survival odds of one action (and heal) from a square.
+    """
+    if action is None:
+        taken = total_damage(_attacks(state, threats), terrain)
+        return {'dealt': 0.0, 'kill': 0.0, 'taken': mean(taken), 'survival': _survival(state, taken, heal)}
+
+    hps = {cid: get_attributes(state, cid)['hp'] for cid in action['damage']}
+    if action.get('shared'):
+        # One roll: enumerate it, and the monsters it defeats
+        rolls = next(iter(action['damage'].values()))
+        outcomes = [(p, {cid: min(value, hp) for cid, hp in hps.items()}) for value, p in rolls]
+    else:
+        ((cid, rolls),) = action['damage'].items()
+        outcomes = [(p, {cid: min(value, hps[cid])}) for value, p in rolls]
+
+    dealt = kill = taken_mean = alive = 0.0
+    for p, damage in outcomes:
+        defeated = {cid for cid, value in damage.items() if value >= hps[cid]}
+        taken = total_damage(_attacks(state, [cid for cid in threats if cid not in defeated]), terrain)
+        dealt += p * sum(damage.values())
+        kill += p * (action['target'] in defeated)
+        taken_mean += p * mean(taken)
+        alive += p * _survival(state, taken, heal)
+    return {'dealt': dealt, 'kill': kill, 'taken': taken_mean, 'survival': alive}
+
+
+def _can_heal(state, action: dict | None) -> bool:
+    """Whether the bonus-action heal is castable after the action."""
+    user = state['user_attributes']
+    slots = user.get('spell_slots', {}).get('level_1', 0)
+    if action is not None and SPELL_DATA.get(action['action'], {}).get('level') == 1:
+        slots -= 1
+    return (
+        user.get('class') == 'wizard'
+        and 'heal' in user.get('spells_known', ['heal'])
+        and not state.get('turn_tracker', {}).get('bonus_action_used', False)
+        and slots > 0
+        and user['hp'] < user.get('max_hp', user['hp'])
+    )
+
+
+def best_plans(state) -> list[dict]:
+    """
+    Every plan for the rest of the player's turn, best first.
+
+    Returns:
+        list[dict]: [{'path', 'destination', 'action', 'target', 'heal',
+        'dealt', 'kill', 'taken', 'survival', 'score'}]
+    """
+    user = state['user_attributes']
+    tracker = state.get('turn_tracker', {})
+    grid = get_grid(state.get('battleground', {}))
+    visibility = get_visibility(grid)
+    start = tuple(get_position(state, USER_ID))
+    positions = get_spatial_index(state).positions
+    occupied = frozenset(tuple(pos) for cid, pos in positions.items() if cid != USER_ID)
+    # Monsters route around each other, not around where the player was
+    monster_occupied = frozenset(tuple(pos) for pos in positions.values() if tuple(pos) != start)
+    monsters = enemies_of(state, USER_ID)
+    monster_positions = [get_position(state, cid) for cid in monsters]
+
+    budget = user['speed'] - tracker.get('movement_used', 0)
+    field = fields.field(grid, start, occupied)
+    plans = []
+    for cell, (steps, _) in field.items():
+        if steps > budget:
+            continue
+        # Between equal plans, prefer the square closer to the fight
+        nearest = min((abs(cell[0] - m[0]) + abs(cell[1] - m[1]) for m in monster_positions), default=0)
+        threats = _threats(state, cell, monsters, monster_occupied | {cell})
+        terrain = grid.is_damage(*cell)
+        actions = [] if tracker.get('action_used', False) else _actions(state, cell, visibility)
+        for action in actions + [None]:
+            plan = _outcome(state, action, threats, terrain, heal=False)
+            heal = False
+            if _can_heal(state, action):
+                healed = _outcome(state, action, threats, terrain, heal=True)
+                # Worth a slot below half HP, or when it clearly improves survival
+                if user['hp'] <= user.get('max_hp', user['hp']) / 2 or healed['survival'] - plan['survival'] >= HEAL_GAIN:
+                    plan, heal = healed, True
+            plan.update(
+                path=path_from(field, cell),
+                destination=cell,
+                action=action['action'] if action else None,
+                target=action['target'] if action else None,
+                heal=heal,
+            )
+            plan['score'] = plan['dealt'] - RISK_WEIGHT * plan['taken'] - 0.01 * nearest
+            plans.append(plan)
+    # Between equal plans, fewer steps
+    plans.sort(key=lambda plan: (-plan['score'], -plan['survival'], len(plan['path'])))
+    return plans
+
+
+# ============================================================
+# HINT
+# ============================================================
+
+def _moves(path: list, start: tuple) -> list[str]:
+    """Move commands for a path, one per straight run."""
+    commands = []
+    current = start
+    for cell in path:
+        direction = ORTHOGONAL_STEPS[(cell[0] - current[0], cell[1] - current[1])]
+        if commands and commands[-1][0] == direction:
+            commands[-1][1] += 1
+        else:
+            commands.append([direction, 1])
+        current = cell
+    return [f"move {d} {n}" if n > 1 else f"move {d}" for d, n in commands]
+
+
+def describe(state, plan: dict) -> str:
+    steps = _moves(plan['path'], tuple(get_position(state, USER_ID)))
+    if plan['action'] == 'attack':
+        steps.append(f"attack {plan['target']}")
+    elif plan['action']:
+        steps.append(f"cast {plan['action']} at {plan['target']}")
+    if plan['heal']:
+        steps.append("cast heal")
+    steps.append("end turn")
+    text = ", ".join(steps)
+    if plan['action']:
+        text += (
+            f" ({plan['dealt']:.1f} expected damage, "
+            f"{plan['kill']:.0%} to defeat {display_name(state, plan['target'])}"
+        )
+    else:
+        text += " (no attack"
+    return text + f"; {plan['survival']:.0%} to survive the next round)"
+
+
+def hint(state) -> dict:
+    """
+    The recommended plan and the next best ones.
+
+    Returns:
+        dict: {'lines', 'plans', 'seconds'}
+    """
+    started = time.perf_counter()
+    tracker = state.get('turn_tracker', {})
+    if state.get('combat_status', 'ongoing') != 'ongoing':
+        lines = ["The fight is over."]
+        plans = []
+    elif tracker.get('current_turn', USER_ID) != USER_ID:
+        lines = ["It is not your turn."]
+        plans = []
+    else:
+        plans = best_plans(state)
+        lines = [f"Best: {describe(state, plans[0])}"]
+        # Alternatives are other actions, not the same action from another square
+        seen = {(plans[0]['action'], plans[0]['target'], plans[0]['heal'])}
+        for plan in plans[1:]:
+            if len(lines) > ALTERNATIVES:
+                break
+            choice = (plan['action'], plan['target'], plan['heal'])
+            if choice not in seen:
+                seen.add(choice)
+                lines.append(f"Or:   {describe(state, plan)}")
+    return {'lines': lines, 'plans': plans, 'seconds': time.perf_counter() - started}
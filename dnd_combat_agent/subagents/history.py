@@ -0,0 +1,91 @@
+"""
+D&D Combat Agent - Undo and Rewind History
+
+Keeps the combat state after every player command, so a misread command
+(a move in the wrong direction, a turn ended early) can be taken back
+with `undo` or `rewind N` without calling the model again.
+
+Steps share structure. A step is a new top-level dict, but every value
+equal to the one in the previous step is the previous step's object,
+one level down as well: moving a combatant stores a new battleground
+dict whose terrain list is still the one from the step before. A step
+therefore costs a top-level dict plus the sub-objects that actually
+changed, and hundreds of steps stay small. Rewinding moves a pointer
+back to a stored step; nothing is recomputed.
+
+Stored objects are never modified. The tools replace sub-dicts rather
+than writing into them (copy-on-write), and callers get a fresh
+top-level dict on rewind, so the history cannot be changed from outside.
+"""
+
+from collections import deque
+
+# Steps kept; the oldest are dropped first
+MAX_HISTORY = 500
+
+
+class StateHistory:
+    """Bounded list of structurally shared state steps with a cursor."""
+
+    def __init__(self, size: int = MAX_HISTORY):
+        self.steps: deque = deque(maxlen=size)
+        self.cursor = -1  # index of the current step
+        self.shared = 0  # values reused from the previous step
+        self.stored = 0  # values stored new
+
+    def _share(self, value, previous):
+        """`previous` when equal to `value`; for dicts, shares field by field."""
+        if previous is None:
+            self.stored += 1
+            return value
+        if value == previous:
+            self.shared += 1
+            return previous
+        self.stored += 1
+        if isinstance(value, dict) and isinstance(previous, dict):
+            return {
+                key: previous[key] if key in previous and previous[key] == item else item
+                for key, item in value.items()
+            }
+        return value
+
+    def push(self, state: dict) -> bool:
+        """
+        Records the state after a command, dropping any steps that were
+        rewound past. Does nothing when the state did not change.
+
+        Returns:
+            bool: Whether a step was added
+        """
+        last = self.steps[self.cursor] if self.steps else {}
+        if state == last:
+            return False
+        step = {key: self._share(value, last.get(key)) for key, value in state.items()}
+        # A new command after a rewind starts a new branch
+        while len(self.steps) > self.cursor + 1:
+            self.steps.pop()
+        self.steps.append(step)
+        self.cursor = len(self.steps) - 1
+        return True
+
+    def available(self) -> int:
+        """Steps that can be rewound."""
+        return max(0, self.cursor)
+
+    def rewind(self, steps: int = 1) -> dict | None:
+        """
+        Moves back `steps` steps (at most to the oldest one kept).
+
+        Returns:
+            dict | None: A fresh top-level copy of that state, or None when
+            there is nothing to rewind
+        """
+        if steps <= 0 or self.cursor <= 0:
+            return None
+        self.cursor = max(0, self.cursor - steps)
+        return dict(self.steps[self.cursor])
+
+    def summary(self) -> str:
+        total = self.shared + self.stored
+        share = f"{self.shared / total:.0%}" if total else '-'
+        return f"{len(self.steps)} steps, {share} of values shared with the step before"
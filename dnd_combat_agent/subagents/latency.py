@@ -0,0 +1,74 @@
+"""
+D&D Combat Agent - Latency Statistics
+
+Rolling latency windows keyed by agent (or any other label), with
+p50/p95/p99 percentiles. Used by the model layer to decide when to hedge
+a slow request and to report how the latency tail changes.
+"""
+
+from collections import deque
+
+# Number of recent samples kept per key
+LATENCY_WINDOW = 200
+
+
+class LatencyStats:
+    """Rolling window of latency samples, in seconds."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.total = 0  # all-time number of samples
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self.total += 1
+
+    def percentile(self, p: float) -> float | None:
+        """Nearest-rank percentile of the window, or None when empty."""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        rank = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered)) - 1))
+        return ordered[rank]
+
+    def summary(self) -> dict:
+        return {
+            'count': self.total,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+        }
+
+
+class LatencyRegistry:
+    """LatencyStats per key, created on first use."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self.stats: dict[str, LatencyStats] = {}
+
+    def get(self, key: str) -> LatencyStats:
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = LatencyStats(self.window)
+        return stats
+
+    def record(self, key: str, seconds: float) -> None:
+        self.get(key).record(seconds)
+
+    def report(self) -> dict:
+        return {key: stats.summary() for key, stats in sorted(self.stats.items())}
+
+    def reset(self) -> None:
+        self.stats.clear()
+
+
+def format_report(report: dict) -> list[str]:
+    """Formats a LatencyRegistry report as aligned text lines (milliseconds)."""
+    def ms(value):
+        return f"{value * 1000:8.0f}" if value is not None else f"{'-':>8}"
+
+    lines = [f"{'':24}{'count':>7}{'p50 ms':>8}{'p95 ms':>8}{'p99 ms':>8}"]
+    for key, summary in report.items():
+        lines.append(f"{key:24}{summary['count']:7}{ms(summary['p50'])}{ms(summary['p95'])}{ms(summary['p99'])}")
+    return lines
@@ -0,0 +1,14 @@
+"""
+D&D Combat Agent - Session Memory Limits
+
+Defaults of the bounded session service (memory.py). They live apart
+from it so main.py can show them in its help without importing the
+agent framework before the class menu.
+"""
+
+# Events kept per session
+MAX_EVENTS_PER_SESSION = 200
+
+# Sessions kept in memory, and how long an untouched session stays resident
+MAX_RESIDENT_SESSIONS = 100
+IDLE_SECONDS = 600.0
@@ -0,0 +1,235 @@
+"""
+D&D Combat Agent - Bounded Session Memory
+
+InMemorySessionService keeps every event of every session for the life of
+the process, and every tool write adds an event carrying a fresh copy of
+a whole state sub-dict. BoundedSessionService keeps a long-running
+process hosting many players within a fixed budget:
+
+- Event retention: each session keeps only its last `max_events` events.
+  The cut is moved forward to the start of a player turn, so a tool call
+  is never separated from its response. The state itself lives in
+  `session.state` and is not affected.
+- Hibernation: at most `max_resident` sessions stay in memory. The least
+  recently used one, and any session idle for longer than `idle_seconds`,
+  is written to a local directory and dropped from memory. The next
+  get_session or append_event on it loads it back transparently. The
+  state is stored as a binary snapshot (snapshot.py), the events as
+  compressed JSON.
+
+`stats()` reports resident and hibernated sessions, their bytes, and the
+number of trims, hibernations and restores.
+"""
+
+import json
+import os
+import struct
+import tempfile
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Optional
+
+from google.adk.events import Event
+from google.adk.sessions import InMemorySessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+
+from . import snapshot
+from .limits import IDLE_SECONDS, MAX_EVENTS_PER_SESSION, MAX_RESIDENT_SESSIONS
+
+HIBERNATION_DIR = os.path.join(tempfile.gettempdir(), 'dnd_combat_agent_sessions')
+
+# A hibernated session: the snapshot's length, the state snapshot, then
+# the rest of the session
+SNAPSHOT_LENGTH = struct.Struct('<I')
+
+
+def retention_cut(events: list, max_events: int) -> int:
+    """
+    Index of the first event to keep so that at most max_events remain,
+    moved forward to the next event authored by the user (the start of a
+    turn). Returns 0 when nothing can be dropped.
+    """
+    if len(events) <= max_events:
+        return 0
+    for index in range(len(events) - max_events, len(events)):
+        if events[index].author == 'user':
+            return index
+    # A single turn longer than the limit is kept whole
+    return 0
+
+
+class BoundedSessionService(InMemorySessionService):
+    """InMemorySessionService with event retention and LRU hibernation to disk."""
+
+    def __init__(
+        self,
+        max_events: int = MAX_EVENTS_PER_SESSION,
+        max_resident: int = MAX_RESIDENT_SESSIONS,
+        idle_seconds: float = IDLE_SECONDS,
+        store_dir: str = HIBERNATION_DIR,
+    ):
+        super().__init__()
+        self.max_events = max_events
+        self.max_resident = max_resident
+        self.idle_seconds = idle_seconds
+        self.store_dir = store_dir
+        # (app, user, session id) -> last access, least recent first
+        self.resident: OrderedDict = OrderedDict()
+        # (app, user, session id) -> path of the hibernated session
+        self.hibernated: dict[tuple, str] = {}
+        self.events_trimmed = 0
+        self.hibernations = 0
+        self.restores = 0
+
+    # ---------- serialisation ----------
+
+    def dump(self, session: Session) -> bytes:
+        """The state as a binary snapshot, the rest (events) as compressed JSON."""
+        state = snapshot.encode(session.state)
+        rest = zlib.compress(session.model_dump_json(exclude={'state'}).encode('utf-8'))
+        return SNAPSHOT_LENGTH.pack(len(state)) + state + rest
+
+    def load(self, data: bytes) -> Session:
+        (length,) = SNAPSHOT_LENGTH.unpack_from(data)
+        start = SNAPSHOT_LENGTH.size
+        fields = json.loads(zlib.decompress(data[start + length:]))
+        fields['state'] = snapshot.decode(data[start:start + length])
+        return Session.model_validate(fields)
+
+    def _path(self, key: tuple) -> str:
+        app_name, user_id, session_id = key
+        return os.path.join(self.store_dir, app_name, user_id, f'{session_id}.session')
+
+    # ---------- residency ----------
+
+    def _hibernate(self, key: tuple) -> None:
+        app_name, user_id, session_id = key
+        session = self.sessions[app_name][user_id].pop(session_id)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(self.dump(session))
+        self.hibernated[key] = path
+        self.resident.pop(key, None)
+        self.hibernations += 1
+
+    def _restore(self, key: tuple) -> None:
+        path = self.hibernated.pop(key)
+        with open(path, 'rb') as f:
+            session = self.load(f.read())
+        os.remove(path)
+        app_name, user_id, session_id = key
+        self.sessions.setdefault(app_name, {}).setdefault(user_id, {})[session_id] = session
+        self.restores += 1
+
+    def _touch(self, app_name: str, user_id: str, session_id: str) -> None:
+        """Marks a session as used, restoring it first if it is hibernated."""
+        key = (app_name, user_id, session_id.strip() if session_id else session_id)
+        if key in self.hibernated:
+            self._restore(key)
+        if key[2] not in self.sessions.get(app_name, {}).get(user_id, {}):
+            return
+        now = time.monotonic()
+        self.resident[key] = now
+        self.resident.move_to_end(key)
+
+        # Oldest first: hibernate while over the limit or idle too long
+        while len(self.resident) > 1:
+            oldest, last_used = next(iter(self.resident.items()))
+            if len(self.resident) <= self.max_resident and now - last_used <= self.idle_seconds:
+                break
+            self._hibernate(oldest)
+
+    def _trim(self, session: Session) -> None:
+        cut = retention_cut(session.events, self.max_events)
+        if cut:
+            del session.events[:cut]
+            self.events_trimmed += cut
+
+    # ---------- session service ----------
+
+    def _create_session_impl(self, *, app_name: str, user_id: str, state: Optional[dict[str, Any]] = None, session_id: Optional[str] = None) -> Session:
+        if session_id:
+            # Raises AlreadyExistsError for a hibernated session too
+            key = (app_name, user_id, session_id.strip())
+            if key in self.hibernated:
+                self._restore(key)
+        session = super()._create_session_impl(
+            app_name=app_name, user_id=user_id, state=state, session_id=session_id,
+        )
+        self._touch(app_name, user_id, session.id)
+        return session
+
+    def _get_session_impl(self, *, app_name: str, user_id: str, session_id: str, config: Optional[GetSessionConfig] = None) -> Optional[Session]:
+        self._touch(app_name, user_id, session_id)
+        return super()._get_session_impl(
+            app_name=app_name, user_id=user_id, session_id=session_id, config=config,
+        )
+
+    def _list_sessions_impl(self, *, app_name: str, user_id: Optional[str] = None) -> ListSessionsResponse:
+        # Hibernated sessions are listed from disk without being restored
+        response = super()._list_sessions_impl(app_name=app_name, user_id=user_id)
+        for key, path in self.hibernated.items():
+            if key[0] != app_name or (user_id is not None and key[1] != user_id):
+                continue
+            with open(path, 'rb') as f:
+                session = self.load(f.read())
+            session.events = []
+            response.sessions.append(self._merge_state(key[0], key[1], session))
+        response.sessions.sort(key=lambda s: (s.last_update_time, s.user_id, s.id))
+        return response
+
+    def _delete_session_impl(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        key = (app_name, user_id, session_id.strip() if session_id else session_id)
+        path = self.hibernated.pop(key, None)
+        if path and os.path.exists(path):
+            os.remove(path)
+        self.resident.pop(key, None)
+        super()._delete_session_impl(app_name=app_name, user_id=user_id, session_id=session_id)
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        self._touch(session.app_name, session.user_id, session.id)
+        event = await super().append_event(session, event)
+        if not event.partial:
+            storage = self.sessions.get(session.app_name, {}).get(session.user_id, {}).get(session.id)
+            if storage is not None:
+                self._trim(storage)
+            if storage is not session:
+                # The caller's copy (the runner's invocation session) grows too
+                self._trim(session)
+        return event
+
+    # ---------- metrics ----------
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: resident/hibernated session counts and bytes, events held,
+            and how often events were trimmed and sessions hibernated/restored
+        """
+        resident_bytes = 0
+        events = 0
+        for app_name, user_id, session_id in self.resident:
+            session = self.sessions[app_name][user_id][session_id]
+            resident_bytes += len(self.dump(session))
+            events += len(session.events)
+        return {
+            'resident_sessions': len(self.resident),
+            'resident_bytes': resident_bytes,
+            'resident_events': events,
+            'hibernated_sessions': len(self.hibernated),
+            'hibernated_bytes': sum(os.path.getsize(path) for path in self.hibernated.values()),
+            'events_trimmed': self.events_trimmed,
+            'hibernations': self.hibernations,
+            'restores': self.restores,
+        }
+
+    def summary(self) -> str:
+        s = self.stats()
+        return (
+            f"{s['resident_sessions']} resident ({s['resident_bytes'] / 1024:.1f} KiB, "
+            f"{s['resident_events']} events), {s['hibernated_sessions']} hibernated "
+            f"({s['hibernated_bytes'] / 1024:.1f} KiB), {s['events_trimmed']} events trimmed, "
+            f"{s['hibernations']} hibernations, {s['restores']} restores"
+        )
@@ -0,0 +1,33 @@
+from google.adk.agents import Agent
+from .resilience import ResilientGemini
+from .callbacks import (
+    before_agent_callback,
+    after_agent_callback,
+)
+
+
+# Narration-only agent for the rules-first pipeline: the turn has already
+# been resolved in Python, so it gets no tools and no conversation history,
+# making narration a single model call.
+narrator_agent = Agent(
+    name='narrator_agent',
+    description='A storyteller that narrates an already resolved combat turn.',
+    model=ResilientGemini(
+        model='gemini-2.5-flash-lite',
+    ),
+    instruction="""
+    You are the narrator of a D&D combat. The rules have already been applied: you receive the player's
+    command and a log of everything that happened this turn (moves, attack rolls, damage, spells, terrain,
+    monster actions).
+
+    Write 2-4 vivid sentences describing the turn.
+    - Only describe what is in the log. Do not invent hits, misses, damage or movement.
+    - Keep the numbers from the log (damage, HP) when you mention them.
+    - Refer to the player as "you".
+    - If an action failed, explain why in the story (e.g. out of reach, already used the action).
+    - Do not list available actions or ask questions; the game shows those itself.
+    """,
+    include_contents='none',
+    before_agent_callback=before_agent_callback,
+    after_agent_callback=after_agent_callback,
+)
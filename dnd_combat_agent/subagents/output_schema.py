@@ -1,17 +1,164 @@
-from pydantic import BaseModel, Field
+from typing import Annotated, Literal
+
+from pydantic import BaseModel, Field, model_validator
+
+from .grid import MAX_GRID_SIZE
+
+# Limits from the monster generator and battleground designer prompts.
+# They are sent to the model as schema constraints and enforced locally.
+HP_RANGE = (15, 50)
+AC_RANGE = (1, 20)
+DAMAGE_RANGE = (1, 15)
+SPEED_RANGE = (1, 5)
+GRID_SIZE_RANGE = (5, MAX_GRID_SIZE)
+ENVIRONMENTS = ('BLOCKED', 'DAMAGE')
+
+Coordinate = Annotated[list[Annotated[int, Field(ge=0)]], Field(min_length=2, max_length=2)]
+
+
+def _clamp(value, limits: tuple[int, int], field: str, corrections: list[str]) -> int:
+    """Coerces a value to int and clamps it into limits, recording any change."""
+    low, high = limits
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        number = low
+    clamped = max(low, min(high, number))
+    if clamped != value:
+        corrections.append(f"{field} {value!r} -> {clamped}")
+    return clamped
+
+
+def _pair(value, field: str, corrections: list[str], low: int = 0) -> list[int]:
+    """Coerces a value to a [row, col] pair of non-negative ints, recording any change."""
+    items = list(value) if isinstance(value, (list, tuple)) else []
+    pair = []
+    for item in (items + [low, low])[:2]:
+        try:
+            pair.append(max(low, int(item)))
+        except (TypeError, ValueError):
+            pair.append(low)
+    if pair != value:
+        corrections.append(f"{field} {value!r} -> {pair}")
+    return pair
+
+
+def normalize_monster(data: dict) -> tuple[dict, list[str]]:
+    """
+    Clamps and repairs a generated monster in one pass.
+
+    Returns:
+        tuple: (normalised copy, list of corrections made)
+    """
+    corrections = []
+    monster = dict(data)
+    name = monster.get('name')
+    monster['hp'] = _clamp(monster.get('hp'), HP_RANGE, f'{name} hp', corrections)
+    monster['ac'] = _clamp(monster.get('ac'), AC_RANGE, f'{name} ac', corrections)
+    monster['speed'] = _clamp(monster.get('speed'), SPEED_RANGE, f'{name} speed', corrections)
+
+    damage = monster.get('damage')
+    if isinstance(damage, (list, tuple)):
+        values = list(damage) or [DAMAGE_RANGE[0]]
+    elif damage is None:
+        values = [DAMAGE_RANGE[0]]
+    else:
+        # A single number is a fixed damage value
+        values = [damage, damage]
+    values = [_clamp(v, DAMAGE_RANGE, f'{name} damage bound', []) for v in values]
+    fixed = [min(values), max(values)]
+    if fixed != damage:
+        corrections.append(f"{name} damage {damage!r} -> {fixed}")
+    monster['damage'] = fixed
+    return monster, corrections
+
+
+def normalize_battleground(data: dict) -> tuple[dict, list[str]]:
+    """
+    Fixes the shape of a generated battleground in one pass: size within
+    limits, every position a [row, col] pair, a known environment. Placement
+    rules (bounds, terrain count, distances) are left to validation.py.
+
+    Returns:
+        tuple: (normalised copy, list of corrections made)
+    """
+    corrections = []
+    battleground = dict(data)
+
+    size = battleground.get('size')
+    fixed = _pair(size, 'size', [], low=GRID_SIZE_RANGE[0])
+    fixed = [min(GRID_SIZE_RANGE[1], n) for n in fixed]
+    if fixed != size:
+        corrections.append(f"size {size!r} -> {fixed}")
+    battleground['size'] = fixed
+
+    terrain = battleground.get('rectangle_position')
+    if isinstance(terrain, (list, tuple)):
+        battleground['rectangle_position'] = [
+            _pair(cell, 'terrain square', corrections)
+            for cell in terrain
+            if isinstance(cell, (list, tuple)) and len(cell) >= 2
+        ]
+        if len(battleground['rectangle_position']) != len(terrain):
+            corrections.append(f"dropped {len(terrain) - len(battleground['rectangle_position'])} malformed terrain square(s)")
+    else:
+        battleground['rectangle_position'] = []
+        corrections.append(f"rectangle_position {terrain!r} -> []")
+
+    for key in ('user_position', 'monster_position'):
+        battleground[key] = _pair(battleground.get(key), key, corrections)
+
+    environment = str(battleground.get('environment', '')).strip().upper()
+    if environment not in ENVIRONMENTS:
+        environment = 'DAMAGE' if 'DAMAGE' in environment else 'BLOCKED'
+    if environment != battleground.get('environment'):
+        corrections.append(f"environment {battleground.get('environment')!r} -> {environment!r}")
+    battleground['environment'] = environment
+    return battleground, corrections
+
+
+def _report(model: str, corrections: list[str]) -> None:
+    for correction in corrections:
+        print(f'[INFO] {model} corrected: {correction}')
+
 
 class MonsterContent(BaseModel):
     name: str = Field(description="The name of the monster.")
     monster_emoji: str = Field(description="The emoji to represent the monster.")
-    hp: int = Field(description="The hit points of the monster.")
-    ac: int = Field(description="The armor class of the monster.")
-    damage: list[int] = Field(description="The attack damage range of the monster.")
-    speed: int = Field(description="The speed of the monster.")
+    hp: int = Field(ge=HP_RANGE[0], le=HP_RANGE[1], description="The hit points of the monster.")
+    ac: int = Field(ge=AC_RANGE[0], le=AC_RANGE[1], description="The armor class of the monster.")
+    damage: list[Annotated[int, Field(ge=DAMAGE_RANGE[0], le=DAMAGE_RANGE[1])]] = Field(
+        min_length=2, max_length=2, description="The attack damage range of the monster: [min, max]."
+    )
+    speed: int = Field(ge=SPEED_RANGE[0], le=SPEED_RANGE[1], description="The speed of the monster.")
+
+    @model_validator(mode='before')
+    @classmethod
+    def _normalize(cls, data):
+        # Out-of-spec values are repaired here rather than rejected, so a
+        # malformed generation never costs another model call
+        if isinstance(data, dict):
+            data, corrections = normalize_monster(data)
+            _report(cls.__name__, corrections)
+        return data
+
+class EncounterContent(BaseModel):
+    monsters: list[MonsterContent] = Field(min_length=1, description="The monsters of the encounter. The first one is the lead monster.")
 
 class BattlegroundContent(BaseModel):
-    size: list[int] = Field(description="The size of the battle ground grid.")
-    rectangle_position: list[list[int]] = Field(description="List of positions with special terrain. Each position is [row, col].")
-    environment: str = Field(description="The environment type: BLOCKED or DAMAGE.")
+    size: list[Annotated[int, Field(ge=GRID_SIZE_RANGE[0], le=GRID_SIZE_RANGE[1])]] = Field(
+        min_length=2, max_length=2, description="The size of the battle ground grid: [rows, cols]."
+    )
+    rectangle_position: list[Coordinate] = Field(description="List of positions with special terrain. Each position is [row, col].")
+    environment: Literal['BLOCKED', 'DAMAGE'] = Field(description="The environment type: BLOCKED or DAMAGE.")
     environment_emoji: str = Field(description="The emoji to represent the environment.")
-    user_position: list[int] = Field(description="The start position of the user.")
-    monster_position: list[int] = Field(description="The start position of the monster.")
+    user_position: Coordinate = Field(description="The start position of the user: [row, col].")
+    monster_position: Coordinate = Field(description="The start position of the monster: [row, col].")
+
+    @model_validator(mode='before')
+    @classmethod
+    def _normalize(cls, data):
+        if isinstance(data, dict):
+            data, corrections = normalize_battleground(data)
+            _report(cls.__name__, corrections)
+        return data
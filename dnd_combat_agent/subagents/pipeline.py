@@ -0,0 +1,283 @@
+"""
+D&D Combat Agent - Rules-First Turn Pipeline
+
+In rules-first mode the model does not run the rules. A player command is
+parsed and resolved here by calling the rules engine in rules.py directly,
+monsters are played by a simple pathfinding AI following the DM prompt's
+strategy (close in, attack when adjacent), and the resulting turn log is
+handed to the narrator agent in a single model call. Monster paths planned
+ahead by speculation.py are replayed when the state matches. Other
+difficulty levels play monsters with the policies in search.py.
+
+Commands understood:
+- move <direction> [squares]      e.g. "move north", "move south east 2"
+- attack [target]                 nearest adjacent monster if no target
+- cast <spell> [target]           e.g. "cast magic missile at monster_2"
+- end turn / done / pass          plays every monster in initiative order
+- status / actions
+
+Anything else returns None so the caller can hand it to the DM agent.
+"""
+
+import random
+import re
+
+from .encounter import (
+    USER_ID,
+    display_name,
+    get_position,
+    living_monsters,
+    path_to_enemy,
+    resolve_combatant,
+)
+from .rules import (
+    DIRECTION_DELTAS,
+    SPELL_DATA,
+    STEP_NAMES,
+    advance_turn,
+    apply_terrain_effects,
+    attack,
+    cast_spell,
+    check_combat_status,
+    check_turn_status,
+    end_user_turn,
+    find_targets_in_range,
+    get_available_actions,
+    move_character,
+    reset_turn,
+)
+from .search import DEFAULT_DIFFICULTY, monster_policy
+from .speculation import speculation
+
+END_TURN_WORDS = ('end turn', 'end my turn', 'finish turn', 'end', 'done', 'pass', "that's it")
+FILLER_WORDS = {'the', 'at', 'on', 'to', 'a', 'an'}
+
+# Safety bound on monster turns processed for one "end turn"
+MAX_TURNS_PER_ROUND = 100
+
+
+class TrackedState(dict):
+    """A state dict that remembers which keys were written, for the session delta."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.changed = set()
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.changed.add(key)
+
+    def delta(self) -> dict:
+        return {key: self[key] for key in self.changed}
+
+
+# ============================================================
+# PARSING
+# ============================================================
+
+def parse_command(text: str) -> dict | None:
+    """
+    Parses a player command.
+
+    Returns:
+        dict | None: {'verb': ..., plus verb arguments}, or None if not understood
+    """
+    words = [w for w in re.split(r"[\s,]+", text.strip().lower()) if w]
+    if not words:
+        return None
+    phrase = ' '.join(words)
+
+    if phrase in END_TURN_WORDS:
+        return {'verb': 'end_turn'}
+    if phrase in ('status', 'check status'):
+        return {'verb': 'status'}
+    if phrase in ('actions', 'available actions', 'what can i do'):
+        return {'verb': 'actions'}
+
+    verb, rest = words[0], words[1:]
+    if verb in ('move', 'go', 'walk', 'step'):
+        # "north east" and "northeast" are both accepted
+        joined = ''.join(w for w in rest if not w.isdigit())
+        steps = next((int(w) for w in rest if w.isdigit()), 1)
+        if joined in DIRECTION_DELTAS and steps > 0:
+            return {'verb': 'move', 'direction': joined, 'steps': steps}
+        return None
+    if verb in ('attack', 'hit', 'strike'):
+        target = ' '.join(w for w in rest if w not in FILLER_WORDS)
+        return {'verb': 'attack', 'target': target}
+    if verb == 'cast':
+        rest = [w for w in rest if w not in FILLER_WORDS]
+        for spell in SPELL_DATA:
+            spell_words = spell.split('_')
+            if rest[:len(spell_words)] == spell_words or rest[:1] == [spell]:
+                used = 1 if rest[:1] == [spell] else len(spell_words)
+                return {'verb': 'cast', 'spell': spell, 'target': ' '.join(rest[used:])}
+        return None
+    return None
+
+
+# ============================================================
+# MONSTER AI
+# ============================================================
+
+def play_monster(state: dict, combatant: str, path: list | None = None) -> list[dict]:
+    """
+    Plays one monster's turn: move along the shortest path toward the
+    nearest enemy (up to its speed), attack if adjacent, then take terrain
+    effects.
+
+    Args:
+        path: precomputed path from the speculation cache; searched afresh
+            when missing or when it does not start next to the monster
+
+    Returns:
+        list[dict]: Turn log entries
+    """
+    log = []
+    speed = state[combatant]['speed']
+    current = tuple(get_position(state, combatant))
+    if not path or abs(path[0][0] - current[0]) + abs(path[0][1] - current[1]) != 1:
+        path = path_to_enemy(state, combatant)
+    for cell in path[:speed]:
+        direction = STEP_NAMES[(cell[0] - current[0], cell[1] - current[1])]
+        result = move_character(state, combatant, direction)
+        log.append({'actor': combatant, 'action': 'move', 'result': result})
+        if not result['success']:
+            break
+        current = cell
+
+    targets = find_targets_in_range(state, combatant, 1)['targets']
+    if targets:
+        result = attack(state, combatant, targets[0]['id'])
+        log.append({'actor': combatant, 'action': 'attack', 'result': result})
+
+    result = apply_terrain_effects(state, combatant)
+    if result['effects']:
+        log.append({'actor': combatant, 'action': 'terrain', 'result': result})
+    return log
+
+
+# ============================================================
+# TURN RESOLUTION
+# ============================================================
+
+def _user_action(state: dict, command: dict) -> list[dict]:
+    verb = command['verb']
+    if verb == 'move':
+        log = []
+        for _ in range(command['steps']):
+            result = move_character(state, USER_ID, command['direction'])
+            log.append({'actor': USER_ID, 'action': 'move', 'result': result})
+            if not result['success']:
+                break
+        return log
+    if verb == 'attack':
+        target = command['target']
+        if not target or resolve_combatant(target, state) in (None, USER_ID):
+            # Default to the nearest adjacent monster, else the nearest one
+            adjacent = find_targets_in_range(state, USER_ID, 1)['targets']
+            remaining = living_monsters(state)
+            target = adjacent[0]['id'] if adjacent else (remaining[0] if remaining else 'monster')
+        return [{'actor': USER_ID, 'action': 'attack', 'result': attack(state, USER_ID, target)}]
+    if verb == 'cast':
+        target = command['target'] or ('user' if SPELL_DATA[command['spell']]['type'] == 'heal' else '')
+        result = cast_spell(state, command['spell'], target)
+        return [{'actor': USER_ID, 'action': 'cast', 'result': result}]
+    if verb == 'status':
+        return [{'actor': USER_ID, 'action': 'status', 'result': check_turn_status(state)}]
+    if verb == 'actions':
+        return [{'actor': USER_ID, 'action': 'actions', 'result': get_available_actions(state, USER_ID)}]
+    return []
+
+
+def _monster_turns(state: dict, difficulty: str = DEFAULT_DIFFICULTY, use_plans: bool = True) -> list[dict]:
+    """
+    Ends the user's turn and plays every monster until the user is up again,
+    replaying the speculated plan for this state when there is one. The
+    speculated plans are pathfinding moves, so they are only used at the
+    default difficulty, and only when use_plans says the planner is idle.
+    """
+    policy = None if difficulty == DEFAULT_DIFFICULTY else monster_policy(difficulty)
+    plan = (speculation.lookup(state) if policy is None and use_plans else None) or {}
+    result = end_user_turn(state)
+    result['precomputed'] = bool(plan)
+    log = [{'actor': USER_ID, 'action': 'end_turn', 'result': result}]
+    for _ in range(MAX_TURNS_PER_ROUND):
+        current = state['turn_tracker']['current_turn']
+        if current == USER_ID or not state['user_attributes']['hp'] > 0:
+            break
+        if policy is None:
+            log.extend(play_monster(state, current, plan.get(current, {}).get('path')))
+        else:
+            log.extend(policy(state, current, random))
+            result = apply_terrain_effects(state, current)
+            if result['effects']:
+                log.append({'actor': current, 'action': 'terrain', 'result': result})
+        advance_turn(state)
+
+    result = apply_terrain_effects(state, USER_ID)
+    if result['effects']:
+        log.append({'actor': USER_ID, 'action': 'terrain', 'result': result})
+    reset_turn(state)
+    return log
+
+
+def play_turn(state: dict, text: str, difficulty: str = DEFAULT_DIFFICULTY,
+              use_plans: bool = True) -> dict | None:
+    """
+    Resolves a player command entirely with the rules in rules.py.
+
+    Args:
+        state: current session state (not modified)
+        text: the player's command
+        difficulty: key of search.DIFFICULTY_SETTINGS, picks the monster AI
+        use_plans: replay speculated monster plans; pass False while the
+            speculation is still running, so its cache is left alone
+
+    Returns:
+        dict | None: {'log', 'delta', 'state', 'combat_status', 'ended_turn'},
+        or None if the command was not understood
+    """
+    command = parse_command(text)
+    if command is None:
+        return None
+
+    state = TrackedState(state)
+    if command['verb'] == 'end_turn':
+        log = _monster_turns(state, difficulty, use_plans)
+    else:
+        log = _user_action(state, command)
+
+    status = check_combat_status(state)
+    if status['status'] != 'ongoing':
+        log.append({'actor': None, 'action': 'combat_end', 'result': status})
+    state['combat_status'] = status['status']
+    return {
+        'log': log,
+        'delta': state.delta(),
+        'state': dict(state),
+        'combat_status': status['status'],
+        'ended_turn': command['verb'] == 'end_turn',
+    }
+
+
+def format_log(log: list[dict]) -> list[str]:
+    """Plain text lines of a turn log, printed before the narration arrives."""
+    lines = []
+    for entry in log:
+        message = entry['result'].get('message')
+        if message:
+            lines.append(f"  • {message}")
+    if not lines:
+        lines.append("  • Nothing happened.")
+    return lines
+
+
+def narration_prompt(command: str, log: list[dict], state: dict) -> str:
+    """Builds the narrator's input: the command and a compact structured log."""
+    entries = []
+    for entry in log:
+        actor = entry['actor']
+        name = display_name(state, actor) if actor else 'Game'
+        entries.append(f"- {name} / {entry['action']}: {entry['result'].get('message', '')}")
+    return f"Player command: {command}\nTurn log:\n" + '\n'.join(entries)
@@ -0,0 +1,343 @@
+"""
+D&D Combat Agent - Scripted Combat Policies
+
+A policy plays one whole turn for one combatant, the user or a monster,
+by calling the rules engine in rules.py the way the rules-first pipeline
+does, so every rule (speed, blocked and occupied squares, action economy,
+spell slots, line of sight) is enforced by the same code as in the game.
+
+Policies differ in where they move. After moving they all take the
+obvious action: melee the weakest adjacent enemy, and as a wizard cast a
+damage spell at a visible enemy in range and heal below half HP.
+
+- random: random orthogonal steps
+- greedy: steps that shorten the straight-line distance to the nearest
+  enemy; can get stuck behind walls
+- pathfinding: shortest path around terrain to the nearest enemy
+- lookahead: scores every reachable square by the expected damage dealt
+  from it minus the expected damage taken back next round and terrain
+  damage, and moves to the best one
+
+Policies are called as policy(state, combatant, rng) and return the turn's
+log entries ({'actor', 'action', 'result'}). play_rounds() plays a fight
+on from any point with one policy per side.
+"""
+
+import random
+from collections import deque
+
+from .encounter import (
+    USER_ID,
+    enemies_of,
+    get_attributes,
+    get_position,
+    get_spatial_index,
+    path_to_enemy,
+)
+from .grid import get_grid
+from .rules import (
+    SPELL_DATA,
+    advance_turn,
+    apply_terrain_effects,
+    attack,
+    cast_spell,
+    check_combat_status,
+    end_user_turn,
+    move_character,
+)
+from .visibility import get_visibility
+
+ORTHOGONAL_STEPS = {(-1, 0): 'north', (1, 0): 'south', (0, 1): 'east', (0, -1): 'west'}
+
+# Expected damage of the 1d4 terrain hazard
+EXPECTED_TERRAIN_DAMAGE = 2.5
+
+# How much the lookahead policy weighs damage taken against damage dealt
+RISK_WEIGHT = 0.5
+# Per step between the lookahead policy and the nearest enemy (around
+# terrain), so it closes in rather than wait just out of reach (as the
+# search AI's approach term in search.py)
+APPROACH_WEIGHT = 1.0
+
+
+def hit_chance(ac: int) -> float:
+    """Chance that a d20 roll is at least the target's AC."""
+    return max(0.0, min(1.0, (21 - ac) / 20))
+
+
+def average(value_range: list[int]) -> float:
+    return (value_range[0] + value_range[1]) / 2
+
+
+def _distance(a, b) -> int:
+    return abs(a[0] - b[0]) + abs(a[1] - b[1])
+
+
+def movement_left(state, combatant: str, moved: int) -> int:
+    """Squares the combatant may still move this turn."""
+    speed = get_attributes(state, combatant)['speed']
+    if combatant == USER_ID:
+        return speed - state.get('turn_tracker', {}).get('movement_used', 0)
+    return speed - moved
+
+
+def reachable(state, combatant: str, budget: int) -> dict:
+    """
+    Every free square reachable with at most `budget` orthogonal steps.
+
+    Returns:
+        dict: {(row, col): path of cells from the next step to that square}
+    """
+    grid = get_grid(state.get('battleground', {}))
+    start = tuple(get_position(state, combatant))
+    occupied = {pos for cid, pos in get_spatial_index(state).positions.items() if cid != combatant}
+    paths = {start: []}
+    queue = deque([start])
+    while queue:
+        cell = queue.popleft()
+        if len(paths[cell]) >= budget:
+            continue
+        for dr, dc in ORTHOGONAL_STEPS:
+            nxt = (cell[0] + dr, cell[1] + dc)
+            if (
+                nxt not in paths
+                and grid.in_bounds(*nxt)
+                and not grid.is_blocked(*nxt)
+                and nxt not in occupied
+            ):
+                paths[nxt] = paths[cell] + [nxt]
+                queue.append(nxt)
+    return paths
+
+
+def walk(state, combatant: str, path: list) -> list[dict]:
+    """Moves along a path of orthogonal steps, stopping at the first refusal."""
+    log = []
+    current = tuple(get_position(state, combatant))
+    for cell in path:
+        direction = ORTHOGONAL_STEPS[(cell[0] - current[0], cell[1] - current[1])]
+        result = move_character(state, combatant, direction)
+        log.append({'actor': combatant, 'action': 'move', 'result': result})
+        if not result['success']:
+            break
+        current = cell
+    return log
+
+
+# ============================================================
+# ACTIONS
+# ============================================================
+
+def _spell_target(state, spell_name: str) -> str | None:
+    """Weakest visible monster in range of a damage spell, if the user can cast it."""
+    user = state['user_attributes']
+    spell = SPELL_DATA[spell_name]
+    if user.get('class') != 'wizard' or spell_name not in user.get('spells_known', []):
+        return None
+    if user.get('spell_slots', {}).get(f"level_{spell['level']}", 0) <= 0:
+        return None
+    position = get_position(state, USER_ID)
+    visibility = get_visibility(get_grid(state.get('battleground', {})))
+    targets = []
+    for cid in enemies_of(state, USER_ID):
+        target = get_position(state, cid)
+        if _distance(position, target) <= spell['range'] and visibility.visible(position, target):
+            targets.append((get_attributes(state, cid)['hp'], cid))
+    return min(targets)[1] if targets else None
+
+
+def act(state, combatant: str) -> list[dict]:
+    """Takes the combatant's action (and the wizard's bonus-action heal)."""
+    log = []
+    if combatant == USER_ID:
+        user = state['user_attributes']
+        tracker = state.get('turn_tracker', {})
+        if (
+            user.get('class') == 'wizard'
+            and user['hp'] <= user.get('max_hp', user['hp']) / 2
+            and not tracker.get('bonus_action_used', False)
+            and user.get('spell_slots', {}).get('level_1', 0) > 0
+        ):
+            log.append({'actor': USER_ID, 'action': 'cast', 'result': cast_spell(state, 'heal', USER_ID)})
+        for spell_name in ('fireball', 'magic_missile'):
+            target = _spell_target(state, spell_name)
+            if target is not None:
+                result = cast_spell(state, spell_name, target)
+                log.append({'actor': USER_ID, 'action': 'cast', 'result': result})
+                return log
+
+    position = get_position(state, combatant)
+    adjacent = [
+        (get_attributes(state, cid)['hp'], cid)
+        for cid in enemies_of(state, combatant)
+        if _distance(position, get_position(state, cid)) == 1
+    ]
+    if adjacent:
+        result = attack(state, combatant, min(adjacent)[1])
+        log.append({'actor': combatant, 'action': 'attack', 'result': result})
+    return log
+
+
+# ============================================================
+# POLICIES
+# ============================================================
+
+def random_policy(state, combatant: str, rng: random.Random) -> list[dict]:
+    """Random steps (each one possibly none), then the obvious action."""
+    budget = movement_left(state, combatant, 0)
+    steps = rng.randint(0, max(0, budget))
+    paths = reachable(state, combatant, steps)
+    farthest = [cell for cell, path in paths.items() if len(path) == max(len(p) for p in paths.values())]
+    log = walk(state, combatant, paths[rng.choice(sorted(farthest))])
+    return log + act(state, combatant)
+
+
+def greedy_policy(state, combatant: str, rng: random.Random) -> list[dict]:
+    """Steps that bring the nearest enemy closer in a straight line."""
+    log = []
+    moved = 0
+    grid = get_grid(state.get('battleground', {}))
+    while movement_left(state, combatant, moved) > 0:
+        position = tuple(get_position(state, combatant))
+        enemies = [tuple(get_position(state, cid)) for cid in enemies_of(state, combatant)]
+        if not enemies or min(_distance(position, e) for e in enemies) <= 1:
+            break
+        occupied = get_spatial_index(state)
+        options = []
+        for dr, dc in ORTHOGONAL_STEPS:
+            cell = (position[0] + dr, position[1] + dc)
+            if grid.in_bounds(*cell) and not grid.is_blocked(*cell) and occupied.occupant(list(cell)) is None:
+                options.append((min(_distance(cell, e) for e in enemies), rng.random(), cell))
+        best = min(options) if options else None
+        if best is None or best[0] >= min(_distance(position, e) for e in enemies):
+            break
+        log.extend(walk(state, combatant, [best[2]]))
+        moved += 1
+    return log + act(state, combatant)
+
+
+def pathfinding_policy(state, combatant: str, rng: random.Random) -> list[dict]:
+    """Shortest path to a square next to the nearest reachable enemy."""
+    budget = movement_left(state, combatant, 0)
+    log = walk(state, combatant, path_to_enemy(state, combatant)[:budget])
+    return log + act(state, combatant)
+
+
+def expected_dealt(state, combatant: str, cell: tuple) -> float:
+    """Expected damage the combatant can deal this turn from a square."""
+    best = 0.0
+    attributes = get_attributes(state, combatant)
+    for cid in enemies_of(state, combatant):
+        target = get_attributes(state, cid)
+        if _distance(cell, get_position(state, cid)) == 1:
+            damage = hit_chance(target['ac']) * min(average(attributes['damage']), target['hp'])
+            best = max(best, damage)
+    if combatant == USER_ID and attributes.get('class') == 'wizard':
+        visibility = get_visibility(get_grid(state.get('battleground', {})))
+        slots = attributes.get('spell_slots', {})
+        for spell_name in ('fireball', 'magic_missile'):
+            spell = SPELL_DATA[spell_name]
+            if slots.get(f"level_{spell['level']}", 0) <= 0:
+                continue
+            for cid in enemies_of(state, combatant):
+                target = get_position(state, cid)
+                distance = _distance(cell, target)
+                if distance <= spell['range'] and visibility.visible(list(cell), target):
+                    damage = min(average(spell['damage']), get_attributes(state, cid)['hp'])
+                    best = max(best, damage)
+    return best
+
+
+def expected_taken(state, combatant: str, cell: tuple) -> float:
+    """Expected damage from enemies that can reach the square next round."""
+    ac = get_attributes(state, combatant)['ac']
+    total = 0.0
+    for cid in enemies_of(state, combatant):
+        enemy = get_attributes(state, cid)
+        if _distance(cell, get_position(state, cid)) - 1 <= enemy['speed']:
+            total += hit_chance(ac) * average(enemy['damage'])
+    return total
+
+
+def enemy_distances(state, combatant: str) -> dict:
+    """
+    Orthogonal steps from every square to the nearest enemy, walking around
+    BLOCKED terrain (combatants are not obstacles here).
+
+    Returns:
+        dict: {(row, col): steps}; squares no enemy can be reached from are missing
+    """
+    grid = get_grid(state.get('battleground', {}))
+    steps = {tuple(get_position(state, cid)): 0 for cid in enemies_of(state, combatant)}
+    queue = deque(steps)
+    while queue:
+        cell = queue.popleft()
+        for dr, dc in ORTHOGONAL_STEPS:
+            nxt = (cell[0] + dr, cell[1] + dc)
+            if nxt not in steps and grid.in_bounds(*nxt) and not grid.is_blocked(*nxt):
+                steps[nxt] = steps[cell] + 1
+                queue.append(nxt)
+    return steps
+
+
+def lookahead_policy(state, combatant: str, rng: random.Random) -> list[dict]:
+    """Moves to the reachable square with the best expected damage trade."""
+    grid = get_grid(state.get('battleground', {}))
+    paths = reachable(state, combatant, movement_left(state, combatant, 0))
+    distances = enemy_distances(state, combatant)
+    # Squares cut off from every enemy count as farther than any other
+    unreachable = grid.rows * grid.cols
+
+    def score(cell):
+        value = expected_dealt(state, combatant, cell) - RISK_WEIGHT * expected_taken(state, combatant, cell)
+        if grid.is_damage(*cell):
+            value -= EXPECTED_TERRAIN_DAMAGE
+        return value - APPROACH_WEIGHT * distances.get(cell, unreachable)
+
+    best = max(paths, key=lambda cell: (score(cell), -len(paths[cell])))
+    return walk(state, combatant, paths[best]) + act(state, combatant)
+
+
+# ============================================================
+# PLAYING ROUNDS
+# ============================================================
+
+def end_monster_turn(state, combatant: str) -> None:
+    """Terrain damage for the monster, then the next turn; at the end of a
+    round the user takes terrain damage where they stand."""
+    apply_terrain_effects(state, combatant)
+    advance_turn(state)
+    if state['turn_tracker']['current_turn'] == USER_ID:
+        apply_terrain_effects(state, USER_ID)
+
+
+def play_rounds(state, user_policy, monster_policy, rng: random.Random, max_round: int) -> str:
+    """
+    Plays the fight on from the current turn until it ends or round
+    `max_round` is over.
+
+    Returns:
+        str: 'user_won', 'monster_won' or 'ongoing'
+    """
+    status = check_combat_status(state)['status']
+    while status == 'ongoing' and state['turn_tracker']['round'] <= max_round:
+        current = state['turn_tracker']['current_turn']
+        if current == USER_ID:
+            user_policy(state, USER_ID, rng)
+            status = check_combat_status(state)['status']
+            if status != 'ongoing':
+                break
+            end_user_turn(state)
+        else:
+            monster_policy(state, current, rng)
+            end_monster_turn(state, current)
+        status = check_combat_status(state)['status']
+    return status
+
+
+POLICIES = {
+    'random': random_policy,
+    'greedy': greedy_policy,
+    'pathfinding': pathfinding_policy,
+    'lookahead': lookahead_policy,
+}
@@ -0,0 +1,318 @@
+"""
+D&D Combat Agent - Offline Procedural Scenario Generator
+
+Builds a complete battle scenario (theme, monsters, battleground) locally,
+with no model call, in a few milliseconds. Used by `main.py --offline` and
+as a fallback when the model is unavailable.
+
+- Themes come from a small template library; each template fixes the
+  terrain type and emoji and offers a few monster archetypes.
+- Monsters are built from a stat budget: points are spread over HP, AC,
+  damage and speed, so a tanky monster ends up slow or weak-hitting,
+  as the monster generator prompt asks.
+- Battlegrounds use the same patterns as the designer prompt (pillars,
+  walls, L-shapes, crosses, scattered hazards) plus a value-noise pattern,
+  then go through the same validator as model-designed maps.
+
+Everything is validated against the schemas in output_schema.py.
+"""
+
+import random
+
+from .encounter import monster_id, place_monsters
+from .grid import build_grid
+from .output_schema import BattlegroundContent, MonsterContent
+from .validation import MAX_TERRAIN_CELLS, MIN_TERRAIN_CELLS, validate_battleground
+
+THEME_LIBRARY = [
+    {
+        'setting': 'magma river',
+        'environment': 'DAMAGE',
+        'environment_emoji': '🔥',
+        'story': "Heat shimmers over the cracked basalt banks of a magma river as you steady your footing. From the glowing current rises {foe}, its eyes fixed on you.",
+        'monsters': [('Magma Salamander', '🦎'), ('Ember Drake', '🐉'), ('Cinder Hound', '🐕')],
+    },
+    {
+        'setting': 'frozen lake',
+        'environment': 'DAMAGE',
+        'environment_emoji': '❄️',
+        'story': "The ice of the frozen lake groans beneath your boots, and freezing mist stings your lungs. Out of the whiteout lopes {foe}, hungry for warm blood.",
+        'monsters': [('Winter Wolf', '🐺'), ('Frost Bear', '🐻'), ('Ice Wraith', '👻')],
+    },
+    {
+        'setting': 'ancient forest',
+        'environment': 'BLOCKED',
+        'environment_emoji': '🌳',
+        'story': "Moss-covered trunks crowd the forest floor, and the canopy swallows the last of the daylight. Something large shoulders between the trees: {foe} has caught your scent.",
+        'monsters': [('Owlbear', '🦉'), ('Dire Boar', '🐗'), ('Giant Spider', '🕷️')],
+    },
+    {
+        'setting': 'acid swamp',
+        'environment': 'DAMAGE',
+        'environment_emoji': '🧪',
+        'story': "Bubbles of green acid burst across the swamp, hissing where they touch the reeds. From the sludge surfaces {foe}, dripping and patient.",
+        'monsters': [('Black Pudding', '🦠'), ('Swamp Troll', '👹'), ('Giant Frog', '🐸')],
+    },
+    {
+        'setting': 'ruined courtyard',
+        'environment': 'BLOCKED',
+        'environment_emoji': '🪨',
+        'story': "Broken pillars and fallen masonry litter the old courtyard, long abandoned by its keepers. Between the stones stirs {foe}, guarding whatever treasure remains.",
+        'monsters': [('Stone Golem', '🗿'), ('Skeleton Knight', '💀'), ('Gargoyle', '👿')],
+    },
+    {
+        'setting': 'desert flats',
+        'environment': 'BLOCKED',
+        'environment_emoji': '🌵',
+        'story': "Wind whips sand across the sun-scorched flats, stinging your eyes. Between the cacti rises {foe}, its shadow long on the dunes.",
+        'monsters': [('Giant Scorpion', '🦂'), ('Sand Wyrm', '🐍'), ('Mummy', '🧟')],
+    },
+    {
+        'setting': 'graveyard',
+        'environment': 'DAMAGE',
+        'environment_emoji': '💀',
+        'story': "Cold fog coils between the tilted headstones, and cursed earth saps the strength of all who tread on it. A grave splits open and {foe} claws its way out.",
+        'monsters': [('Ghoul', '🧟'), ('Wight', '👻'), ('Bone Hound', '🐕')],
+    },
+    {
+        'setting': 'spiked cavern',
+        'environment': 'DAMAGE',
+        'environment_emoji': '⚡',
+        'story': "Crackling crystals jut from the cavern floor, arcing with wild lightning. In the flickering light waits {foe}, unbothered by the storm.",
+        'monsters': [('Storm Elemental', '🌪️'), ('Crystal Basilisk', '🦎'), ('Cave Troll', '👹')],
+    },
+]
+
+# ============================================================
+# MONSTERS - stat budget model
+# ============================================================
+
+# Baseline (weakest) stats and maximum stats, matching the monster generator prompt
+STAT_BASE = {'hp': 15, 'ac': 8, 'damage': 3, 'speed': 1}
+STAT_MAX = {'hp': 50, 'ac': 18, 'damage': 13, 'speed': 5}
+
+# Budget points needed to raise a stat by one step of its unit
+STAT_STEP = {'hp': 3, 'ac': 1, 'damage': 1, 'speed': 1}
+STAT_COST = {'hp': 1, 'ac': 1, 'damage': 1, 'speed': 2}
+
+# Points to spend on a solo monster
+MONSTER_BUDGET = 24
+
+
+def generate_monster(rng: random.Random, name: str, emoji: str, budget: int = MONSTER_BUDGET) -> dict:
+    """
+    Builds one monster by spending a point budget over HP, AC, damage and speed.
+    Each stat gets a random preference weight, so monsters differ in shape
+    (tank, glass cannon, skirmisher) while staying balanced overall.
+
+    Returns:
+        dict: A validated MonsterContent dump
+    """
+    stats = dict(STAT_BASE)
+    weights = {stat: rng.random() + 0.1 for stat in stats}
+    remaining = budget
+    while remaining > 0:
+        affordable = [
+            stat for stat in stats
+            if STAT_COST[stat] <= remaining and stats[stat] + STAT_STEP[stat] <= STAT_MAX[stat]
+        ]
+        if not affordable:
+            break
+        stat = rng.choices(affordable, weights=[weights[s] for s in affordable])[0]
+        stats[stat] += STAT_STEP[stat]
+        remaining -= STAT_COST[stat]
+
+    # Damage is an interval around the average
+    spread = rng.randint(1, 3)
+    damage = [max(1, stats['damage'] - spread), min(15, stats['damage'] + spread)]
+    monster = MonsterContent(
+        name=name,
+        monster_emoji=emoji,
+        hp=stats['hp'],
+        ac=stats['ac'],
+        damage=damage,
+        speed=stats['speed'],
+    )
+    return monster.model_dump()
+
+
+# ============================================================
+# BATTLEGROUNDS - terrain patterns
+# ============================================================
+
+def _central_pillar(rng, rows, cols):
+    r, c = rows // 2 - 1, cols // 2 - 1
+    return [(r, c), (r, c + 1), (r + 1, c), (r + 1, c + 1)]
+
+
+def _wall(rng, rows, cols):
+    length = rng.randint(4, min(5, rows - 2))
+    col = rng.randint(2, cols - 3)
+    start = rng.randint(1, rows - length - 1)
+    cells = [(start + i, col) for i in range(length)]
+    return cells if rng.random() < 0.5 else [(c, r) for r, c in cells if c < rows and r < cols]
+
+
+def _l_shape(rng, rows, cols):
+    r = rng.randint(2, rows - 4)
+    c = rng.randint(1, cols - 4)
+    arm = rng.randint(2, 3)
+    return [(r, c + i) for i in range(arm + 1)] + [(r + i, c + arm) for i in range(1, arm + 1)]
+
+
+def _cross(rng, rows, cols):
+    r, c = rows // 2, cols // 2
+    return [(r, c), (r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1)]
+
+
+def _scattered(rng, rows, cols):
+    count = rng.randint(MIN_TERRAIN_CELLS, MAX_TERRAIN_CELLS)
+    cells = set()
+    while len(cells) < count:
+        cells.add((rng.randint(1, rows - 2), rng.randint(1, cols - 2)))
+    return list(cells)
+
+
+def _noise(rng, rows, cols, count=None, cell=3):
+    """
+    Value noise: random values on a coarse lattice, bilinearly interpolated,
+    keeping the highest-valued squares. Produces organic clumps.
+    """
+    lattice_rows, lattice_cols = rows // cell + 2, cols // cell + 2
+    lattice = [[rng.random() for _ in range(lattice_cols)] for _ in range(lattice_rows)]
+    scored = []
+    for r in range(rows):
+        lr, fr = divmod(r, cell)
+        tr = fr / cell
+        for c in range(cols):
+            lc, fc = divmod(c, cell)
+            tc = fc / cell
+            top = lattice[lr][lc] * (1 - tc) + lattice[lr][lc + 1] * tc
+            bottom = lattice[lr + 1][lc] * (1 - tc) + lattice[lr + 1][lc + 1] * tc
+            scored.append((top * (1 - tr) + bottom * tr, r, c))
+    scored.sort(reverse=True)
+    count = count or rng.randint(MIN_TERRAIN_CELLS, MAX_TERRAIN_CELLS)
+    return [(r, c) for _, r, c in scored[:count]]
+
+
+PATTERNS = {
+    'central_pillar': _central_pillar,
+    'wall': _wall,
+    'l_shape': _l_shape,
+    'cross': _cross,
+    'scattered': _scattered,
+    'noise': _noise,
+}
+
+# Maps up to this size use a single pattern, as the designer prompt asks
+SMALL_MAP_LIMIT = 9
+
+
+def generate_battleground(rng: random.Random, theme: dict, size: list[int] | None = None, pattern: str | None = None) -> dict:
+    """
+    Builds a battleground for a theme. Small maps get one pattern with 4-8
+    terrain squares; large arenas are tiled with many patterns (about one
+    terrain square in eight).
+
+    Args:
+        rng: random source
+        theme: entry of THEME_LIBRARY
+        size: [rows, cols], random 7-9 if not given
+        pattern: name of a PATTERNS entry, random if not given
+
+    Returns:
+        dict: A validated BattlegroundContent dump
+    """
+    rows, cols = size or [rng.randint(7, 9), rng.randint(7, 9)]
+    large = rows > SMALL_MAP_LIMIT or cols > SMALL_MAP_LIMIT
+
+    if not large:
+        pattern_fn = PATTERNS[pattern] if pattern else rng.choice(list(PATTERNS.values()))
+        terrain = pattern_fn(rng, rows, cols)
+        max_terrain = MAX_TERRAIN_CELLS
+    else:
+        # Tile the arena with independent 9x9 features
+        max_terrain = rows * cols // 8
+        terrain = []
+        for top in range(0, rows - SMALL_MAP_LIMIT + 1, SMALL_MAP_LIMIT):
+            for left in range(0, cols - SMALL_MAP_LIMIT + 1, SMALL_MAP_LIMIT):
+                if rng.random() < 0.5:
+                    continue
+                pattern_fn = PATTERNS[pattern] if pattern else rng.choice(list(PATTERNS.values()))
+                terrain.extend(
+                    (top + r, left + c)
+                    for r, c in pattern_fn(rng, SMALL_MAP_LIMIT, SMALL_MAP_LIMIT)
+                )
+
+    # The monster starts 2-4 rows and columns below and right of the user,
+    # clamped to the map; validation then nudges it to 4-8 squares away
+    user = [rng.randint(0, rows - 1), rng.randint(0, cols - 1)]
+    monster = [min(rows - 1, user[0] + rng.randint(2, 4)), min(cols - 1, user[1] + rng.randint(2, 4))]
+
+    battleground = {
+        'size': [rows, cols],
+        'rectangle_position': [list(cell) for cell in terrain],
+        'environment': theme['environment'],
+        'environment_emoji': theme['environment_emoji'],
+        'user_position': user,
+        'monster_position': monster,
+    }
+    battleground, _ = validate_battleground(
+        battleground,
+        min_terrain=MIN_TERRAIN_CELLS,
+        max_terrain=max_terrain,
+    )
+    return BattlegroundContent.model_validate(battleground).model_dump()
+
+
+# ============================================================
+# SCENARIO
+# ============================================================
+
+def generate_scenario(encounter_size: int = 1, seed: int | None = None, size: list[int] | None = None) -> dict:
+    """
+    Generates a complete scenario in the same state layout the model
+    pipeline produces (theme, encounter, per-monster keys, battleground).
+
+    Args:
+        encounter_size: number of monsters
+        seed: optional seed for reproducible scenarios
+        size: optional [rows, cols] battleground size (up to 500x500)
+
+    Returns:
+        dict: State entries to merge into the session state
+    """
+    rng = random.Random(seed)
+    theme = rng.choice(THEME_LIBRARY)
+    encounter_size = max(1, encounter_size)
+
+    # Several monsters share the budget so the encounter stays fair
+    budget = max(4, int(MONSTER_BUDGET / encounter_size ** 0.5))
+    monsters = []
+    kinds = []
+    for index in range(encounter_size):
+        name, emoji = rng.choice(theme['monsters'])
+        kinds.append(name)
+        if encounter_size > 1:
+            name = f"{name} {index + 1}"
+        monsters.append(generate_monster(rng, name, emoji, budget))
+
+    lead = kinds[0]
+    foe = f"{'an' if lead[0].lower() in 'aeiou' else 'a'} {lead}"
+    if encounter_size > 1:
+        foe += f" with {encounter_size - 1} {'ally' if encounter_size == 2 else 'allies'}"
+    story = theme['story'].format(foe=foe)
+
+    battleground = generate_battleground(rng, theme, size)
+    ids = [monster_id(index) for index in range(encounter_size)]
+    battleground.update(place_monsters(battleground, ids, build_grid(battleground)))
+
+    scenario = {
+        'theme': story,
+        'encounter': {'monsters': monsters},
+        'monster_ids': ids,
+        'battleground': battleground,
+    }
+    for cid, monster in zip(ids, monsters):
+        scenario[cid] = monster
+    return scenario
@@ -0,0 +1,219 @@
+"""
+D&D Combat Agent - Tool-Call Profiler
+
+Records every DM tool call through the tool callbacks and flags calls that
+did not need to happen. Each flagged call is also a model round trip the
+DM did not need, so the report estimates the latency it cost. The
+findings are meant to guide prompt and tool-set tuning.
+
+Per turn (one player input = one ADK invocation) the profiler keeps the
+sequence of tool calls and detects:
+- redundant reads: a read-only tool called again with the same arguments
+  with no state-changing tool in between
+- duplicate resets: reset_turn when the turn tracker was already fresh
+- range checks before attack: check_in_range followed by attack on the
+  same pair (attack checks range itself)
+- failed calls: the tool answered success=False or with an unknown combatant
+"""
+
+import time
+from collections import OrderedDict, deque
+
+# Tools that only read state; everything else may change it
+READ_TOOLS = {
+    'check_battleground_info',
+    'check_monster_info',
+    'check_user_info',
+    'get_distance',
+    'check_in_range',
+    'check_combat_status',
+    'get_available_actions',
+    'check_turn_status',
+    'check_encounter_info',
+    'find_targets_in_range',
+    'check_line_of_sight',
+    'check_spell_slots',
+}
+
+# Cost of one wasted call when no model latency has been measured yet:
+# the model has to read the tool result and decide on the next step
+DEFAULT_ROUND_TRIP_SECONDS = 1.5
+
+# Turns kept per session, and turns that can be open at the same time
+PROFILE_TURNS_KEPT = 500
+OPEN_TURNS = 64
+
+
+def _args_key(args: dict) -> tuple:
+    return tuple(sorted((key, repr(value)) for key, value in (args or {}).items()))
+
+
+def _failed(response) -> bool:
+    if not isinstance(response, dict):
+        return False
+    if response.get('success') is False:
+        return True
+    return str(response.get('message', '')).startswith('Unknown combatant')
+
+
+def _tracker_is_fresh(state) -> bool:
+    tracker = state.get('turn_tracker', {})
+    return (
+        tracker.get('current_turn', 'user') == 'user'
+        and not tracker.get('movement_used', 0)
+        and not tracker.get('action_used', False)
+        and not tracker.get('bonus_action_used', False)
+    )
+
+
+class TurnProfile:
+    """Tool calls of one turn and what was wasted among them."""
+
+    def __init__(self, user_input: str):
+        self.user_input = user_input
+        self.calls: list[dict] = []
+        self.findings: list[dict] = []
+        self.reads_since_write: set = set()
+
+    def flag(self, kind: str, call: dict, detail: str) -> None:
+        call['wasted'] = True
+        self.findings.append({'kind': kind, 'tool': call['tool'], 'detail': detail})
+
+
+class ToolProfiler:
+    """Collects TurnProfiles per session from the tool callbacks."""
+
+    def __init__(self):
+        self.enabled = True
+        self.sessions: dict[str, deque[TurnProfile]] = {}
+        self._turns: OrderedDict = OrderedDict()  # invocation id -> profile
+        self._pending: dict[str, dict] = {}  # function call id -> call record
+
+    def _turn(self, tool_context) -> TurnProfile:
+        turn = self._turns.get(tool_context.invocation_id)
+        if turn is None:
+            content = tool_context.user_content
+            text = ' '.join(p.text for p in (content.parts or []) if p.text) if content else ''
+            turn = TurnProfile(text)
+            self._turns[tool_context.invocation_id] = turn
+            if len(self._turns) > OPEN_TURNS:
+                self._turns.popitem(last=False)
+            self.sessions.setdefault(
+                tool_context.session.id, deque(maxlen=PROFILE_TURNS_KEPT)
+            ).append(turn)
+        return turn
+
+    def start(self, tool_name: str, args: dict, tool_context) -> None:
+        """Called from before_tool_callback."""
+        if not self.enabled:
+            return
+        turn = self._turn(tool_context)
+        call = {
+            'tool': tool_name,
+            'args': dict(args or {}),
+            'started': time.monotonic(),
+            'duration': 0.0,
+            'failed': False,
+            'wasted': False,
+        }
+        turn.calls.append(call)
+        self._pending[tool_context.function_call_id] = call
+
+        if tool_name in READ_TOOLS:
+            key = (tool_name, _args_key(args))
+            if key in turn.reads_since_write:
+                turn.flag('redundant_read', call, f"{tool_name}{call['args'] or ''} repeated with no state change in between")
+            turn.reads_since_write.add(key)
+            return
+
+        if tool_name == 'reset_turn' and _tracker_is_fresh(tool_context.state):
+            turn.flag('duplicate_reset', call, "reset_turn with nothing to reset")
+        if tool_name == 'attack' and len(turn.calls) >= 2:
+            previous = turn.calls[-2]
+            if previous['tool'] == 'check_in_range' and (
+                previous['args'].get('source'), previous['args'].get('target')
+            ) == (call['args'].get('source'), call['args'].get('target')):
+                turn.flag('range_check_before_attack', previous, "check_in_range right before attack, which checks range itself")
+        turn.reads_since_write.clear()
+
+    def finish(self, tool_name: str, tool_context, response) -> None:
+        """Called from after_tool_callback."""
+        if not self.enabled:
+            return
+        call = self._pending.pop(tool_context.function_call_id, None)
+        if call is None:
+            return
+        call['duration'] = time.monotonic() - call['started']
+        if _failed(response):
+            call['failed'] = True
+            turn = self._turn(tool_context)
+            turn.findings.append({
+                'kind': 'failed_call',
+                'tool': tool_name,
+                'detail': str(response.get('message', ''))[:80],
+            })
+
+    def report(self, round_trip_seconds: float | None = None) -> dict:
+        """
+        Summarises every session.
+
+        Args:
+            round_trip_seconds: estimated model latency per tool call; the
+                measured dm_agent p50 is a good value, DEFAULT_ROUND_TRIP_SECONDS
+                is used when not given
+
+        Returns:
+            dict: {session id: {'turns', 'calls', 'per_tool', 'findings',
+            'wasted_calls', 'estimated_wasted_seconds', 'worst_turns'}}
+        """
+        round_trip = round_trip_seconds or DEFAULT_ROUND_TRIP_SECONDS
+        report = {}
+        for session_id, turns in self.sessions.items():
+            per_tool: dict[str, int] = {}
+            findings: dict[str, int] = {}
+            wasted_calls = 0
+            wasted_seconds = 0.0
+            for turn in turns:
+                for call in turn.calls:
+                    per_tool[call['tool']] = per_tool.get(call['tool'], 0) + 1
+                    if call['wasted'] or call['failed']:
+                        wasted_calls += 1
+                        wasted_seconds += round_trip + call['duration']
+                for finding in turn.findings:
+                    findings[finding['kind']] = findings.get(finding['kind'], 0) + 1
+            worst = sorted(turns, key=lambda t: len(t.findings), reverse=True)[:3]
+            report[session_id] = {
+                'turns': len(turns),
+                'calls': sum(per_tool.values()),
+                'per_tool': dict(sorted(per_tool.items(), key=lambda item: -item[1])),
+                'findings': findings,
+                'wasted_calls': wasted_calls,
+                'estimated_wasted_seconds': wasted_seconds,
+                'worst_turns': [
+                    {'input': t.user_input, 'calls': [c['tool'] for c in t.calls], 'findings': t.findings}
+                    for t in worst if t.findings
+                ],
+            }
+        return report
+
+
+def format_report(report: dict) -> list[str]:
+    """Formats ToolProfiler.report() as text lines."""
+    lines = []
+    for session_id, summary in report.items():
+        lines.append(f"Session {session_id}: {summary['turns']} turns, {summary['calls']} tool calls")
+        lines.append("  Calls per tool: " + ', '.join(f"{tool} {count}" for tool, count in summary['per_tool'].items()))
+        if summary['findings']:
+            lines.append("  Findings: " + ', '.join(f"{kind} {count}" for kind, count in summary['findings'].items()))
+        lines.append(
+            f"  Wasted: {summary['wasted_calls']} call(s), "
+            f"~{summary['estimated_wasted_seconds']:.1f}s of model round trips"
+        )
+        for turn in summary['worst_turns']:
+            lines.append(f"  Turn '{turn['input']}': {' → '.join(turn['calls'])}")
+            for finding in turn['findings']:
+                lines.append(f"    - {finding['kind']}: {finding['detail']}")
+    return lines
+
+
+profiler = ToolProfiler()
@@ -0,0 +1,582 @@
+"""
+D&D Combat Agent - Retries and Rate Limiting for Model Calls
+
+The SDK's own retry (exponential backoff with exp_base=7) waits 1s, 7s,
+49s, 343s between attempts, and every session retries in lockstep. All
+agents now share one retry layer instead:
+
+- A process-wide token bucket spaces out requests from every agent and
+  session. It adapts: each 429 halves its rate, each success slowly
+  restores it.
+- Retries use decorrelated jitter (delay drawn from [base, 3 x previous],
+  capped), so concurrent sessions spread out instead of retrying together.
+- A per-turn latency budget caps the total time one player turn may spend
+  waiting; when the next backoff would exceed it, the error is raised.
+- Metrics count calls, retries, throttles, server errors and time spent
+  waiting.
+- Opt-in hedging: when a call is slower than a percentile of its agent's
+  recent latency, a duplicate request is sent and the first answer wins.
+  Per-agent p50/p95/p99 are kept for single requests and for calls as the
+  agent saw them, so the effect on the tail is visible.
+
+`python -m subagents.resilience` runs the retry layer against FlakyEndpoint,
+a local stand-in that answers with 429/503 errors or an occasional very
+slow response, and prints the metrics with and without hedging.
+"""
+
+import asyncio
+import random
+import time
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncGenerator, Optional
+
+from google.adk.models.google_llm import Gemini
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.utils._event_loop_cache import PerLoopCachedProperty
+from google.genai import Client, errors, types
+
+from .connections import model_clients
+from .latency import LatencyRegistry
+from .tiering import classify_request, latest_user_text, tiering
+
+RETRY_STATUS_CODES = (429, 500, 503, 504)
+MAX_ATTEMPTS = 5
+BASE_DELAY = 0.5  # seconds
+MAX_DELAY = 8.0  # seconds
+
+# Total time a single player turn may spend in backoff and throttling
+TURN_BUDGET_SECONDS = 30.0
+
+# Requests per second across the whole process, and burst size
+RATE_LIMIT = 4.0
+RATE_BURST = 8
+MIN_RATE_LIMIT = 0.25
+
+# Hedging: duplicate a call once it is slower than this percentile of its
+# agent's recent requests, given enough samples, for at most this share of calls
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MAX_EXTRA_LOAD = 0.1
+
+# Retries are handled here, so the SDK client makes a single attempt
+NO_CLIENT_RETRY = types.HttpRetryOptions(attempts=1)
+
+
+# ============================================================
+# METRICS
+# ============================================================
+
+class RetryMetrics:
+    """Counters for model calls, retries and throttling."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0  # 429 responses
+        self.server_errors = 0  # 5xx responses
+        self.failures = 0  # calls that gave up
+        self.budget_exhausted = 0  # gave up because the turn budget ran out
+        self.backoff_seconds = 0.0
+        self.rate_limit_waits = 0
+        self.rate_limit_seconds = 0.0
+
+    def snapshot(self) -> dict:
+        return dict(vars(self))
+
+    def summary(self) -> str:
+        return (
+            f"{self.calls} calls, {self.retries} retries "
+            f"({self.throttled} throttled, {self.server_errors} server errors), "
+            f"{self.failures} failed ({self.budget_exhausted} over budget), "
+            f"{self.backoff_seconds:.1f}s backoff, "
+            f"{self.rate_limit_seconds:.1f}s rate limited"
+        )
+
+
+metrics = RetryMetrics()
+
+
+# ============================================================
+# RATE LIMITER
+# ============================================================
+
+class TokenBucket:
+    """
+    Adaptive token bucket shared by every model call in the process.
+
+    acquire() waits until a token is available, within the turn budget.
+    throttled() halves the refill rate (down to min_rate); succeeded() adds
+    back a tenth of the configured rate, so throughput recovers once the
+    backend does.
+    """
+
+    def __init__(self, rate: float = RATE_LIMIT, capacity: int = RATE_BURST, min_rate: float = MIN_RATE_LIMIT):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        # An asyncio.Lock binds to one event loop, so each loop gets its own
+        self._locks = weakref.WeakKeyDictionary()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        lock = self._locks.get(loop)
+        if lock is None:
+            lock = self._locks[loop] = asyncio.Lock()
+        return lock
+
+    async def acquire(self) -> float:
+        """
+        Takes one token, waiting for it if needed. The wait counts against
+        the turn budget: if the token would only come after the turn's
+        deadline, TimeoutError is raised instead of waiting.
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        waited = 0.0
+        async with self._lock():
+            self._refill()
+            while self.tokens < 1:
+                delay = (1 - self.tokens) / self.rate
+                remaining = remaining_budget()
+                if remaining is not None and delay > remaining:
+                    metrics.failures += 1
+                    metrics.budget_exhausted += 1
+                    raise TimeoutError(f"rate limited for {delay:.1f}s, past the turn budget")
+                await asyncio.sleep(delay)
+                waited += delay
+                self._refill()
+            self.tokens -= 1
+        if waited:
+            metrics.rate_limit_waits += 1
+            metrics.rate_limit_seconds += waited
+        return waited
+
+    def try_acquire(self) -> bool:
+        """Takes one token only if one is available right now."""
+        self._refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def throttled(self) -> None:
+        self.rate = max(self.min_rate, self.rate / 2)
+
+    def succeeded(self) -> None:
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+
+rate_limiter = TokenBucket()
+
+
+# ============================================================
+# RETRY POLICY
+# ============================================================
+
+_turn_deadline: ContextVar[Optional[float]] = ContextVar('turn_deadline', default=None)
+
+
+@contextmanager
+def turn_budget(seconds: float = TURN_BUDGET_SECONDS):
+    """
+    Caps the total retry and throttling time of every model call made
+    inside the block (one player turn).
+    """
+    token = _turn_deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _turn_deadline.reset(token)
+
+
+def remaining_budget() -> Optional[float]:
+    """Seconds left in the current turn budget, or None outside a turn."""
+    deadline = _turn_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def decorrelated_jitter(previous: float, base: float = BASE_DELAY, cap: float = MAX_DELAY) -> float:
+    """Next backoff delay: uniform in [base, 3 x previous], capped."""
+    return min(cap, random.uniform(base, max(base, previous * 3)))
+
+
+def status_code(exc: BaseException) -> Optional[int]:
+    """Returns the HTTP status of a retryable error, or None."""
+    code = getattr(exc, 'code', None) if isinstance(exc, errors.APIError) else None
+    return code if code in RETRY_STATUS_CODES else None
+
+
+async def backoff(exc: BaseException, attempt: int, previous_delay: float, limiter: TokenBucket = None) -> Optional[float]:
+    """
+    Decides whether a failed call may be retried and sleeps if so.
+
+    Args:
+        exc: the error raised by the call
+        attempt: number of attempts made so far (1-based)
+        previous_delay: delay before this attempt (BASE_DELAY for the first)
+        limiter: rate limiter to slow down on 429s
+
+    Returns:
+        float | None: The delay slept, or None when the caller should re-raise
+    """
+    limiter = limiter or rate_limiter
+    code = status_code(exc)
+    if code == 429:
+        metrics.throttled += 1
+        limiter.throttled()
+    elif code is not None:
+        metrics.server_errors += 1
+
+    if code is None or attempt >= MAX_ATTEMPTS:
+        metrics.failures += 1
+        return None
+
+    delay = decorrelated_jitter(previous_delay)
+    remaining = remaining_budget()
+    if remaining is not None and delay > remaining:
+        metrics.failures += 1
+        metrics.budget_exhausted += 1
+        return None
+
+    metrics.retries += 1
+    metrics.backoff_seconds += delay
+    await asyncio.sleep(delay)
+    return delay
+
+
+async def call_with_retry(fn, *args, limiter: TokenBucket = None, **kwargs):
+    """
+    Awaits fn(*args, **kwargs) under the shared rate limiter, retrying
+    retryable errors with decorrelated jitter within the turn budget.
+    """
+    limiter = limiter or rate_limiter
+    delay = BASE_DELAY
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        await limiter.acquire()
+        metrics.calls += 1
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception as exc:
+            delay = await backoff(exc, attempt, delay, limiter)
+            if delay is None:
+                raise
+            continue
+        limiter.succeeded()
+        return result
+
+
+# ============================================================
+# HEDGED REQUESTS
+# ============================================================
+
+# Latency of every single request, and of each call as its agent saw it
+request_latency = LatencyRegistry()
+call_latency = LatencyRegistry()
+
+
+class HedgePolicy:
+    """
+    Opt-in request hedging. When a call has not finished within the
+    `percentile` of its agent's recent request latency, a duplicate is
+    sent; the first to succeed wins and the other is cancelled. Hedges are
+    capped at `max_extra_load` of all calls and need a free rate-limiter
+    token, so they never queue behind regular requests.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        percentile: float = HEDGE_PERCENTILE,
+        min_samples: int = HEDGE_MIN_SAMPLES,
+        max_extra_load: float = HEDGE_MAX_EXTRA_LOAD,
+    ):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_extra_load = max_extra_load
+        self.calls = 0
+        self.hedges = 0  # duplicate requests sent
+        self.hedge_wins = 0  # calls answered by the duplicate
+
+    def trigger_delay(self, key: str) -> Optional[float]:
+        """Seconds to wait before hedging a call, or None to never hedge it."""
+        if not self.enabled:
+            return None
+        stats = request_latency.get(key)
+        if len(stats.samples) < self.min_samples:
+            return None
+        return stats.percentile(self.percentile)
+
+    def may_hedge(self) -> bool:
+        return self.hedges < self.max_extra_load * self.calls
+
+    def summary(self) -> str:
+        return f"{self.hedges} hedged of {self.calls} calls, {self.hedge_wins} won by the hedge"
+
+
+hedging = HedgePolicy()
+
+
+async def _timed(key: str, make_call):
+    started = time.monotonic()
+    result = await make_call()
+    request_latency.record(key, time.monotonic() - started)
+    return result
+
+
+async def hedged_call(make_call, key: str, policy: HedgePolicy = None, limiter: TokenBucket = None):
+    """
+    Awaits make_call() (a zero-argument coroutine factory), sending one
+    duplicate if the policy allows and the first request is slow.
+
+    Args:
+        make_call: returns a new coroutine performing the request
+        key: latency statistics key, normally the agent name
+
+    Returns:
+        The result of the first request to succeed
+    """
+    policy = policy or hedging
+    limiter = limiter or rate_limiter
+    policy.calls += 1
+    started = time.monotonic()
+    primary = asyncio.ensure_future(_timed(key, make_call))
+    tasks = {primary}
+    try:
+        delay = policy.trigger_delay(key)
+        if delay is not None:
+            await asyncio.wait(tasks, timeout=delay)
+            if not primary.done() and policy.may_hedge() and limiter.try_acquire():
+                policy.hedges += 1
+                tasks.add(asyncio.ensure_future(_timed(key, make_call)))
+
+        pending, error = tasks, None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not primary:
+                        policy.hedge_wins += 1
+                    call_latency.record(key, time.monotonic() - started)
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        # Cancel the losing request and wait for it to unwind, so its
+        # connection is released and its error is never left unretrieved
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class ResilientGemini(Gemini):
+    """
+    Gemini model whose calls go through the shared rate limiter, retry
+    policy and (when enabled) hedging of this module instead of the SDK's
+    own retries. With model tiering on, the model named on the agent is
+    replaced per request by the tier chosen in tiering.py. All instances
+    share the pooled connections of connections.py.
+    """
+
+    retry_options: Optional[types.HttpRetryOptions] = NO_CLIENT_RETRY
+
+    @PerLoopCachedProperty
+    def api_client(self) -> Client:
+        """
+        The client ADK builds for this model and event loop (base URL, API
+        version, headers, retry options, enterprise models, client_kwargs),
+        sending its requests through the loop's pooled httpx client.
+        """
+        client = Gemini.api_client.func(self)
+        if self.client is not None:
+            return client  # a client given to the model is used as it is
+        try:
+            pooled = model_clients.http_client()
+        except RuntimeError:
+            return client  # read outside an event loop: nothing to pool
+        # The http_options genai resolved from ADK's, plus the pooled client.
+        # Its own async client opens connections lazily and has none yet.
+        api = getattr(client, '_api_client', None)
+        if api is not None and hasattr(api, '_async_httpx_client'):
+            api._http_options.httpx_async_client = pooled
+            api._async_httpx_client = pooled
+        return client
+
+    async def _collect(self, llm_request: LlmRequest) -> list[LlmResponse]:
+        generate = super().generate_content_async
+        return [response async for response in generate(llm_request, False)]
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        # ADK labels every request with the calling agent
+        labels = (llm_request.config.labels if llm_request.config else None) or {}
+        key = labels.get('adk_agent_name', llm_request.model or self.model)
+
+        tier = None
+        if tiering.enabled:
+            request_class = classify_request(key, latest_user_text(llm_request.contents))
+            tier, llm_request.model = tiering.select(request_class)
+
+        delay = BASE_DELAY
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            await rate_limiter.acquire()
+            metrics.calls += 1
+            started = False
+            attempt_started = time.monotonic()
+            try:
+                if stream:
+                    async for response in super().generate_content_async(llm_request, stream):
+                        started = True
+                        yield response
+                else:
+                    for response in await hedged_call(lambda: self._collect(llm_request), key):
+                        started = True
+                        yield response
+            except Exception as exc:
+                # A partially streamed response cannot be replayed
+                if started:
+                    raise
+                delay = await backoff(exc, attempt, delay)
+                if delay is None:
+                    raise
+                continue
+            rate_limiter.succeeded()
+            if tier:
+                tiering.record(tier, time.monotonic() - attempt_started)
+            return
+
+
+# ============================================================
+# LOCAL STAND-IN
+# ============================================================
+
+class FlakyEndpoint:
+    """
+    Local stand-in for the model API. It accepts at most `capacity`
+    requests per second and answers 429 beyond that, fails a share of
+    the remaining requests with 503, answers a share after `tail_latency`
+    (a stuck request), and otherwise answers after `latency`. Used to
+    exercise the retry and hedging layers without network access.
+    """
+
+    def __init__(
+        self,
+        capacity: float = 2.0,
+        error_rate: float = 0.1,
+        latency: float = 0.05,
+        tail_rate: float = 0.0,
+        tail_latency: float = 1.0,
+    ):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.latency = latency
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.requests = 0
+        self._recent: list[float] = []
+
+    async def __call__(self, prompt: str = '') -> str:
+        self.requests += 1
+        now = time.monotonic()
+        self._recent = [t for t in self._recent if now - t < 1.0]
+        if len(self._recent) >= self.capacity:
+            raise errors.ClientError(429, {'error': {'code': 429, 'message': 'Resource exhausted', 'status': 'RESOURCE_EXHAUSTED'}})
+        self._recent.append(now)
+        slow = random.random() < self.tail_rate
+        await asyncio.sleep(self.tail_latency if slow else self.latency)
+        if random.random() < self.error_rate:
+            raise errors.ServerError(503, {'error': {'code': 503, 'message': 'Service unavailable', 'status': 'UNAVAILABLE'}})
+        return f'ok: {prompt}'
+
+
+async def simulate(
+    sessions: int = 10,
+    turns: int = 3,
+    hedge: bool = False,
+    rate: float = RATE_LIMIT,
+    **endpoint_options,
+) -> dict:
+    """
+    Plays `turns` model calls in each of `sessions` concurrent sessions
+    against a FlakyEndpoint, each turn under its own latency budget. Uses
+    a fresh rate limiter and hedge policy so the process-wide ones are
+    left untouched; metrics and latency statistics are reset first.
+
+    Returns:
+        dict: Metrics snapshot, successful/failed turn counts and the
+        call latency summary of the endpoint
+    """
+    endpoint = FlakyEndpoint(**endpoint_options)
+    limiter = TokenBucket(rate=rate, capacity=max(RATE_BURST, int(rate)))
+    policy = HedgePolicy(enabled=hedge)
+    metrics.reset()
+    request_latency.reset()
+    call_latency.reset()
+    outcomes = {'succeeded': 0, 'failed': 0}
+
+    async def session(index: int):
+        for turn in range(turns):
+            prompt = f'session {index} turn {turn}'
+            with turn_budget():
+                try:
+                    await call_with_retry(
+                        hedged_call, lambda: endpoint(prompt), 'endpoint',
+                        policy=policy, limiter=limiter,
+                    )
+                    outcomes['succeeded'] += 1
+                except errors.APIError:
+                    outcomes['failed'] += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(session(i) for i in range(sessions)))
+    report = metrics.snapshot()
+    report.update(
+        outcomes,
+        elapsed=time.monotonic() - started,
+        endpoint_requests=endpoint.requests,
+        final_rate=limiter.rate,
+        hedges=policy.hedges,
+        hedge_wins=policy.hedge_wins,
+        latency=call_latency.get('endpoint').summary(),
+    )
+    return report
+
+
+if __name__ == '__main__':
+    print("Throttling and server errors:")
+    result = asyncio.run(simulate())
+    print(f"  {metrics.summary()}")
+    print(
+        f"  turns: {result['succeeded']} succeeded, {result['failed']} failed in {result['elapsed']:.1f}s, "
+        f"limiter settled at {result['final_rate']:.2f} req/s"
+    )
+
+    print("Slow tail (2% of requests take 1s), without and with hedging:")
+    for hedge in (False, True):
+        result = asyncio.run(simulate(
+            sessions=20, turns=20, hedge=hedge, rate=1000,
+            capacity=1000, error_rate=0.0, tail_rate=0.02,
+        ))
+        latency = {p: result['latency'][p] * 1000 for p in ('p50', 'p95', 'p99')}
+        print(
+            f"  hedging {'on ' if hedge else 'off'}: p50 {latency['p50']:.0f} ms, "
+            f"p95 {latency['p95']:.0f} ms, p99 {latency['p99']:.0f} ms, "
+            f"{result['hedges']} hedges ({result['hedge_wins']} won)"
+        )
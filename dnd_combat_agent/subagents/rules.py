@@ -0,0 +1,932 @@
+"""
+D&D Combat Agent - Combat Rules Engine
+
+The rules of combat as plain functions of the game state: movement,
+melee attacks, spells, terrain, the turn economy and the win check.
+Every function takes the state dict first, reads and writes it the
+way the session state is read and written (sub-dicts are replaced,
+never modified in place), and returns a result dict with a 'message'
+for the narration.
+
+Nothing here imports the agent framework. The agent tools in tools.py
+are thin adapters that pass `tool_context.state` in, while the
+rules-first pipeline, the policies, the search AI and the tournament
+call these functions on plain dicts, so the same code runs everywhere.
+"""
+
+import random
+from collections import OrderedDict
+
+from .grid import get_grid
+from .visibility import get_visibility, in_area
+from .encounter import (
+    USER_ID,
+    attributes_key,
+    display_name,
+    enemies_of,
+    get_attributes,
+    get_position,
+    get_spatial_index,
+    living_monsters,
+    monster_ids,
+    next_in_initiative,
+    position_key,
+    resolve_combatant,
+)
+
+DIRECTION_DELTAS = {
+    'north': [-1, 0],
+    'south': [1, 0],
+    'east': [0, 1],
+    'west': [0, -1],
+    'northeast': [-1, 1],
+    'northwest': [-1, -1],
+    'southeast': [1, 1],
+    'southwest': [1, -1],
+}
+STEP_NAMES = {tuple(delta): name for name, delta in DIRECTION_DELTAS.items()}
+
+# Move sets kept by reachable_moves
+REACH_CACHE_SIZE = 512
+
+_reach_cache: OrderedDict = OrderedDict()
+
+
+# ============================================================
+# MOVEMENT, ATTACKS AND TERRAIN
+# ============================================================
+
+def get_distance(coordinate1: list[int], coordinate2: list[int]) -> dict:
+    """Manhattan distance between two [row, col] coordinates, as {'distance': int}."""
+    distance = abs(coordinate1[0] - coordinate2[0]) + abs(coordinate1[1] - coordinate2[1])
+    return {
+        'distance': distance,
+    }
+
+
+def check_in_range(state: dict, source: str, target: str, attack_range: int) -> dict:
+    """Whether the target is within attack_range (Manhattan) of the source."""
+    source_id = resolve_combatant(source, state)
+    target_id = resolve_combatant(target, state)
+    if source_id is None or target_id is None:
+        return {
+            'in_range': False,
+            'distance': None,
+            'message': f"Unknown combatant: {source if source_id is None else target}",
+        }
+    
+    source_pos = get_position(state, source_id)
+    target_pos = get_position(state, target_id)
+    
+    distance = abs(source_pos[0] - target_pos[0]) + abs(source_pos[1] - target_pos[1])
+    
+    return {
+        'in_range': distance <= attack_range,
+        'distance': distance,
+    }
+
+
+def attack(state: dict, source: str, target: str) -> dict:
+    """
+    Resolves one melee attack: a d20 against the target's AC, then the
+    source's damage range on a hit. The user's attack uses their action.
+    """
+    source_id = resolve_combatant(source, state)
+    target_id = resolve_combatant(target, state)
+    if source_id is None or target_id is None:
+        return {
+            'success': False,
+            'message': f"Unknown combatant: {source if source_id is None else target}",
+        }
+    
+    # For user attacks, check if action is available
+    if source_id == USER_ID:
+        tracker = state.get('turn_tracker', {})
+        action_used = tracker.get('action_used', False)
+        
+        if action_used:
+            return {
+                'success': False,
+                'message': 'You have already used your action this turn!',
+            }
+    
+    # Get source and target attributes
+    source_attributes = get_attributes(state, source_id)
+    source_name = display_name(state, source_id)
+    target_attributes = get_attributes(state, target_id)
+    target_name = display_name(state, target_id)
+    
+    if target_attributes['hp'] <= 0:
+        return {
+            'success': False,
+            'message': f"{target_name} is already defeated!",
+        }
+    
+    # Get attack stats
+    damage_range = source_attributes['damage']
+    
+    # Check if in range (melee range = 1)
+    range_check = check_in_range(state, source_id, target_id, 1)
+    if not range_check['in_range']:
+        return {
+            'success': False,
+            'hit': False,
+            'damage': 0,
+            'message': f"Attack failed! {source_name} is too far from {target_name} (distance: {range_check['distance']})",
+        }
+    
+    # Roll d20 for attack
+    attack_roll = random.randint(1, 20)
+    target_ac = target_attributes['ac']
+    
+    # Check if hit
+    hit = attack_roll >= target_ac
+    
+    damage = 0
+    new_hp = target_attributes['hp']
+    current_hp = target_attributes['hp']
+
+    if hit:
+        # Calculate damage
+        damage = random.randint(damage_range[0], damage_range[1])
+        
+        # Update target HP
+        new_hp = max(0, current_hp - damage)
+        
+        # Update state - replace entire dict to ensure change is detected
+        target_copy = dict(target_attributes)
+        target_copy['hp'] = new_hp
+        state[attributes_key(target_id)] = target_copy
+    
+    critical = attack_roll == 20
+    message = f"{source_name} attacks {target_name}! Rolled {attack_roll} vs AC {target_ac}. "
+    
+    if hit:
+        message += f"Hit! Deals {damage} damage! {target_name}'s HP: {current_hp} → {new_hp}"
+    else:
+        message += "Miss!"
+    
+    # Mark action as used for user attacks
+    if source_id == USER_ID:
+        tracker_copy = dict(state.get('turn_tracker', {}))
+        tracker_copy['action_used'] = True
+        state['turn_tracker'] = tracker_copy
+    
+    return {
+        'success': True,
+        'hit': hit,
+        'damage': damage if hit else 0,
+        'attack_roll': attack_roll,
+        'target_ac': target_ac,
+        'critical': critical,
+        'new_hp': new_hp,
+        'message': message,
+    }
+
+
+def move_character(state: dict, character: str, direction: str) -> dict:
+    """
+    Moves a combatant one step. Bounds, BLOCKED terrain, occupied squares
+    and speed are checked; the user's steps count against their movement.
+    """
+    battleground = state.get('battleground', {})
+    
+    character_id = resolve_combatant(character, state)
+    if character_id is None:
+        return {
+            'success': False,
+            'message': f"Unknown combatant: {character}",
+        }
+    
+    # Get character attributes and position
+    char_attributes = get_attributes(state, character_id)
+    current_pos = get_position(state, character_id)
+    char_name = display_name(state, character_id)
+    
+    # Calculate new position based on direction
+    if direction.lower() not in DIRECTION_DELTAS:
+        return {
+            'success': False,
+            'message': f"Invalid direction: {direction}. Use: north, south, east, west, northeast, northwest, southeast, southwest",
+        }
+    
+    delta = DIRECTION_DELTAS[direction.lower()]
+    new_pos = [current_pos[0] + delta[0], current_pos[1] + delta[1]]
+    
+    # Check bounds and BLOCKED terrain with O(1) grid lookups
+    grid = get_grid(battleground)
+    if not grid.in_bounds(new_pos[0], new_pos[1]):
+        return {
+            'success': False,
+            'message': f"{char_name} cannot move {direction} - out of bounds!",
+        }
+    
+    if grid.is_blocked(new_pos[0], new_pos[1]):
+        return {
+            'success': False,
+            'message': f"{char_name} cannot move there - blocked by terrain!",
+        }
+    
+    # Check the square is not occupied by another combatant
+    occupant = get_spatial_index(state).occupant(new_pos)
+    if occupant is not None and occupant != character_id:
+        return {
+            'success': False,
+            'message': f"{char_name} cannot move there - occupied by {display_name(state, occupant)}!",
+        }
+    
+    # Check speed (movement distance)
+    distance = abs(delta[0]) + abs(delta[1])
+    speed = char_attributes['speed']
+    
+    # For user movement, check turn tracker
+    if character_id == USER_ID:
+        tracker = state.get('turn_tracker', {})
+        movement_used = tracker.get('movement_used', 0)
+        movement_remaining = speed - movement_used
+        
+        if distance > movement_remaining:
+            return {
+                'success': False,
+                'message': f"{char_name} cannot move {distance} squares! Only {movement_remaining} movement remaining this turn (used {movement_used}/{speed})",
+            }
+    else:
+        # Monster movement - just check against speed
+        if distance > speed:
+            return {
+                'success': False,
+                'message': f"{char_name} cannot move that far! Speed: {speed}, Distance: {distance}",
+            }
+    
+    # Update position - replace the entire battleground to ensure change is detected
+    battleground_copy = dict(battleground)  # Shallow copy is fine for top-level dict
+    battleground_copy[position_key(character_id)] = new_pos
+    if character_id == USER_ID:
+        # Update movement tracker for user
+        tracker_copy = dict(state.get('turn_tracker', {}))
+        tracker_copy['movement_used'] = tracker_copy.get('movement_used', 0) + distance
+        state['turn_tracker'] = tracker_copy
+    
+    state['battleground'] = battleground_copy
+    
+    return {
+        'success': True,
+        'old_position': current_pos,
+        'new_position': new_pos,
+        'distance_moved': distance,
+        'message': f"{char_name} moves {direction} from {current_pos} to {new_pos}",
+    }
+
+
+def apply_terrain_effects(state: dict, character: str) -> dict:
+    """Deals 1d4 to a combatant standing on DAMAGE terrain."""
+    battleground = state.get('battleground', {})
+    
+    character_id = resolve_combatant(character, state)
+    if character_id is None:
+        return {
+            'in_terrain': False,
+            'effects': [],
+            'message': f"Unknown combatant: {character}",
+        }
+    
+    # Get character position
+    char_pos = get_position(state, character_id)
+    char_attributes = get_attributes(state, character_id)
+    char_name = display_name(state, character_id)
+    
+    # Check if character is on special terrain
+    layer = get_grid(battleground).layer_at(char_pos[0], char_pos[1])
+    
+    if layer is None:
+        return {
+            'in_terrain': False,
+            'effects': [],
+            'message': f'{char_name} is on normal ground - no terrain effects'
+        }
+    
+    # Apply effects based on terrain type
+    effects = []
+    environment = layer['environment']
+    environment_emoji = layer['environment_emoji']
+    
+    if environment == 'BLOCKED':
+        # BLOCKED terrain doesn't deal damage, just blocks movement
+        return {
+            'in_terrain': True,
+            'environment': 'BLOCKED',
+            'effects': [],
+            'message': f'{char_name} is on blocked terrain (no damage)'
+        }
+    
+    elif environment == 'DAMAGE':
+        # Roll 1d4 damage
+        damage = random.randint(1, 4)
+        current_hp = char_attributes['hp']
+        new_hp = max(0, current_hp - damage)
+        
+        # Update HP - replace entire dict to ensure change is detected
+        char_attrs_copy = dict(char_attributes)
+        char_attrs_copy['hp'] = new_hp
+        state[attributes_key(character_id)] = char_attrs_copy
+        
+        effects.append(f'DAMAGE: {damage} damage from terrain')
+        
+        return {
+            'in_terrain': True,
+            'environment': 'DAMAGE',
+            'effects': effects,
+            'message': f'{char_name} takes {damage} damage from {environment_emoji} terrain! HP: {current_hp} → {new_hp}'
+        }
+    
+    else:
+        return {
+            'in_terrain': True,
+            'environment': environment,
+            'effects': [],
+            'message': f'{char_name} is on {environment} terrain'
+        }
+    
+
+
+def check_combat_status(state: dict) -> dict:
+    """'ongoing', 'user_won' (every monster down) or 'monster_won'."""
+    user_attributes = state.get('user_attributes', {})
+    monster = state.get('monster', {})
+    
+    user_hp = user_attributes.get('hp', 0)
+    monster_hp = monster.get('hp', 0)
+    monster_name = monster.get('name', 'Monster')
+    remaining = living_monsters(state)
+    
+    if user_hp <= 0:
+        return {
+            'status': 'monster_won',
+            'winner': 'monster',
+            'message': f"💀 You have been defeated by {monster_name}! Game Over!",
+        }
+    
+    if not remaining:
+        return {
+            'status': 'user_won',
+            'winner': 'user',
+            'message': f"🎉 Victory! You have defeated {monster_name}!",
+        }
+    
+    if len(monster_ids(state)) == 1:
+        return {
+            'status': 'ongoing',
+            'winner': None,
+            'user_hp': user_hp,
+            'monster_hp': monster_hp,
+            'message': f"Battle continues! Your HP: {user_hp}, {monster_name}'s HP: {monster_hp}",
+        }
+    
+    monsters_hp = {
+        cid: get_attributes(state, cid).get('hp', 0) for cid in remaining
+    }
+    return {
+        'status': 'ongoing',
+        'winner': None,
+        'user_hp': user_hp,
+        'monsters_hp': monsters_hp,
+        'message': f"Battle continues! Your HP: {user_hp}, {len(remaining)} monsters remaining",
+    }
+
+
+def movement_remaining(state: dict, character_id: str) -> int:
+    """Squares the combatant may still move: the user's tracked movement, a monster's speed."""
+    speed = get_attributes(state, character_id)['speed']
+    if character_id == USER_ID:
+        return max(0, speed - state.get('turn_tracker', {}).get('movement_used', 0))
+    return speed
+
+
+def reachable_moves(grid, start: tuple, budget: int, occupied: frozenset, enemies: frozenset) -> dict:
+    """
+    Every square reachable from `start` with at most `budget` movement, by
+    steps move_character accepts: orthogonal steps cost 1 and diagonal steps
+    2, onto in-bounds squares that are neither BLOCKED nor occupied.
+
+    Breadth-first by movement cost (one queue per cost, as steps cost 1 or
+    2), so each square is settled at its cheapest cost. Results are cached
+    per (terrain, start, budget, occupied and enemy squares); callers must
+    not modify them.
+
+    Returns:
+        dict: 'cells' ({(row, col): (cost, previous square)}), 'options'
+        (directions of the single steps possible now), 'reachable'
+        ([row, col, cost] per square other than the start) and
+        'attack_from' ((cost, square, directions) of the cheapest square
+        next to an enemy, or None)
+    """
+    key = (grid, start, budget, occupied, enemies)
+    moves = _reach_cache.get(key)
+    if moves is not None:
+        _reach_cache.move_to_end(key)
+        return moves
+    cells = {start: (0, None)}
+    frontiers = [[start]] + [[] for _ in range(budget)]
+    for cost, frontier in enumerate(frontiers):
+        for cell in frontier:
+            if cells[cell][0] != cost:
+                continue  # settled cheaper from another queue
+            for dr, dc in DIRECTION_DELTAS.values():
+                step = cost + abs(dr) + abs(dc)
+                nxt = (cell[0] + dr, cell[1] + dc)
+                if (
+                    step <= budget
+                    and (nxt not in cells or cells[nxt][0] > step)
+                    and grid.in_bounds(nxt[0], nxt[1])
+                    and not grid.is_blocked(nxt[0], nxt[1])
+                    and nxt not in occupied
+                ):
+                    cells[nxt] = (step, cell)
+                    frontiers[step].append(nxt)
+
+    adjacent = {(r + dr, c + dc) for r, c in enemies for dr, dc in ((1, 0), (-1, 0), (0, 1), (0, -1))}
+    attack_from = min(((cells[cell][0], cell) for cell in adjacent if cell in cells), default=None)
+    moves = {
+        'cells': cells,
+        'options': [
+            name for name, (dr, dc) in DIRECTION_DELTAS.items() if (start[0] + dr, start[1] + dc) in cells
+        ],
+        'reachable': [[cell[0], cell[1], cost] for cell, (cost, _) in sorted(cells.items()) if cost],
+        'attack_from': attack_from and (*attack_from, _route(cells, attack_from[1])),
+    }
+    _reach_cache[key] = moves
+    if len(_reach_cache) > REACH_CACHE_SIZE:
+        _reach_cache.popitem(last=False)
+    return moves
+
+
+def _route(cells: dict, cell: tuple) -> list[str]:
+    """Directions from the start to `cell`, as move_character takes them."""
+    route = []
+    while cells[cell][1] is not None:
+        previous = cells[cell][1]
+        route.append(STEP_NAMES[(cell[0] - previous[0], cell[1] - previous[1])])
+        cell = previous
+    return route[::-1]
+
+
+def get_available_actions(state: dict, character: str) -> dict:
+    """
+    The legal moves of a combatant for the rest of its turn: single steps
+    it can take now, every square it can reach with its remaining movement,
+    and whether it can attack the nearest enemy now or, failing that, any
+    enemy after moving (the attack's target is then the enemy next to the
+    square it moves to).
+    """
+    character_id = resolve_combatant(character, state) or USER_ID
+    start = tuple(get_position(state, character_id))
+    grid = get_grid(state.get('battleground', {}))
+    index = get_spatial_index(state)
+    enemy_ids = set(enemies_of(state, character_id))
+    occupied = frozenset(pos for cid, pos in index.positions.items() if cid != character_id)
+    enemies = frozenset(pos for cid, pos in index.positions.items() if cid in enemy_ids)
+    budget = movement_remaining(state, character_id)
+    moves = reachable_moves(grid, start, budget, occupied, enemies)
+    
+    nearest = index.nearest(list(start), enemy_ids)
+    target_id = nearest[1] if nearest else None
+    distance_to_target = nearest[0] if nearest else None
+    in_range = distance_to_target is not None and distance_to_target <= 1
+    action_available = character_id != USER_ID or not state.get('turn_tracker', {}).get('action_used', False)
+    
+    actions = [{
+        'action': 'move',
+        'options': moves['options'],
+        'movement_remaining': budget,
+        'reachable': moves['reachable'],
+    }]
+    attack_action = {
+        'action': 'attack',
+        'target': target_id,
+        'in_range': in_range,
+        'available': action_available,
+        'after_move': action_available and not in_range and moves['attack_from'] is not None,
+    }
+    if not in_range:
+        attack_action['distance'] = distance_to_target
+    if attack_action['after_move']:
+        _, cell, path = moves['attack_from']
+        attack_action['move_to'] = list(cell)
+        attack_action['path'] = path
+        # The cheapest square next to an enemy need not be next to the
+        # nearest one; the attack goes to an enemy beside that square
+        beside = [cid for _, cid in index.within(list(cell), 1, enemy_ids)]
+        if target_id not in beside:
+            attack_action['target'] = beside[0]
+            row, col = index.positions[beside[0]]
+            attack_action['distance'] = abs(row - start[0]) + abs(col - start[1])
+    actions.append(attack_action)
+    
+    if not action_available:
+        attack_note = 'action already used'
+    elif in_range:
+        attack_note = f"can attack {display_name(state, target_id)} now"
+    elif attack_action['after_move']:
+        attack_note = (
+            f"can attack {display_name(state, attack_action['target'])} "
+            f"after moving {', '.join(attack_action['path'])}"
+        )
+    else:
+        attack_note = 'no enemy within reach this turn'
+    return {
+        'actions': actions,
+        'target': target_id,
+        'distance_to_target': distance_to_target,
+        'message': (
+            f"{display_name(state, character_id)}: {budget} movement left, "
+            f"{len(moves['reachable'])} squares reachable; {attack_note}"
+        ),
+    }
+
+
+# ============================================================
+# TURN TRACKING - Action Economy System
+# ============================================================
+
+def reset_turn(state: dict) -> dict:
+    """Starts the user's turn with movement, action and bonus action unused."""
+    # Initialize turn tracker if it doesn't exist
+    if 'turn_tracker' not in state:
+        state['turn_tracker'] = {}
+    
+    # Reset all action tracking
+    tracker_copy = dict(state.get('turn_tracker', {}))
+    tracker_copy['current_turn'] = 'user'
+    tracker_copy['movement_used'] = 0
+    tracker_copy['action_used'] = False
+    tracker_copy['bonus_action_used'] = False
+    
+    state['turn_tracker'] = tracker_copy
+    
+    return {
+        'success': True,
+        'message': 'User turn started. All actions reset.',
+        'turn_tracker': tracker_copy
+    }
+
+
+def check_turn_status(state: dict) -> dict:
+    """Movement, action and bonus action left in the user's turn."""
+    tracker = state.get('turn_tracker', {})
+    user_attributes = state.get('user_attributes', {})
+    
+    movement_used = tracker.get('movement_used', 0)
+    action_used = tracker.get('action_used', False)
+    bonus_action_used = tracker.get('bonus_action_used', False)
+    
+    max_movement = user_attributes['speed']
+    movement_remaining = max(0, max_movement - movement_used)
+    
+    return {
+        'current_turn': tracker.get('current_turn', 'user'),
+        'movement_remaining': movement_remaining,
+        'movement_used': movement_used,
+        'max_movement': max_movement,
+        'action_available': not action_used,
+        'bonus_action_available': not bonus_action_used,
+        'message': f"Movement: {movement_remaining}/{max_movement} | Action: {'Available' if not action_used else 'Used'} | Bonus: {'Available' if not bonus_action_used else 'Used'}"
+    }
+
+
+def end_user_turn(state: dict) -> dict:
+    """Passes the turn from the user to the next combatant in initiative."""
+    tracker_copy = dict(state.get('turn_tracker', {}))
+    next_turn = next_in_initiative(state, USER_ID)
+    tracker_copy['current_turn'] = next_turn
+    
+    state['turn_tracker'] = tracker_copy
+    
+    return {
+        'success': True,
+        'turn_switched': True,
+        'current_turn': next_turn,
+        'message': f'User turn ended. {display_name(state, next_turn)} ({next_turn}) turn begins.'
+    }
+
+
+def advance_turn(state: dict) -> dict:
+    """
+    Passes the turn to the next living combatant in initiative. Coming back
+    to the user starts a new round and resets the user's action economy.
+    """
+    tracker_copy = dict(state.get('turn_tracker', {}))
+    current = tracker_copy.get('current_turn', USER_ID)
+    next_turn = next_in_initiative(state, current)
+    tracker_copy['current_turn'] = next_turn
+    
+    if next_turn == USER_ID:
+        tracker_copy['movement_used'] = 0
+        tracker_copy['action_used'] = False
+        tracker_copy['bonus_action_used'] = False
+        tracker_copy['round'] = tracker_copy.get('round', 1) + 1
+    
+    state['turn_tracker'] = tracker_copy
+    
+    return {
+        'success': True,
+        'current_turn': next_turn,
+        'initiative': tracker_copy.get('initiative', []),
+        'message': f"{display_name(state, next_turn)} ({next_turn}) turn begins."
+    }
+
+
+# ============================================================
+# ENCOUNTER - Multiple Monsters
+# ============================================================
+
+def check_encounter_info(state: dict) -> dict:
+    """Every monster's stats and position, the initiative order and current turn."""
+    monsters = {}
+    for cid in monster_ids(state):
+        attributes = get_attributes(state, cid)
+        monsters[cid] = {
+            'name': attributes['name'],
+            'hp': attributes['hp'],
+            'ac': attributes['ac'],
+            'speed': attributes['speed'],
+            'position': get_position(state, cid),
+            'alive': attributes['hp'] > 0,
+        }
+    tracker = state.get('turn_tracker', {})
+    return {
+        'monsters': monsters,
+        'user_position': get_position(state, USER_ID),
+        'initiative': tracker.get('initiative', [USER_ID] + monster_ids(state)),
+        'current_turn': tracker.get('current_turn', USER_ID),
+    }
+
+
+def find_targets_in_range(state: dict, source: str, attack_range: int) -> dict:
+    """Enemies of the source within attack_range, nearest first."""
+    source_id = resolve_combatant(source, state)
+    if source_id is None:
+        return {
+            'targets': [],
+            'message': f"Unknown combatant: {source}",
+        }
+    
+    found = get_spatial_index(state).within(
+        get_position(state, source_id),
+        attack_range,
+        set(enemies_of(state, source_id)),
+    )
+    targets = [
+        {'id': cid, 'name': display_name(state, cid), 'distance': distance}
+        for distance, cid in found
+    ]
+    return {
+        'targets': targets,
+        'message': f"{len(targets)} target(s) within {attack_range} of {display_name(state, source_id)}",
+    }
+
+
+# ============================================================
+# SPELL CASTING
+# ============================================================
+
+# Spell properties. Ranges and area radii are in squares (5 ft each).
+SPELL_DATA = {
+    'magic_missile': {
+        'level': 1,
+        'type': 'damage',
+        'damage': [6, 10],  # 2d4+2 ≈ 6-10 damage
+        'action_type': 'action',
+        'range': 24,  # 120 ft
+        'description': 'Three glowing darts of magical force'
+    },
+    'fireball': {
+        'level': 2,
+        'type': 'damage',
+        'damage': [12, 24],  # 8d6 ≈ 12-24 damage
+        'action_type': 'action',
+        'range': 30,  # 150 ft
+        'area': {'shape': 'sphere', 'radius': 4},  # 20 ft radius, hits every monster inside
+        'description': 'A bright streak flashes to a point and blossoms into an explosion of flame'
+    },
+    'heal': {
+        'level': 1,
+        'type': 'heal',
+        'healing': [6, 10],  # 2d4+2
+        'action_type': 'bonus_action',
+        'range': 0,  # Self
+        'description': 'Healing energy radiates from your hands'
+    }
+}
+
+
+def cast_spell(state: dict, spell_name: str, target: str) -> dict:
+    """
+    Casts one of the user's spells (see SPELL_DATA). Damage spells need the
+    target in range and in line of sight; area spells hit every monster
+    in the area, never the caster. Uses a spell slot and the spell's action.
+    """
+    user_attributes = state.get('user_attributes', {})
+    
+    # Check if user is a wizard
+    if user_attributes.get('class') != 'wizard':
+        return {
+            'success': False,
+            'message': 'Only wizards can cast spells!'
+        }
+    
+    spell_name = spell_name.lower()
+    
+    # Check if spell is known
+    spells_known = user_attributes.get('spells_known', [])
+    if spell_name not in spells_known:
+        return {
+            'success': False,
+            'message': f'Spell "{spell_name}" is not known!'
+        }
+    
+    if spell_name not in SPELL_DATA:
+        return {
+            'success': False,
+            'message': f'Unknown spell: {spell_name}'
+        }
+    
+    spell = SPELL_DATA[spell_name]
+    spell_level = spell['level']
+    
+    # Check spell slots
+    spell_slots = user_attributes.get('spell_slots', {})
+    slot_key = f'level_{spell_level}'
+    slots_remaining = spell_slots.get(slot_key, 0)
+    
+    if slots_remaining <= 0:
+        return {
+            'success': False,
+            'message': f'No level {spell_level} spell slots remaining!'
+        }
+    
+    # Check action economy
+    tracker = state.get('turn_tracker', {})
+    
+    if spell['action_type'] == 'action':
+        if tracker.get('action_used', False):
+            return {
+                'success': False,
+                'message': 'You have already used your action this turn!'
+            }
+    elif spell['action_type'] == 'bonus_action':
+        if tracker.get('bonus_action_used', False):
+            return {
+                'success': False,
+                'message': 'You have already used your bonus action this turn!'
+            }
+    
+    # Cast the spell!
+    result_message = ""
+    
+    if spell['type'] == 'damage':
+        # Damage spell - default to the first living monster if no monster was named
+        target_id = resolve_combatant(target, state)
+        if target_id in (None, USER_ID):
+            remaining = living_monsters(state)
+            target_id = remaining[0] if remaining else monster_ids(state)[0]
+        monster = get_attributes(state, target_id)
+        if monster['hp'] <= 0:
+            return {
+                'success': False,
+                'message': f"{monster['name']} is already defeated!"
+            }
+        
+        # Check range and line of sight from the caster
+        caster_pos = get_position(state, USER_ID)
+        target_pos = get_position(state, target_id)
+        distance = abs(caster_pos[0] - target_pos[0]) + abs(caster_pos[1] - target_pos[1])
+        if distance > spell['range']:
+            return {
+                'success': False,
+                'message': f"{monster['name']} is out of range! Distance: {distance}, {spell_name} range: {spell['range']}"
+            }
+        grid = get_grid(state.get('battleground', {}))
+        if not get_visibility(grid).visible(caster_pos, target_pos):
+            return {
+                'success': False,
+                'message': f"No line of sight to {monster['name']} - blocked by terrain!"
+            }
+        
+        # Area spells hit every monster in the blast (the caster shapes it
+        # around themself), single-target spells only the target
+        if 'area' in spell:
+            shape, radius = spell['area']['shape'], spell['area']['radius']
+            candidates = get_spatial_index(state).within(target_pos, 2 * radius)
+            targets_hit = [
+                cid for _, cid in candidates
+                if cid != USER_ID and in_area(grid, target_pos, shape, radius, get_position(state, cid))
+            ]
+        else:
+            targets_hit = [target_id]
+        
+        damage = random.randint(spell['damage'][0], spell['damage'][1])
+        hit_messages = []
+        for cid in targets_hit:
+            attributes = get_attributes(state, cid)
+            current_hp = attributes['hp']
+            new_hp = max(0, current_hp - damage)
+            
+            # Update HP - replace entire dict to ensure change is detected
+            attributes_copy = dict(attributes)
+            attributes_copy['hp'] = new_hp
+            state[attributes_key(cid)] = attributes_copy
+            hit_messages.append(f"{display_name(state, cid)} HP: {current_hp} → {new_hp}")
+        
+        names = ', '.join(display_name(state, cid) for cid in targets_hit)
+        result_message = f"You cast {spell_name.replace('_', ' ').title()}! {spell['description']}. Deals {damage} damage to {names}! {'; '.join(hit_messages)}"
+        
+    elif spell['type'] == 'heal':
+        # Healing spell
+        healing = random.randint(spell['healing'][0], spell['healing'][1])
+        current_hp = user_attributes['hp']
+        max_hp = user_attributes.get('max_hp', current_hp + 10)  # Estimate max HP
+        new_hp = min(max_hp, current_hp + healing)
+        actual_healing = new_hp - current_hp
+        
+        # Update user HP
+        user_attrs_copy = dict(user_attributes)
+        user_attrs_copy['hp'] = new_hp
+        state['user_attributes'] = user_attrs_copy
+        
+        result_message = f"You cast Heal! {spell['description']}.  You heal {actual_healing} HP! HP: {current_hp} → {new_hp}"
+    
+    # Use spell slot
+    user_attrs_copy = dict(state.get('user_attributes', {}))
+    spell_slots_copy = dict(user_attrs_copy.get('spell_slots', {}))
+    spell_slots_copy[slot_key] = slots_remaining - 1
+    user_attrs_copy['spell_slots'] = spell_slots_copy
+    state['user_attributes'] = user_attrs_copy
+    
+    # Mark action/bonus action as used
+    tracker_copy = dict(tracker)
+    if spell['action_type'] == 'action':
+        tracker_copy['action_used'] = True
+    elif spell['action_type'] == 'bonus_action':
+        tracker_copy['bonus_action_used'] = True
+    state['turn_tracker'] = tracker_copy
+    
+    result = {
+        'success': True,
+        'spell_name': spell_name,
+        'spell_level': spell_level,
+        'action_type': spell['action_type'],
+        'slots_remaining': slots_remaining - 1,
+        'message': result_message
+    }
+    if spell['type'] == 'damage':
+        result['targets_hit'] = targets_hit
+    return result
+
+
+def check_line_of_sight(state: dict, source: str, target: str) -> dict:
+    """Line of sight from source to target and the damage spells that reach it."""
+    source_id = resolve_combatant(source, state)
+    target_id = resolve_combatant(target, state)
+    if source_id is None or target_id is None:
+        return {
+            'line_of_sight': False,
+            'message': f"Unknown combatant: {source if source_id is None else target}",
+        }
+    
+    source_pos = get_position(state, source_id)
+    target_pos = get_position(state, target_id)
+    distance = abs(source_pos[0] - target_pos[0]) + abs(source_pos[1] - target_pos[1])
+    grid = get_grid(state.get('battleground', {}))
+    visible = get_visibility(grid).visible(source_pos, target_pos)
+    
+    spells_in_range = [
+        name for name, spell in SPELL_DATA.items()
+        if spell['type'] == 'damage' and visible and distance <= spell['range']
+    ]
+    return {
+        'line_of_sight': visible,
+        'distance': distance,
+        'spells_in_range': spells_in_range,
+        'message': f"{'Clear' if visible else 'No'} line of sight at distance {distance}",
+    }
+
+
+def check_spell_slots(state: dict) -> dict:
+    """The wizard's remaining spell slots and known spells."""
+    user_attributes = state.get('user_attributes', {})
+    
+    if user_attributes.get('class') != 'wizard':
+        return {
+            'is_wizard': False,
+            'message': 'Not a wizard - no spell slots'
+        }
+    
+    spell_slots = user_attributes.get('spell_slots', {})
+    spells_known = user_attributes.get('spells_known', [])
+    
+    return {
+        'is_wizard': True,
+        'spell_slots': spell_slots,
+        'spells_known': spells_known,
+        'message': f"Spell slots: Level 1: {spell_slots.get('level_1', 0)}, Level 2: {spell_slots.get('level_2', 0)}"
+    }
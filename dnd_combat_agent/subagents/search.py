@@ -0,0 +1,412 @@
+"""
+D&D Combat Agent - Search-Based Monster Policy
+
+The DM prompt plays monsters with a paragraph of advice ("move closer,
+be tactical with terrain"). This module lets harder monsters search for
+their move instead, with no model call:
+
+- Expectimax: every square the monster can reach is scored by the
+  expected value of the position after its turn. The value averages over
+  the real dice: the d20 to hit, the damage die and the 1d4 terrain
+  hazard. Leaves are valued from the monster side: the user's HP, the
+  monsters' HP, the damage the user can deal back from their best
+  reachable square next turn, the damage the monsters threaten, and how
+  far the monsters still are from the user.
+- Rollouts: the best few squares are then played out to the end of the
+  fight (or a few rounds) with scripted policies. Batches are spread over
+  a process pool until the turn's time budget runs out, and the square
+  with the best monster win rate is chosen.
+- A transposition table, keyed on a compact state (terrain, positions,
+  HP, spell slots, whose turn), keeps leaf values and whole decisions.
+  Rollout statistics accumulate when the same position comes back.
+
+DIFFICULTY_SETTINGS picks the monster policy and search effort per
+difficulty level.
+"""
+
+import os
+import random
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from .encounter import (
+    USER_ID,
+    attributes_key,
+    enemies_of,
+    get_attributes,
+    get_position,
+    living_monsters,
+    monster_ids,
+    position_key,
+)
+from .grid import get_grid
+from .policies import (
+    POLICIES,
+    act,
+    average,
+    end_monster_turn,
+    expected_dealt,
+    hit_chance,
+    lookahead_policy,
+    pathfinding_policy,
+    play_rounds,
+    reachable,
+    walk,
+)
+
+# Policy and search effort per difficulty. time_budget is seconds per
+# monster turn; rollouts is the number of playouts per candidate square,
+# on `workers` processes (0 plays them in this process).
+DIFFICULTY_SETTINGS = {
+    'easy': {'policy': 'greedy'},
+    'normal': {'policy': 'pathfinding'},
+    'hard': {'policy': 'search', 'time_budget': 0.2, 'candidates': 3, 'rollouts': 0, 'workers': 0},
+    'deadly': {
+        'policy': 'search', 'time_budget': 1.0, 'candidates': 4, 'rollouts': 48,
+        'workers': os.cpu_count() or 1,
+    },
+}
+DEFAULT_DIFFICULTY = 'normal'
+
+# Leaf values, from the monster side
+WIN_VALUE = 1000.0
+MONSTER_HP_WEIGHT = 0.5
+PRESSURE_WEIGHT = 0.5
+# Per square between a monster and the user, so monsters close in rather
+# than wait just out of the user's reach (which stalls fights into draws)
+APPROACH_WEIGHT = 1.0
+
+# Rollouts: playouts per task sent to a worker, and rounds played before
+# an unfinished fight is scored on remaining HP
+ROLLOUT_BATCH = 8
+ROLLOUT_ROUNDS = 10
+
+TRANSPOSITION_SIZE = 20000
+
+
+class TranspositionTable:
+    """LRU map from compact state keys to values, with hit metrics."""
+
+    def __init__(self, size: int = TRANSPOSITION_SIZE):
+        self.size = size
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value) -> None:
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def summary(self) -> str:
+        return f"{len(self.entries)} entries, {self.hits} hits, {self.misses} misses"
+
+
+leaf_values = TranspositionTable()
+decisions = TranspositionTable(size=2000)
+
+
+def compact_state(state) -> tuple:
+    """Hashable key of everything the search depends on."""
+    grid = get_grid(state.get('battleground', {}))
+    combatants = tuple(
+        (cid, tuple(get_position(state, cid)), get_attributes(state, cid)['hp'])
+        for cid in [USER_ID] + monster_ids(state)
+    )
+    slots = tuple(sorted(state['user_attributes'].get('spell_slots', {}).items()))
+    return grid.key, combatants, slots, state.get('turn_tracker', {}).get('current_turn')
+
+
+def _with(state, combatant: str, position=None, hp=None) -> dict:
+    """Shallow copy of the state with a combatant moved and/or at another HP."""
+    changed = dict(state)
+    if position is not None:
+        changed['battleground'] = dict(state['battleground'])
+        changed['battleground'][position_key(combatant)] = list(position)
+    if hp is not None:
+        changed[attributes_key(combatant)] = dict(get_attributes(state, combatant), hp=hp)
+    return changed
+
+
+# ============================================================
+# EXPECTIMAX
+# ============================================================
+
+def evaluate(state) -> float:
+    """Value of a position from the monsters' side, cached by compact state."""
+    key = compact_state(state)
+    value = leaf_values.get(key)
+    if value is not None:
+        return value
+
+    user = state['user_attributes']
+    monsters = living_monsters(state)
+    if user['hp'] <= 0:
+        value = WIN_VALUE
+    elif not monsters:
+        value = -WIN_VALUE
+    else:
+        # The user's best reply: the most damage from any square they can reach
+        speed = user['speed']
+        reply = max(expected_dealt(state, USER_ID, cell) for cell in reachable(state, USER_ID, speed))
+        # Damage the monsters threaten next round
+        user_position = get_position(state, USER_ID)
+        pressure = 0.0
+        distances = 0
+        for cid in monsters:
+            monster = get_attributes(state, cid)
+            position = get_position(state, cid)
+            distance = abs(position[0] - user_position[0]) + abs(position[1] - user_position[1])
+            distances += distance
+            if distance - 1 <= monster['speed']:
+                pressure += hit_chance(user['ac']) * average(monster['damage'])
+        monster_hp = sum(get_attributes(state, cid)['hp'] for cid in monsters)
+        value = (
+            -user['hp'] + MONSTER_HP_WEIGHT * monster_hp - reply
+            + PRESSURE_WEIGHT * pressure - APPROACH_WEIGHT * distances
+        )
+    leaf_values.put(key, value)
+    return value
+
+
+def _distribution(low: int, high: int) -> list[tuple[int, float]]:
+    return [(value, 1 / (high - low + 1)) for value in range(low, high + 1)]
+
+
+def expected_value(state, monster: str, cell: tuple) -> float:
+    """
+    Expected leaf value after the monster moves to a square, attacks the
+    user if adjacent and takes terrain damage there, over every dice outcome.
+    """
+    moved = _with(state, monster, position=cell)
+    attributes = get_attributes(state, monster)
+    user = state['user_attributes']
+
+    # User HP after the attack: miss, or each damage roll
+    user_hp = {user['hp']: 1.0}
+    user_position = get_position(state, USER_ID)
+    if USER_ID in enemies_of(state, monster) and abs(cell[0] - user_position[0]) + abs(cell[1] - user_position[1]) == 1:
+        chance = hit_chance(user['ac'])
+        user_hp = {user['hp']: 1 - chance}
+        for damage, p in _distribution(*attributes['damage']):
+            hp = max(0, user['hp'] - damage)
+            user_hp[hp] = user_hp.get(hp, 0.0) + chance * p
+
+    # Monster HP after the terrain hazard
+    monster_hp = {attributes['hp']: 1.0}
+    if get_grid(state['battleground']).is_damage(*cell):
+        monster_hp = {}
+        for damage, p in _distribution(1, 4):
+            hp = max(0, attributes['hp'] - damage)
+            monster_hp[hp] = monster_hp.get(hp, 0.0) + p
+
+    total = 0.0
+    for u_hp, p_user in user_hp.items():
+        after_attack = _with(moved, USER_ID, hp=u_hp)
+        if u_hp <= 0:
+            # The fight is over before terrain matters
+            total += p_user * evaluate(after_attack)
+            continue
+        for m_hp, p_monster in monster_hp.items():
+            total += p_user * p_monster * evaluate(_with(after_attack, monster, hp=m_hp))
+    return total
+
+
+# ============================================================
+# ROLLOUTS
+# ============================================================
+
+def run_rollouts(state: dict, monster: str, path: list, seeds: list[int]) -> list[float]:
+    """
+    Plays the monster's move and the rest of the fight once per seed, with
+    the lookahead policy for the user and pathfinding for the monsters.
+    Runs in a worker process.
+
+    Returns:
+        list[float]: Per playout, 1 for a monster win, 0 for a user win,
+        and the monsters' share of the remaining HP fraction otherwise
+    """
+    scores = []
+    for seed in seeds:
+        random.seed(seed)
+        rng = random.Random(seed + 1)
+        playout = dict(state)
+        walk(playout, monster, path)
+        act(playout, monster)
+        end_monster_turn(playout, monster)
+        max_round = playout['turn_tracker'].get('round', 1) + ROLLOUT_ROUNDS
+        status = play_rounds(playout, lookahead_policy, pathfinding_policy, rng, max_round)
+        if status == 'monster_won':
+            scores.append(1.0)
+        elif status == 'user_won':
+            scores.append(0.0)
+        else:
+            user = playout['user_attributes']
+            user_left = user['hp'] / max(1, user.get('max_hp', user['hp']))
+            scores.append(0.5 + 0.5 * (1 - user_left) - 0.5 * (not living_monsters(playout)))
+    return scores
+
+
+_pool = None
+_pool_workers = 0
+
+
+def rollout_pool(workers: int) -> ProcessPoolExecutor:
+    """The shared rollout process pool, created on first use."""
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        _pool_workers = workers
+    return _pool
+
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+def _playouts(state, monster, candidates, stats, settings, deadline, rng) -> None:
+    """Adds rollout scores to stats[cell] = [total, count] until the deadline."""
+    wanted = settings['rollouts']
+    batches = []
+    for cell, path in candidates:
+        for start in range(0, wanted, ROLLOUT_BATCH):
+            seeds = [rng.randrange(2 ** 31) for _ in range(min(ROLLOUT_BATCH, wanted - start))]
+            batches.append((cell, path, seeds))
+
+    if not settings['workers']:
+        for cell, path, seeds in batches:
+            if time.monotonic() >= deadline:
+                return
+            scores = run_rollouts(state, monster, path, seeds)
+            stats[cell][0] += sum(scores)
+            stats[cell][1] += len(scores)
+        return
+
+    # A plain dict pickles; the pipeline's change-tracking state does not
+    state = dict(state)
+    pool = rollout_pool(settings['workers'])
+    pending = {pool.submit(run_rollouts, state, monster, path, seeds): cell for cell, path, seeds in batches}
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            cell = pending.pop(future)
+            scores = future.result()
+            stats[cell][0] += sum(scores)
+            stats[cell][1] += len(scores)
+    for future in pending:
+        future.cancel()
+
+
+# ============================================================
+# POLICY
+# ============================================================
+
+def search_move(state, monster: str, settings: dict, rng: random.Random | None = None) -> dict:
+    """
+    Picks the monster's destination square.
+
+    Returns:
+        dict: {'path', 'value' (expectimax), 'win_rate' (None without
+        rollouts), 'playouts', 'candidates' (squares scored), 'cached'}
+    """
+    rng = rng or random.Random()
+    started = time.monotonic()
+    deadline = started + settings['time_budget']
+    key = (compact_state(state), monster, settings['candidates'], settings['rollouts'])
+    decision = decisions.get(key)
+    if decision is not None and (not settings['rollouts'] or decision['playouts'] >= settings['rollouts']):
+        return dict(decision, cached=True)
+
+    speed = get_attributes(state, monster)['speed']
+    paths = reachable(state, monster, speed)
+    user_position = get_position(state, USER_ID)
+    # Squares near the user first, so a short budget scores the likely best ones
+    order = sorted(paths, key=lambda c: (abs(c[0] - user_position[0]) + abs(c[1] - user_position[1]), len(paths[c])))
+    values = {}
+    for cell in order:
+        if values and time.monotonic() >= deadline:
+            break
+        values[cell] = expected_value(state, monster, cell)
+
+    ranked = sorted(values, key=lambda c: (-values[c], len(paths[c])))
+    best = ranked[0]
+    win_rate = None
+    playouts = 0
+    if settings['rollouts'] and time.monotonic() < deadline:
+        top = ranked[:settings['candidates']]
+        stats = {cell: [0.0, 0] for cell in top}
+        if decision is not None:
+            # Keep the playouts of the last time this position was searched
+            for cell, (total, count) in decision.get('stats', {}).items():
+                if cell in stats:
+                    stats[cell] = [total, count]
+        _playouts(state, monster, [(cell, paths[cell]) for cell in top], stats, settings, deadline, rng)
+        scored = [cell for cell in top if stats[cell][1]]
+        if scored:
+            best = max(scored, key=lambda c: (stats[c][0] / stats[c][1], values[c]))
+            win_rate = stats[best][0] / stats[best][1]
+            playouts = sum(count for _, count in stats.values())
+        decision_stats = stats
+    else:
+        decision_stats = {}
+
+    decision = {
+        'path': paths[best],
+        'value': values[best],
+        'win_rate': win_rate,
+        'playouts': playouts,
+        'candidates': len(values),
+        'seconds': time.monotonic() - started,
+        'stats': decision_stats,
+    }
+    decisions.put(key, decision)
+    return dict(decision, cached=False)
+
+
+def summary() -> str:
+    return f"decisions: {decisions.summary()}; leaf values: {leaf_values.summary()}"
+
+
+def search_policy(state, combatant: str, rng: random.Random, settings: dict | None = None) -> list[dict]:
+    """Policy interface (see policies.py): search the move, walk it, act."""
+    settings = settings or DIFFICULTY_SETTINGS['hard']
+    decision = search_move(state, combatant, settings, rng)
+    return walk(state, combatant, decision['path']) + act(state, combatant)
+
+
+def expectimax_policy(state, combatant: str, rng: random.Random) -> list[dict]:
+    """search_policy at 'hard' settings: expectimax only, in this process."""
+    return search_policy(state, combatant, rng, DIFFICULTY_SETTINGS['hard'])
+
+
+def monster_policy(difficulty: str):
+    """The monster policy of a difficulty level."""
+    settings = DIFFICULTY_SETTINGS[difficulty]
+    if settings['policy'] == 'search':
+        return lambda state, combatant, rng: search_policy(state, combatant, rng, settings)
+    return POLICIES[settings['policy']]
+
+
+# Monster-only policies, for the tournament
+SEARCH_POLICIES = {
+    'expectimax': expectimax_policy,
+}
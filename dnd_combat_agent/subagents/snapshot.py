@@ -0,0 +1,602 @@
+"""
+D&D Combat Agent - Binary State Snapshots
+
+A compact, versioned binary encoding of the combat state, used to save
+and load games (main.py), to hibernate sessions (memory.py) and as the
+wire format when a state is sent elsewhere.
+
+Layout (little-endian):
+
+    header   magic b'DNDS', format version (u8), section flags (u8),
+             CRC-32 of the header fields and the stored body (u32)
+    body     zlib-compressed when the COMPRESSED flag is set; the
+             sections present in the flags, in this order:
+      battleground   rows, cols (u16); environment and emoji; terrain as
+                     a bitmap of rows * cols bits when its cells are in
+                     row-major order, else as the list of cells (or the
+                     two corners of the old rectangle format); every
+                     combatant position as name, row, col
+      user           class; hp, max_hp (i16); ac, speed, damage range
+                     (u8); spell slots as (level, left, max) triples;
+                     spells known
+      monsters       per monster id: hp (i16), ac, damage range, speed
+                     (u8), name, emoji
+      turn tracker   current turn, movement used (u8), action and bonus
+                     action flags (u8 bits), round (u16), initiative
+      scalars        combat status, theme
+      extras         every other key and field, as JSON
+
+Strings are a u16 length and UTF-8 bytes. The body is compressed once,
+as a whole, which also compresses the terrain bitmap and the story text;
+tiny bodies are left as they are. A section whose values do not
+fit its fixed layout (a missing field, an unexpected type, a value out
+of range) is stored whole in the extras instead, so any state round
+trips. Terrain cells keep their order: a list of two cells read back in
+another order could look like the corners of a rectangle. A truncated or
+damaged snapshot fails its checksum or its parse and raises
+SnapshotError.
+
+`python -m subagents.snapshot` benchmarks the format against JSON.
+"""
+
+import json
+import os
+import struct
+import tempfile
+import zlib
+from pathlib import Path
+
+from .encounter import monster_ids
+from .grid import _is_rectangle_format
+
+MAGIC = b'DNDS'
+VERSION = 3
+
+# Versions this build reads; version 1 wrote every cell list as a bitmap,
+# versions before 3 have no checksum
+READABLE_VERSIONS = (1, 2, 3)
+CHECKSUM_VERSION = 3
+
+SAVE_DIR = Path(os.environ.get('DND_SAVE_DIR', Path.home() / '.dnd_combat_agent' / 'saves'))
+SAVE_SUFFIX = '.dnds'
+DEFAULT_SAVE = 'quicksave'
+
+HEADER = struct.Struct('<4sBB')
+CHECKSUM = struct.Struct('<I')
+U8 = struct.Struct('<B')
+U16 = struct.Struct('<H')
+POSITION = struct.Struct('<HH')
+SIZE = struct.Struct('<HH')
+USER = struct.Struct('<hhBBBB')  # hp, max_hp, ac, speed, damage low, damage high
+SLOT = struct.Struct('<BBB')  # level, slots left, max slots
+MONSTER = struct.Struct('<hBBBB')  # hp, ac, damage low, damage high, speed
+TRACKER = struct.Struct('<BBH')  # movement used, action flags, round
+
+# Section flags
+BATTLEGROUND = 1
+USER_SECTION = 2
+MONSTERS = 4
+TRACKER_SECTION = 8
+SCALARS = 16
+EXTRAS = 32
+COMPRESSED = 64
+
+# Bodies shorter than this are not worth compressing
+COMPRESS_MIN_BYTES = 64
+
+# How the terrain is stored
+BITMAP = 0
+RECTANGLE = 1  # the two corners of the old rectangle format
+CELLS = 2  # cells not in row-major order, as a count and positions
+
+# Fields each section packs; anything else in the dict goes to the extras
+BATTLEGROUND_FIELDS = ('size', 'environment', 'environment_emoji', 'rectangle_position')
+USER_FIELDS = ('class', 'hp', 'max_hp', 'ac', 'speed', 'damage', 'spell_slots', 'max_spell_slots', 'spells_known')
+MONSTER_FIELDS = ('name', 'monster_emoji', 'hp', 'ac', 'damage', 'speed')
+TRACKER_FIELDS = ('current_turn', 'movement_used', 'action_used', 'bonus_action_used', 'round', 'initiative')
+SCALAR_KEYS = ('combat_status', 'theme')
+
+
+class SnapshotError(ValueError):
+    """Raised for data that is not a snapshot of a supported version."""
+
+
+# ============================================================
+# PRIMITIVES
+# ============================================================
+
+class _Writer:
+    def __init__(self):
+        self.parts: list[bytes] = []
+
+    def pack(self, layout: struct.Struct, *values) -> None:
+        self.parts.append(layout.pack(*values))
+
+    def text(self, value: str) -> None:
+        data = value.encode('utf-8')
+        self.parts.append(U16.pack(len(data)))
+        self.parts.append(data)
+
+    def blob(self, data: bytes) -> None:
+        self.parts.append(struct.pack('<I', len(data)))
+        self.parts.append(data)
+
+    def texts(self, values: list[str]) -> None:
+        self.pack(U8, len(values))
+        for value in values:
+            self.text(value)
+
+    def bytes(self) -> bytes:
+        return b''.join(self.parts)
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self.data = memoryview(data)
+        self.offset = 0
+
+    def unpack(self, layout: struct.Struct) -> tuple:
+        values = layout.unpack_from(self.data, self.offset)
+        self.offset += layout.size
+        return values
+
+    def _check(self, length: int) -> None:
+        if self.offset + length > len(self.data):
+            raise ValueError("snapshot ends inside a value")
+
+    def text(self) -> str:
+        (length,) = self.unpack(U16)
+        self._check(length)
+        value = str(self.data[self.offset:self.offset + length], 'utf-8')
+        self.offset += length
+        return value
+
+    def blob(self) -> bytes:
+        (length,) = struct.unpack_from('<I', self.data, self.offset)
+        self.offset += 4
+        self._check(length)
+        value = bytes(self.data[self.offset:self.offset + length])
+        self.offset += length
+        return value
+
+    def texts(self) -> list[str]:
+        (count,) = self.unpack(U8)
+        return [self.text() for _ in range(count)]
+
+
+def _rest(section: dict, fields: tuple) -> dict:
+    """Fields of a dict that its section layout does not pack."""
+    return {key: value for key, value in section.items() if key not in fields}
+
+
+def _strict_int(value) -> int:
+    # bool is an int, but would not come back as one
+    if type(value) is not int:
+        raise TypeError(f"expected an int, got {type(value).__name__}")
+    return value
+
+
+def _strict_bool(value) -> bool:
+    if type(value) is not bool:
+        raise TypeError(f"expected a bool, got {type(value).__name__}")
+    return value
+
+
+def _strict_str(value) -> str:
+    if type(value) is not str:
+        raise TypeError(f"expected a str, got {type(value).__name__}")
+    return value
+
+
+# ============================================================
+# SECTIONS
+# ============================================================
+
+def _is_position_key(key: str) -> bool:
+    return key.endswith('_position') and key != 'rectangle_position'
+
+
+def _bitmap_cells(bits: int, cols: int) -> list[list[int]]:
+    """The cells set in a terrain bitmap, in row-major order."""
+    cells = []
+    while bits:
+        lowest = bits & -bits
+        index = lowest.bit_length() - 1
+        cells.append([index // cols, index % cols])
+        bits ^= lowest
+    return cells
+
+
+def _encode_battleground(out: _Writer, battleground: dict) -> dict:
+    rows, cols = (_strict_int(v) for v in battleground['size'])
+    out.pack(SIZE, rows, cols)
+    out.text(_strict_str(battleground['environment']))
+    out.text(_strict_str(battleground['environment_emoji']))
+
+    terrain = battleground['rectangle_position']
+    if _is_rectangle_format(terrain):
+        out.pack(U8, RECTANGLE)
+        for corner in terrain:
+            out.pack(POSITION, *(_strict_int(v) for v in corner))
+    else:
+        bits = 0
+        for row, col in terrain:
+            if not (type(row) is int and type(col) is int and 0 <= row < rows and 0 <= col < cols):
+                raise ValueError(f"terrain cell {[row, col]} outside the map")
+            bits |= 1 << (row * cols + col)
+        if _bitmap_cells(bits, cols) == terrain:
+            out.pack(U8, BITMAP)
+            out.blob(bits.to_bytes((rows * cols + 7) // 8, 'little'))
+        else:
+            out.pack(U8, CELLS)
+            out.pack(U16, len(terrain))
+            for row, col in terrain:
+                out.pack(POSITION, row, col)
+
+    positions = {key: value for key, value in battleground.items() if _is_position_key(key)}
+    out.pack(U8, len(positions))
+    for key, (row, col) in positions.items():
+        out.text(key)
+        out.pack(POSITION, _strict_int(row), _strict_int(col))
+    return _rest(battleground, BATTLEGROUND_FIELDS + tuple(positions))
+
+
+def _decode_battleground(data: _Reader) -> dict:
+    rows, cols = data.unpack(SIZE)
+    battleground = {
+        'size': [rows, cols],
+        'environment': data.text(),
+        'environment_emoji': data.text(),
+    }
+    (terrain_format,) = data.unpack(U8)
+    if terrain_format == RECTANGLE:
+        battleground['rectangle_position'] = [list(data.unpack(POSITION)), list(data.unpack(POSITION))]
+    elif terrain_format == CELLS:
+        (count,) = data.unpack(U16)
+        battleground['rectangle_position'] = [list(data.unpack(POSITION)) for _ in range(count)]
+    else:
+        battleground['rectangle_position'] = _bitmap_cells(int.from_bytes(data.blob(), 'little'), cols)
+    (count,) = data.unpack(U8)
+    for _ in range(count):
+        key = data.text()
+        battleground[key] = list(data.unpack(POSITION))
+    return battleground
+
+
+def _slot_level(key: str) -> int:
+    prefix, _, level = key.partition('_')
+    if prefix != 'level' or not level.isdigit():
+        raise ValueError(f"unexpected spell slot key {key!r}")
+    return int(level)
+
+
+def _encode_user(out: _Writer, user: dict) -> dict:
+    out.text(_strict_str(user['class']))
+    low, high = user['damage']
+    out.pack(USER, *(_strict_int(v) for v in (
+        user['hp'], user['max_hp'], user['ac'], user['speed'], low, high,
+    )))
+    slots, max_slots = user['spell_slots'], user['max_spell_slots']
+    levels = sorted(set(slots) | set(max_slots), key=_slot_level)
+    if set(slots) != set(max_slots):
+        raise ValueError("spell slots and max spell slots name different levels")
+    out.pack(U8, len(levels))
+    for key in levels:
+        out.pack(SLOT, _slot_level(key), _strict_int(slots[key]), _strict_int(max_slots[key]))
+    out.texts([_strict_str(spell) for spell in user['spells_known']])
+    return _rest(user, USER_FIELDS)
+
+
+def _decode_user(data: _Reader) -> dict:
+    user = {'class': data.text()}
+    hp, max_hp, ac, speed, low, high = data.unpack(USER)
+    user.update(hp=hp, max_hp=max_hp, ac=ac, speed=speed, damage=[low, high])
+    (count,) = data.unpack(U8)
+    user['spell_slots'], user['max_spell_slots'] = {}, {}
+    for _ in range(count):
+        level, left, most = data.unpack(SLOT)
+        user['spell_slots'][f'level_{level}'] = left
+        user['max_spell_slots'][f'level_{level}'] = most
+    user['spells_known'] = data.texts()
+    return user
+
+
+def _encode_monster(out: _Writer, monster: dict) -> dict:
+    low, high = monster['damage']
+    out.pack(MONSTER, *(_strict_int(v) for v in (monster['hp'], monster['ac'], low, high, monster['speed'])))
+    out.text(_strict_str(monster['name']))
+    out.text(_strict_str(monster['monster_emoji']))
+    return _rest(monster, MONSTER_FIELDS)
+
+
+def _decode_monster(data: _Reader) -> dict:
+    hp, ac, low, high, speed = data.unpack(MONSTER)
+    return {
+        'name': data.text(), 'monster_emoji': data.text(),
+        'hp': hp, 'ac': ac, 'damage': [low, high], 'speed': speed,
+    }
+
+
+def _encode_tracker(out: _Writer, tracker: dict) -> dict:
+    flags = _strict_bool(tracker['action_used']) | _strict_bool(tracker['bonus_action_used']) << 1
+    out.text(_strict_str(tracker['current_turn']))
+    out.pack(TRACKER, _strict_int(tracker['movement_used']), flags, _strict_int(tracker['round']))
+    out.texts([_strict_str(cid) for cid in tracker['initiative']])
+    return _rest(tracker, TRACKER_FIELDS)
+
+
+def _decode_tracker(data: _Reader) -> dict:
+    current = data.text()
+    movement, flags, round_number = data.unpack(TRACKER)
+    return {
+        'current_turn': current,
+        'movement_used': movement,
+        'action_used': bool(flags & 1),
+        'bonus_action_used': bool(flags & 2),
+        'round': round_number,
+        'initiative': data.texts(),
+    }
+
+
+# ============================================================
+# ENCODE / DECODE
+# ============================================================
+
+def _try(encode, value) -> tuple[bytes, dict] | None:
+    """Encodes one section, or None when it does not fit its layout."""
+    out = _Writer()
+    try:
+        rest = encode(out, value)
+    except (KeyError, TypeError, ValueError, struct.error):
+        return None
+    return out.bytes(), rest
+
+
+def encode(state: dict) -> bytes:
+    """Encodes a combat state (see the module docstring)."""
+    flags = 0
+    body = _Writer()
+    # Keys and fields not packed: {state key: value} or {state key: {field: value}}
+    extras: dict = {}
+    packed: set = set()
+    partial: dict = {}
+
+    battleground = state.get('battleground')
+    result = _try(_encode_battleground, battleground) if isinstance(battleground, dict) else None
+    if result:
+        flags |= BATTLEGROUND
+        body.parts.append(result[0])
+        packed.add('battleground')
+        partial['battleground'] = result[1]
+
+    user = state.get('user_attributes')
+    result = _try(_encode_user, user) if isinstance(user, dict) else None
+    if result:
+        flags |= USER_SECTION
+        body.parts.append(result[0])
+        packed.add('user_attributes')
+        partial['user_attributes'] = result[1]
+
+    monsters = []
+    for cid in monster_ids(state):
+        result = _try(_encode_monster, state[cid]) if isinstance(state.get(cid), dict) else None
+        if result:
+            monsters.append((cid, result))
+    if monsters:
+        flags |= MONSTERS
+        body.pack(U8, len(monsters))
+        for cid, (data, rest) in monsters:
+            body.text(cid)
+            body.parts.append(data)
+            packed.add(cid)
+            partial[cid] = rest
+
+    tracker = state.get('turn_tracker')
+    result = _try(_encode_tracker, tracker) if isinstance(tracker, dict) else None
+    if result:
+        flags |= TRACKER_SECTION
+        body.parts.append(result[0])
+        packed.add('turn_tracker')
+        partial['turn_tracker'] = result[1]
+
+    if all(type(state.get(key)) is str for key in SCALAR_KEYS):
+        flags |= SCALARS
+        for key in SCALAR_KEYS:
+            body.text(state[key])
+            packed.add(key)
+
+    for key, value in state.items():
+        if key not in packed:
+            extras[key] = value
+    fields = {key: rest for key, rest in partial.items() if rest}
+    if extras or fields:
+        flags |= EXTRAS
+        payload = json.dumps({'keys': extras, 'fields': fields}, separators=(',', ':'), ensure_ascii=False)
+        body.blob(payload.encode('utf-8'))
+
+    data = body.bytes()
+    if len(data) >= COMPRESS_MIN_BYTES:
+        compressed = zlib.compress(data)
+        if len(compressed) < len(data):
+            flags |= COMPRESSED
+            data = compressed
+    header = HEADER.pack(MAGIC, VERSION, flags)
+    return header + CHECKSUM.pack(zlib.crc32(data, zlib.crc32(header))) + data
+
+
+def decode(data: bytes) -> dict:
+    """
+    Decodes a snapshot back into a combat state.
+
+    Raises:
+        SnapshotError: For anything that is not a whole snapshot of a
+        supported version, e.g. a truncated or corrupted save file
+    """
+    try:
+        magic, version, flags = HEADER.unpack_from(data)
+    except struct.error as exc:
+        raise SnapshotError("not a snapshot: too short") from exc
+    if magic != MAGIC:
+        raise SnapshotError("not a snapshot: bad magic bytes")
+    if version not in READABLE_VERSIONS:
+        raise SnapshotError(f"unsupported snapshot version {version} (this build reads {READABLE_VERSIONS})")
+    body = memoryview(data)[HEADER.size:]
+    if version >= CHECKSUM_VERSION:
+        try:
+            (checksum,) = CHECKSUM.unpack_from(body)
+        except struct.error as exc:
+            raise SnapshotError("not a snapshot: too short") from exc
+        body = body[CHECKSUM.size:]
+        if zlib.crc32(body, zlib.crc32(data[:HEADER.size])) != checksum:
+            raise SnapshotError("corrupt snapshot: checksum mismatch")
+    try:
+        return _decode_body(body, flags)
+    except (zlib.error, struct.error, UnicodeDecodeError, ValueError, KeyError, TypeError, AttributeError) as exc:
+        raise SnapshotError(f"corrupt snapshot: {exc}") from exc
+
+
+def _decode_body(body, flags: int) -> dict:
+    if flags & COMPRESSED:
+        body = zlib.decompress(body)
+    reader = _Reader(body)
+    state: dict = {}
+    if flags & BATTLEGROUND:
+        state['battleground'] = _decode_battleground(reader)
+    if flags & USER_SECTION:
+        state['user_attributes'] = _decode_user(reader)
+    if flags & MONSTERS:
+        (count,) = reader.unpack(U8)
+        for _ in range(count):
+            cid = reader.text()
+            state[cid] = _decode_monster(reader)
+    if flags & TRACKER_SECTION:
+        state['turn_tracker'] = _decode_tracker(reader)
+    if flags & SCALARS:
+        for key in SCALAR_KEYS:
+            state[key] = reader.text()
+    if flags & EXTRAS:
+        extras = json.loads(reader.blob())
+        state.update(extras['keys'])
+        for key, rest in extras['fields'].items():
+            state[key].update(rest)
+    if reader.offset != len(reader.data):
+        raise ValueError(f"{len(reader.data) - reader.offset} bytes left after the last section")
+    return state
+
+
+# ============================================================
+# SAVE FILES
+# ============================================================
+
+def save_path(name: str) -> Path:
+    """Save file of a save name; anything but letters, digits, - and _ is dropped."""
+    name = ''.join(ch for ch in name if ch.isalnum() or ch in '-_') or DEFAULT_SAVE
+    return SAVE_DIR / f'{name}{SAVE_SUFFIX}'
+
+
+def save(state: dict, name: str = DEFAULT_SAVE) -> Path:
+    path = save_path(name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(encode(dict(state)))
+    return path
+
+
+def load(name: str = DEFAULT_SAVE) -> dict:
+    return decode(save_path(name).read_bytes())
+
+
+# ============================================================
+# BENCHMARK
+# ============================================================
+
+def benchmark(states: list[dict], repeats: int = 20) -> dict:
+    """
+    Size and encode/decode time of snapshots against JSON for the same
+    states.
+
+    Returns:
+        dict: {'snapshot' | 'json': {'bytes', 'encode_us', 'decode_us'}},
+        averages per state
+    """
+    import time
+
+    def measure(dumps, loads):
+        encoded = [dumps(state) for state in states]
+        started = time.perf_counter()
+        for _ in range(repeats):
+            for state in states:
+                dumps(state)
+        encode_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        for _ in range(repeats):
+            for data in encoded:
+                loads(data)
+        decode_seconds = time.perf_counter() - started
+        runs = repeats * len(states)
+        return {
+            'bytes': sum(len(data) for data in encoded) / len(states),
+            'encode_us': encode_seconds / runs * 1e6,
+            'decode_us': decode_seconds / runs * 1e6,
+        }
+
+    return {
+        'snapshot': measure(encode, decode),
+        'json': measure(lambda state: json.dumps(state).encode('utf-8'), json.loads),
+        'json_zlib': measure(
+            lambda state: zlib.compress(json.dumps(state).encode('utf-8')),
+            lambda data: json.loads(zlib.decompress(data)),
+        ),
+    }
+
+
+def main():
+    import random
+
+    # Run from the game directory: the benchmark states come from
+    # tournament matches stopped part-way through
+    from tournament import new_match_state
+    from .policies import pathfinding_policy, play_rounds
+
+    states = []
+    for seed in range(50):
+        random.seed(seed)
+        state = new_match_state(('fighter', 'wizard')[seed % 2], seed, 1 + seed % 3)
+        play_rounds(state, pathfinding_policy, pathfinding_policy, random.Random(seed), 1 + seed % 4)
+        if decode(encode(state)) != state:
+            raise AssertionError(f"state {seed} does not round trip")
+        states.append(state)
+
+    # Two cells out of row-major order must not come back as the corners
+    # of a rectangle
+    state = dict(states[0], battleground=dict(states[0]['battleground'], rectangle_position=[[3, 3], [1, 1]]))
+    if decode(encode(state)) != state:
+        raise AssertionError("out-of-order terrain cells do not round trip")
+
+    # Damaged save files must be refused, not crash the game
+    global SAVE_DIR
+    saves = SAVE_DIR
+    with tempfile.TemporaryDirectory() as directory:
+        SAVE_DIR = Path(directory)
+        try:
+            path = save(states[0], 'damaged')
+            data = path.read_bytes()
+            for damaged in (data[:len(data) // 2], data[:-1], bytes([data[0] ^ 1]) + data[1:],
+                            data[:-8] + bytes([data[-8] ^ 4]) + data[-7:]):
+                path.write_bytes(damaged)
+                try:
+                    load('damaged')
+                except SnapshotError:
+                    continue
+                raise AssertionError("a truncated or bit-flipped save file was loaded")
+        finally:
+            SAVE_DIR = saves
+
+    results = benchmark(states)
+    print(f"{len(states)} mid-combat states, averages per state")
+    print(f"{'format':12}{'bytes':>8}{'encode us':>11}{'decode us':>11}")
+    for name, result in results.items():
+        print(f"{name:12}{result['bytes']:8.0f}{result['encode_us']:11.1f}{result['decode_us']:11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+D&D Combat Agent - Speculative Monster Planning
+
+While the player reads the output and types the next command, the game is
+idle. The rules-first pipeline uses that time to plan the monster phase in
+advance:
+
+- After each player action, the monster phase is planned for the current
+  state and for the states the player is most likely to end the turn in
+  (one more step in each direction the player can still move).
+- A plan holds, for every monster in initiative order, its path toward the
+  nearest enemy, its chance to hit and the expected terrain damage where it
+  stops. Monsters are planned one after another on simulated positions, so
+  later monsters route around the earlier ones.
+- Plans are cached by a hash of everything they depend on (terrain,
+  combatant positions, who is alive, initiative order). On `end turn` the
+  pipeline looks up the current state and, on a hit, replays the cached
+  paths instead of searching again. Dice are still rolled at that moment.
+"""
+
+from collections import OrderedDict
+
+from .encounter import (
+    USER_ID,
+    get_attributes,
+    get_position,
+    living_combatants,
+    path_to_enemy,
+    position_key,
+)
+from .grid import get_grid
+from .validation import NEIGHBOURS
+
+# Number of planned states kept
+SPECULATION_CACHE_SIZE = 64
+
+# Expected damage of the 1d4 terrain hazard
+EXPECTED_TERRAIN_DAMAGE = 2.5
+
+
+def state_key(state) -> tuple:
+    """Hashable key of everything a monster plan depends on."""
+    grid = get_grid(state.get('battleground', {}))
+    combatants = tuple(
+        (cid, tuple(get_position(state, cid))) for cid in living_combatants(state)
+    )
+    initiative = tuple(state.get('turn_tracker', {}).get('initiative') or ())
+    return grid.key, combatants, initiative
+
+
+def monster_order(state) -> list[str]:
+    """Living monsters in the order they act after the user's turn."""
+    order = state.get('turn_tracker', {}).get('initiative') or [USER_ID]
+    if USER_ID not in order:
+        return [cid for cid in order if cid in living_combatants(state)]
+    start = order.index(USER_ID)
+    living = set(living_combatants(state))
+    rotated = order[start + 1:] + order[:start]
+    return [cid for cid in rotated if cid in living and cid != USER_ID]
+
+
+def plan_monster_phase(state) -> dict:
+    """
+    Plans every monster's turn for a state without changing it.
+
+    Returns:
+        dict: {monster id: {'path', 'end_position', 'attack_chance', 'terrain_damage'}}
+    """
+    grid = get_grid(state.get('battleground', {}))
+    simulated = dict(state)
+    simulated['battleground'] = dict(state.get('battleground', {}))
+    user_ac = get_attributes(state, USER_ID).get('ac', 10)
+    plans = {}
+    for cid in monster_order(state):
+        speed = get_attributes(state, cid)['speed']
+        path = path_to_enemy(simulated, cid)[:speed]
+        end = list(path[-1]) if path else get_position(simulated, cid)
+        simulated['battleground'][position_key(cid)] = end
+        target = tuple(get_position(simulated, USER_ID))
+        adjacent = abs(end[0] - target[0]) + abs(end[1] - target[1]) == 1
+        plans[cid] = {
+            'path': path,
+            'end_position': end,
+            # A d20 roll hits when it is at least the target's AC
+            'attack_chance': max(0.0, min(1.0, (21 - user_ac) / 20)) if adjacent else 0.0,
+            'terrain_damage': EXPECTED_TERRAIN_DAMAGE if grid.is_damage(*end) else 0.0,
+        }
+    return plans
+
+
+def likely_user_states(state) -> list[dict]:
+    """
+    The current state plus the states reached by one more player step in
+    each direction the player can still take.
+    """
+    states = [state]
+    tracker = state.get('turn_tracker', {})
+    remaining = get_attributes(state, USER_ID)['speed'] - tracker.get('movement_used', 0)
+    if remaining <= 0:
+        return states
+    grid = get_grid(state.get('battleground', {}))
+    occupied = {tuple(get_position(state, cid)) for cid in living_combatants(state)}
+    row, col = get_position(state, USER_ID)
+    for dr, dc in NEIGHBOURS:
+        if abs(dr) + abs(dc) > remaining:
+            continue
+        cell = (row + dr, col + dc)
+        if not grid.in_bounds(*cell) or grid.is_blocked(*cell) or cell in occupied:
+            continue
+        moved = dict(state)
+        moved['battleground'] = dict(state['battleground'])
+        moved['battleground'][position_key(USER_ID)] = list(cell)
+        states.append(moved)
+    return states
+
+
+class SpeculationCache:
+    """LRU cache of monster-phase plans keyed by state_key, with hit metrics."""
+
+    def __init__(self, size: int = SPECULATION_CACHE_SIZE):
+        self.size = size
+        self.plans: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.planned = 0
+
+    def speculate(self, state) -> int:
+        """
+        Plans the monster phase for the state and its likely successors.
+
+        Returns:
+            int: Number of new plans computed
+        """
+        computed = 0
+        for candidate in likely_user_states(state):
+            key = state_key(candidate)
+            if key in self.plans:
+                self.plans.move_to_end(key)
+                continue
+            self.plans[key] = plan_monster_phase(candidate)
+            computed += 1
+            if len(self.plans) > self.size:
+                self.plans.popitem(last=False)
+        self.planned += computed
+        return computed
+
+    def lookup(self, state) -> dict | None:
+        """Returns the cached plan for a state, or None."""
+        plan = self.plans.get(state_key(state))
+        if plan is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return plan
+
+    def summary(self) -> str:
+        return f"{self.hits} hits, {self.misses} misses, {self.planned} states planned"
+
+
+speculation = SpeculationCache()
@@ -0,0 +1,81 @@
+"""
+D&D Combat Agent - Startup Loading and Profiling
+
+Importing the agent graph pulls in the whole google.adk / google.genai
+stack and constructs every agent, model and tool, which takes most of a
+second. main.py shows the class menu first and loads the game modules in
+a background thread while the player is choosing.
+
+Modules are imported one by one in dependency order, so the time recorded
+for each is roughly its own cost: the libraries first, then this
+package's modules, where subagents.subagents, dm_agent and narrator time
+is mostly agent and tool construction.
+"""
+
+import importlib
+import sys
+import time
+from contextlib import contextmanager
+
+# Game modules in dependency order
+GAME_MODULES = (
+    'pydantic',
+    'google.genai.types',
+    'google.genai',
+    'google.adk.events',
+    'google.adk.agents',
+    'google.adk.tools',
+    'google.adk.runners',
+    'google.adk.sessions',
+    'subagents.resilience',
+    'subagents.output_schema',
+    'subagents.tools',
+    'subagents.callbacks',
+    'subagents.dm_agent',
+    'subagents.subagents',
+    'subagents.narrator',
+    'subagents.pipeline',
+    'subagents.procedural',
+    'subagents.memory',
+)
+
+
+class StartupProfile:
+    """Timings of startup steps, relative to when the profile was created."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings: list[tuple[str, float]] = []  # (step, seconds)
+        self.marks: list[tuple[str, float]] = []  # (event, seconds since start)
+
+    @contextmanager
+    def measure(self, step: str):
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings.append((step, time.perf_counter() - began))
+
+    def mark(self, event: str) -> None:
+        self.marks.append((event, time.perf_counter() - self.started))
+
+    def load_modules(self, names: tuple[str, ...] = GAME_MODULES) -> None:
+        """Imports the game modules, timing each one not already loaded."""
+        for name in names:
+            if name in sys.modules:
+                continue
+            with self.measure(name):
+                importlib.import_module(name)
+        self.mark('game modules loaded')
+
+    def report(self) -> list[str]:
+        lines = [f"{'module':32}{'ms':>8}"]
+        for step, seconds in self.timings:
+            lines.append(f"{step:32}{seconds * 1000:8.0f}")
+        lines.append(f"{'total':32}{sum(s for _, s in self.timings) * 1000:8.0f}")
+        for event, seconds in self.marks:
+            lines.append(f"{event} after {seconds * 1000:.0f} ms")
+        return lines
+
+
+startup = StartupProfile()
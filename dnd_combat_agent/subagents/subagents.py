@@ -1,7 +1,6 @@
 from google.adk.agents import Agent, SequentialAgent
-from google.genai import types
-from google.adk.models.google_llm import Gemini
-from .output_schema import MonsterContent, BattlegroundContent
+from .resilience import ResilientGemini
+from .output_schema import EncounterContent, BattlegroundContent
 from .dm_agent import dm_agent
 from .callbacks import (
     before_agent_callback,
@@ -9,23 +8,15 @@ from .callbacks import (
 )
 
 
-retry_config=types.HttpRetryOptions(
-    attempts=5,  # Maximum retry attempts
-    exp_base=7,  # Delay multiplier
-    initial_delay=1,
-    http_status_codes=[429, 500, 503, 504], # Retry on these HTTP errors
-)
-
 theme_agent = Agent(
     name='theme_agent',
     description="A storyteller agent that generates the battle's theme.",
-    model= Gemini(
+    model= ResilientGemini(
         model='gemini-2.5-flash',
-        retry_options=retry_config,
     ),
     instruction="""
     You are a Fantasy Author. Your task is to generate a creative 2-sentences background hook for a D&D combat.
-    - The background hook will be used for a battle between ONE person and ONE monster. 
+    - The background hook will be used for a battle between ONE person and {encounter_size?} monster(s) (ONE if not given). 
     - Do NOT invent a name for the protagonist. Always refer to them as "you".
     - The setting must be FLAT terrain (e.g., swamp, forest floor, frozen lake, magma river). Do NOT use towers, cliffs, stairs, or rooftops
     
@@ -38,14 +29,14 @@ theme_agent = Agent(
 
 monster_generator = Agent(
     name='Monster_generator',
-    model=Gemini(
+    model=ResilientGemini(
         model='gemini-2.5-flash',
-        retry_options=retry_config,
     ),
-    description='An agent that generates a monster for a D&D combat.',
+    description='An agent that generates the monsters for a D&D combat.',
     instruction="""
-    You are a Game Designer. Your task is to design a monster for a D&D combat based on a given background story.
-    You need to decide the following attributes of a monster:
+    You are a Game Designer. Your task is to design the monsters for a D&D combat based on a given background story.
+    Number of monsters to design: {encounter_size?} (design ONE monster if no number is given).
+    You need to decide the following attributes of each monster:
     - Name: The name of the monster, based on the background story.
     - Monster Emoji: The emoji to represent the monster. You can only use ONE emoji.
     - HP: The hit points of the monster. From 15 to 50.
@@ -53,21 +44,27 @@ monster_generator = Agent(
     - Damage: The attack damage range of the monster. It should be provided as a list of two integers. You can pick any interval in [1, 15].
     - Speed: The speed of the monster. From 1 to 5.
     Note: you need to make a balance! A monster that has high ac and hp usually has low damage and speed.
+    When there are several monsters, make each one weaker so the whole encounter stays fair, and give each a different name.
+    The first monster in the list is the leader.
 
     background story: {theme}
 
     IMPORTANT: You response MUST be valid JSON matching this structure:
     {
-    "name": "the monster's name",
-    "monster_emoji": "the emoji to represent the monster",
-    "hp": 20,
-    "ac": 10,
-    "damage": [5, 10],
-    "speed": 3
+    "monsters": [
+        {
+        "name": "the monster's name",
+        "monster_emoji": "the emoji to represent the monster",
+        "hp": 20,
+        "ac": 10,
+        "damage": [5, 10],
+        "speed": 3
+        }
+    ]
     }
     """,
-    output_key='monster',
-    output_schema=MonsterContent,
+    output_key='encounter',
+    output_schema=EncounterContent,
     before_agent_callback=before_agent_callback,
     after_agent_callback=after_agent_callback,
 )
@@ -75,9 +72,8 @@ monster_generator = Agent(
 bg_design_agent = Agent(
     name='battleground_design_agent',
     description='An agent that sets the battle ground',
-    model=Gemini(
+    model=ResilientGemini(
         model='gemini-2.5-flash',
-        retry_options=retry_config,
     ),
     instruction="""
     You are a Map Designer. Your task is to create an interesting battle ground for a D&D combat based on a given background story.
@@ -102,6 +98,7 @@ bg_design_agent = Agent(
     - Don't block direct path from user to monster completely
     - Leave enough open space for combat movement
     - User and monster should start 4-8 squares apart (Manhattan distance)
+    - "monster_position" is the lead monster; any other monsters are placed next to it automatically
     
     ## Examples of Good Patterns
     
@@ -155,9 +152,8 @@ bg_initializer = SequentialAgent(
 root_agent = Agent(
     name='root_agent',
     description='Root agent that routes requests to initialization or combat agents.',
-    model=Gemini(
+    model=ResilientGemini(
         model='gemini-2.5-flash-lite',
-        retry_options=retry_config,
     ),
     instruction="""
     You are the Root Agent for a D&D combat game. Your job is to intelligently route user requests to the appropriate subagent.
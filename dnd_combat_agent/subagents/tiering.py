@@ -0,0 +1,148 @@
+"""
+D&D Combat Agent - Latency-Aware Model Tiering
+
+Every model request is classified and routed to a model tier instead of
+the model hardcoded on its agent:
+
+- generation: theme, monster and battleground design
+- routing: root_agent choosing a subagent
+- routine: a short, well-formed combat command (move, attack, cast, status)
+- monster_turn: ending the turn, which plays every monster
+- free_text: anything else the DM has to interpret
+- narration: narrating a turn already resolved by the rules-first pipeline
+
+Latency is tracked per tier. When a tier's p95 goes over its budget,
+requests for it are sent to the next faster tier for a cool-down period,
+after which the tier is tried again.
+"""
+
+import re
+import time
+
+from .latency import LatencyRegistry
+
+# Tiers from most capable to fastest
+TIER_MODELS = {
+    'standard': 'gemini-2.5-flash',
+    'lite': 'gemini-2.5-flash-lite',
+}
+TIER_ORDER = ['standard', 'lite']
+
+# Tier per request class
+CLASS_TIERS = {
+    'generation': 'standard',
+    'routing': 'lite',
+    'routine': 'lite',
+    'monster_turn': 'standard',
+    'free_text': 'standard',
+    'narration': 'lite',
+}
+
+# p95 latency budget per tier, in seconds, and how long a downgrade lasts
+TIER_P95_BUDGET = {
+    'standard': 12.0,
+    'lite': 6.0,
+}
+TIER_MIN_SAMPLES = 10
+DOWNGRADE_SECONDS = 120.0
+
+GENERATION_AGENTS = ('theme_agent', 'Monster_generator', 'battleground_design_agent')
+ROUTING_AGENTS = ('root_agent',)
+NARRATION_AGENTS = ('narrator_agent',)
+
+END_TURN_PATTERN = re.compile(r"\bend\b.*\bturn\b|\bpass\b|\bdone\b|\bwait\b", re.IGNORECASE)
+ROUTINE_PATTERN = re.compile(
+    r"^\s*(move|go|walk|step|attack|hit|strike|cast|status|check|actions?|help|hint)\b",
+    re.IGNORECASE,
+)
+ROUTINE_MAX_WORDS = 8
+
+
+def classify_request(agent_name: str, text: str) -> str:
+    """
+    Returns the request class of a model call.
+
+    Args:
+        agent_name: name of the agent making the call
+        text: the player's latest input, '' if there is none
+    """
+    if agent_name in GENERATION_AGENTS:
+        return 'generation'
+    if agent_name in ROUTING_AGENTS:
+        return 'routing'
+    if agent_name in NARRATION_AGENTS:
+        return 'narration'
+    if END_TURN_PATTERN.search(text):
+        return 'monster_turn'
+    if ROUTINE_PATTERN.match(text) and len(text.split()) <= ROUTINE_MAX_WORDS:
+        return 'routine'
+    return 'free_text'
+
+
+def latest_user_text(contents) -> str:
+    """Returns the text of the last user message in a request's contents."""
+    for content in reversed(contents or []):
+        if content.role != 'user' or not content.parts:
+            continue
+        texts = [part.text for part in content.parts if part.text]
+        if texts:
+            return ' '.join(texts)
+    return ''
+
+
+class TierPolicy:
+    """
+    Maps request classes to model tiers, records per-tier latency and
+    downgrades a tier whose p95 is over budget.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.latency = LatencyRegistry()
+        self.downgraded_until: dict[str, float] = {}
+        self.requests: dict[str, int] = {}  # requests per class
+
+    def _over_budget(self, tier: str) -> bool:
+        stats = self.latency.get(tier)
+        if len(stats.samples) < TIER_MIN_SAMPLES:
+            return False
+        return stats.percentile(95) > TIER_P95_BUDGET[tier]
+
+    def select(self, request_class: str) -> tuple[str, str]:
+        """
+        Picks the tier for a request, following downgrades.
+
+        Returns:
+            tuple: (tier name, model name)
+        """
+        self.requests[request_class] = self.requests.get(request_class, 0) + 1
+        tier = CLASS_TIERS[request_class]
+        now = time.monotonic()
+        while TIER_ORDER.index(tier) < len(TIER_ORDER) - 1:
+            until = self.downgraded_until.get(tier, 0.0)
+            if until > now:
+                tier = TIER_ORDER[TIER_ORDER.index(tier) + 1]
+                continue
+            if self._over_budget(tier):
+                faster = TIER_ORDER[TIER_ORDER.index(tier) + 1]
+                self.downgraded_until[tier] = now + DOWNGRADE_SECONDS
+                # Start the tier afresh when it is tried again
+                self.latency.get(tier).samples.clear()
+                print(
+                    f"[INFO] Model tier '{tier}' p95 over {TIER_P95_BUDGET[tier]:.0f}s budget, "
+                    f"routing to '{faster}' for {DOWNGRADE_SECONDS:.0f}s"
+                )
+                tier = faster
+                continue
+            break
+        return tier, TIER_MODELS[tier]
+
+    def record(self, tier: str, seconds: float) -> None:
+        self.latency.record(tier, seconds)
+
+    def summary(self) -> str:
+        classes = ', '.join(f"{name} {count}" for name, count in sorted(self.requests.items()))
+        return f"requests per class: {classes or 'none'}"
+
+
+tiering = TierPolicy()
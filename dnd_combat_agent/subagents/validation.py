@@ -0,0 +1,192 @@
+"""
+D&D Combat Agent - Battleground Validation and Repair
+
+The battleground designer is asked to keep a path open, place 4-8 terrain
+squares and start the combatants 4-8 squares apart, but a model can get any
+of these wrong. Instead of asking it again, this module checks the design
+locally and repairs it in place:
+
+- terrain outside the map or duplicated is dropped
+- surplus terrain squares are dropped
+- starting positions outside the map, on terrain, or on top of each other are nudged
+- the monster is nudged so the start distance is within limits
+- BLOCKED squares are removed until the monster can be reached
+
+All checks are flood fills and set lookups over the grid, so a 9x9 map is
+validated in well under a millisecond.
+"""
+
+from collections import deque
+
+from .grid import MAX_GRID_SIZE, primary_terrain_cells
+
+MIN_GRID_SIZE = 5
+
+# Design limits from the battleground designer prompt
+MIN_TERRAIN_CELLS = 4
+MAX_TERRAIN_CELLS = 8
+MIN_START_DISTANCE = 4
+MAX_START_DISTANCE = 8
+
+# Monsters path orthogonally (encounter.path_to_enemy), so connectivity
+# uses the 4 orthogonal neighbours: a diagonal wall cuts the map
+NEIGHBOURS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+
+def _manhattan(a, b) -> int:
+    return abs(a[0] - b[0]) + abs(a[1] - b[1])
+
+
+def _clamp(value: int, low: int, high: int) -> int:
+    return max(low, min(high, value))
+
+
+def _flood_fill(start: tuple[int, int], rows: int, cols: int, blocked: set) -> set:
+    """Returns every square reachable from start without crossing blocked squares."""
+    reached = {start}
+    queue = deque([start])
+    while queue:
+        r, c = queue.popleft()
+        for dr, dc in NEIGHBOURS:
+            nxt = (r + dr, c + dc)
+            if nxt not in reached and 0 <= nxt[0] < rows and 0 <= nxt[1] < cols and nxt not in blocked:
+                reached.add(nxt)
+                queue.append(nxt)
+    return reached
+
+
+def _nearest_free(start: tuple[int, int], rows: int, cols: int, is_free) -> tuple[int, int] | None:
+    """Breadth-first search outward from start for the closest square accepted by is_free."""
+    seen = {start}
+    queue = deque([start])
+    while queue:
+        cell = queue.popleft()
+        if is_free(cell):
+            return cell
+        for dr, dc in NEIGHBOURS:
+            nxt = (cell[0] + dr, cell[1] + dc)
+            if nxt not in seen and 0 <= nxt[0] < rows and 0 <= nxt[1] < cols:
+                seen.add(nxt)
+                queue.append(nxt)
+    return None
+
+
+def validate_battleground(
+    battleground: dict,
+    min_terrain: int = MIN_TERRAIN_CELLS,
+    max_terrain: int = MAX_TERRAIN_CELLS,
+    min_distance: int = MIN_START_DISTANCE,
+    max_distance: int = MAX_START_DISTANCE,
+) -> tuple[dict, list[str]]:
+    """
+    Checks a generated battleground and repairs it locally.
+
+    Args:
+        battleground: battleground dict as produced by the designer (not modified)
+        min_terrain / max_terrain: allowed number of terrain squares
+        min_distance / max_distance: allowed Manhattan distance between the starts
+
+    Returns:
+        tuple: (repaired battleground copy, list of human-readable repairs/warnings)
+    """
+    repairs = []
+    repaired = dict(battleground)
+
+    # ----- Size -----
+    size = battleground.get('size', [])
+    if not isinstance(size, list) or len(size) != 2:
+        size = [8, 8]
+        repairs.append(f"invalid size {battleground.get('size')} replaced with {size}")
+    rows = _clamp(size[0], MIN_GRID_SIZE, MAX_GRID_SIZE)
+    cols = _clamp(size[1], MIN_GRID_SIZE, MAX_GRID_SIZE)
+    if [rows, cols] != list(size):
+        repairs.append(f"size {size} clamped to {[rows, cols]}")
+    repaired['size'] = [rows, cols]
+
+    # ----- Terrain -----
+    terrain = []
+    seen = set()
+    dropped = 0
+    for r, c in primary_terrain_cells(battleground):
+        if not (0 <= r < rows and 0 <= c < cols) or (r, c) in seen:
+            dropped += 1
+            continue
+        seen.add((r, c))
+        terrain.append((r, c))
+    if dropped:
+        repairs.append(f"dropped {dropped} out-of-bounds or duplicate terrain square(s)")
+    if len(terrain) > max_terrain:
+        repairs.append(f"dropped {len(terrain) - max_terrain} surplus terrain square(s)")
+        terrain = terrain[:max_terrain]
+    if len(terrain) < min_terrain:
+        repairs.append(f"only {len(terrain)} terrain square(s), expected at least {min_terrain}")
+    terrain_set = set(terrain)
+    blocks = battleground.get('environment', '') == 'BLOCKED'
+
+    # ----- Starting positions -----
+    def start_of(key: str) -> tuple[int, int]:
+        pos = battleground.get(key, [0, 0])
+        if not isinstance(pos, list) or len(pos) != 2:
+            pos = [0, 0]
+        clamped = (_clamp(pos[0], 0, rows - 1), _clamp(pos[1], 0, cols - 1))
+        if list(clamped) != list(pos):
+            repairs.append(f"{key} {pos} moved inside the map to {list(clamped)}")
+        return clamped
+
+    user = start_of('user_position')
+    monster = start_of('monster_position')
+
+    if user in terrain_set:
+        moved = _nearest_free(user, rows, cols, lambda cell: cell not in terrain_set and cell != monster)
+        if moved:
+            repairs.append(f"user_position {list(user)} was on terrain, nudged to {list(moved)}")
+            user = moved
+    if monster in terrain_set or monster == user:
+        moved = _nearest_free(monster, rows, cols, lambda cell: cell not in terrain_set and cell != user)
+        if moved:
+            repairs.append(f"monster_position {list(monster)} was on terrain or the user, nudged to {list(moved)}")
+            monster = moved
+
+    # ----- Connectivity -----
+    blocked = terrain_set if blocks else set()
+    reachable = _flood_fill(user, rows, cols, blocked)
+    while monster not in reachable and blocked:
+        # Open the wall square next to the user's region that is closest to the monster
+        frontier = [
+            cell for cell in blocked
+            if any((cell[0] + dr, cell[1] + dc) in reachable for dr, dc in NEIGHBOURS)
+        ]
+        if not frontier:
+            break
+        opened = min(frontier, key=lambda cell: _manhattan(cell, monster))
+        blocked = blocked - {opened}
+        terrain_set.discard(opened)
+        terrain = [cell for cell in terrain if cell != opened]
+        repairs.append(f"removed blocked square {list(opened)} to open a path to the monster")
+        reachable = _flood_fill(user, rows, cols, blocked)
+
+    # ----- Start distance -----
+    distance = _manhattan(user, monster)
+    if not min_distance <= distance <= max_distance:
+        def acceptable(cell):
+            return (
+                cell in reachable
+                and cell != user
+                and cell not in terrain_set
+                and min_distance <= _manhattan(cell, user) <= max_distance
+            )
+        moved = _nearest_free(monster, rows, cols, acceptable)
+        if moved:
+            repairs.append(
+                f"start distance {distance} outside {min_distance}-{max_distance}, "
+                f"monster nudged from {list(monster)} to {list(moved)}"
+            )
+            monster = moved
+        else:
+            repairs.append(f"start distance {distance} outside {min_distance}-{max_distance} and no better square found")
+
+    repaired['rectangle_position'] = [list(cell) for cell in terrain]
+    repaired['user_position'] = list(user)
+    repaired['monster_position'] = list(monster)
+    return repaired, repairs
+
@@ -0,0 +1,161 @@
+"""
+D&D Combat Agent - Line of Sight and Area of Effect
+
+Ranged spells need to know whether BLOCKED terrain stands between the
+caster and the target, and which squares an area spell reaches.
+
+- Visibility is computed once per (battleground, origin) as a bitset over
+  the square window of MAX_SIGHT_RANGE around the origin, then cached, so
+  every later line-of-sight check is a shift and a mask.
+- Area templates (the squares covered by a shape of a given radius) are
+  computed once per (shape, radius) and reused for every cast.
+"""
+
+from collections import OrderedDict
+from functools import lru_cache
+
+from .grid import BLOCKED, BattleGrid
+
+# Longest spell range in squares; visibility tables cover this radius
+MAX_SIGHT_RANGE = 30
+
+# Number of battlegrounds whose visibility tables are kept in memory
+_TABLE_CACHE_SIZE = 4
+
+
+def line_cells(origin: tuple[int, int], target: tuple[int, int]) -> list[tuple[int, int]]:
+    """
+    Returns the squares strictly between origin and target on a Bresenham line.
+    """
+    r0, c0 = origin
+    r1, c1 = target
+    dr, dc = abs(r1 - r0), abs(c1 - c0)
+    step_r = 1 if r1 > r0 else -1
+    step_c = 1 if c1 > c0 else -1
+    err = dc - dr
+    r, c = r0, c0
+    cells = []
+    while True:
+        e2 = 2 * err
+        if e2 > -dr:
+            err -= dr
+            c += step_c
+        if e2 < dc:
+            err += dc
+            r += step_r
+        if (r, c) == (r1, c1):
+            return cells
+        cells.append((r, c))
+
+
+class VisibilityTable:
+    """
+    Lazily computed line-of-sight bitsets for one battleground.
+
+    For each origin the table stores an integer whose bit i is set when the
+    i-th square of the (2R+1)x(2R+1) window around the origin is visible.
+    """
+
+    def __init__(self, grid: BattleGrid, sight_range: int = MAX_SIGHT_RANGE):
+        self.grid = grid
+        self.sight_range = sight_range
+        self.width = 2 * sight_range + 1
+        self.masks: dict[tuple[int, int], int] = {}
+        self.has_walls = any(flag & BLOCKED for flag in set(grid.flags))
+
+    def _compute(self, origin: tuple[int, int]) -> int:
+        grid = self.grid
+        R, width = self.sight_range, self.width
+        r0, c0 = origin
+        bits = bytearray((width * width + 7) // 8)
+        flags, cols = grid.flags, grid.cols
+        for r in range(max(0, r0 - R), min(grid.rows, r0 + R + 1)):
+            span = R - abs(r - r0)
+            for c in range(max(0, c0 - span), min(cols, c0 + span + 1)):
+                if self.has_walls:
+                    if any(flags[lr * cols + lc] & BLOCKED for lr, lc in line_cells(origin, (r, c))):
+                        continue
+                i = (r - r0 + R) * width + (c - c0 + R)
+                bits[i >> 3] |= 1 << (i & 7)
+        return int.from_bytes(bits, 'little')
+
+    def mask(self, origin: list[int]) -> int:
+        key = (origin[0], origin[1])
+        mask = self.masks.get(key)
+        if mask is None:
+            mask = self._compute(key)
+            self.masks[key] = mask
+        return mask
+
+    def visible(self, origin: list[int], target: list[int]) -> bool:
+        """
+        True when no BLOCKED square lies between origin and target and the
+        target is within the table's sight range (Manhattan distance).
+        """
+        dr, dc = target[0] - origin[0], target[1] - origin[1]
+        R = self.sight_range
+        if abs(dr) + abs(dc) > R:
+            return False
+        i = (dr + R) * self.width + (dc + R)
+        return bool((self.mask(origin) >> i) & 1)
+
+
+_tables: OrderedDict = OrderedDict()
+
+
+def get_visibility(grid: BattleGrid) -> VisibilityTable:
+    """
+    Returns the visibility table for a grid. Grids are cached per terrain by
+    get_grid, so the table lives as long as the battleground's terrain does.
+    """
+    key = id(grid)
+    entry = _tables.get(key)
+    if entry is not None and entry.grid is grid:
+        _tables.move_to_end(key)
+        return entry
+    table = VisibilityTable(grid)
+    _tables[key] = table
+    if len(_tables) > _TABLE_CACHE_SIZE:
+        _tables.popitem(last=False)
+    return table
+
+
+@lru_cache(maxsize=None)
+def aoe_template(shape: str, radius: int) -> frozenset:
+    """
+    Returns the (row, col) offsets covered by an area of effect centred on (0, 0).
+
+    Args:
+        shape: 'sphere' (round, Euclidean radius) or 'cube' (square, Chebyshev radius)
+        radius: radius in squares
+    """
+    offsets = set()
+    for dr in range(-radius, radius + 1):
+        for dc in range(-radius, radius + 1):
+            if shape == 'cube' or dr * dr + dc * dc <= radius * radius:
+                offsets.add((dr, dc))
+    return frozenset(offsets)
+
+
+def aoe_cells(grid: BattleGrid, center: list[int], shape: str, radius: int) -> set[tuple[int, int]]:
+    """
+    Returns the squares an area spell reaches: its template clipped to the
+    map, minus squares hidden from the centre by BLOCKED terrain.
+    """
+    table = get_visibility(grid)
+    cells = set()
+    for dr, dc in aoe_template(shape, radius):
+        cell = (center[0] + dr, center[1] + dc)
+        if grid.in_bounds(*cell) and table.visible(center, cell):
+            cells.add(cell)
+    return cells
+
+
+def in_area(grid: BattleGrid, center: list[int], shape: str, radius: int, position: list[int]) -> bool:
+    """
+    O(1) check of whether a single square is hit by an area spell.
+    """
+    offset = (position[0] - center[0], position[1] - center[1])
+    if offset not in aoe_template(shape, radius):
+        return False
+    return get_visibility(grid).visible(center, position)
@@ -0,0 +1,265 @@
+"""
+D&D Combat Agent - AI-vs-AI Tournament
+
+Plays scripted policies (subagents/policies.py) against each other with
+no player and no model: every user class and policy against every monster
+policy, on a library of procedurally generated battlegrounds. Matches
+run on a process pool and use the rules engine in subagents/rules.py, so
+the rules are the game's own. Results are aggregated into win rates and
+Elo ratings. With --record, every match is also appended to the
+analytics store (subagents/analytics.py).
+
+Usage:
+    python tournament.py --maps 10 --repeats 4 --workers 8
+    python tournament.py --policies pathfinding lookahead --classes wizard --monsters 2
+    python tournament.py --policies lookahead --monster-policies pathfinding expectimax
+    python tournament.py --maps 10 --repeats 4 --record
+"""
+
+import argparse
+import itertools
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from subagents.analytics import DEFAULT_DB, CombatStore, outcome_row
+from subagents.encounter import USER_ID, monster_ids, roll_initiative
+from subagents.policies import POLICIES, play_rounds
+from subagents.procedural import generate_scenario
+from subagents.search import SEARCH_POLICIES
+from utils import create_character
+
+CLASSES = ('fighter', 'wizard')
+
+# A match still going after this many rounds is a draw
+MAX_ROUNDS = 50
+
+ELO_START = 1500.0
+ELO_K = 16.0
+
+# Search policies only play monsters
+MONSTER_POLICIES = {**POLICIES, **SEARCH_POLICIES}
+
+
+def parse_args():
+    """
+    Parses command line options.
+    """
+    parser = argparse.ArgumentParser(description="D&D Combat Agent - AI-vs-AI tournament")
+    parser.add_argument(
+        '--policies', nargs='+', choices=sorted(POLICIES), default=sorted(POLICIES),
+        help="User policies to enter, and monster policies unless --monster-policies is given (default: all)",
+    )
+    parser.add_argument(
+        '--monster-policies', nargs='+', choices=sorted(MONSTER_POLICIES), default=None,
+        help="Monster policies to enter, including search policies (default: same as --policies)",
+    )
+    parser.add_argument(
+        '--classes', nargs='+', choices=CLASSES, default=list(CLASSES),
+        help="User classes to enter (default: both)",
+    )
+    parser.add_argument(
+        '--maps', type=int, default=8,
+        help="Number of battlegrounds in the library (default: 8)",
+    )
+    parser.add_argument(
+        '--repeats', type=int, default=4,
+        help="Matches per pairing and battleground (default: 4)",
+    )
+    parser.add_argument(
+        '--monsters', type=int, default=1,
+        help="Monsters per encounter (default: 1)",
+    )
+    parser.add_argument(
+        '--workers', type=int, default=os.cpu_count(),
+        help="Worker processes (default: one per CPU)",
+    )
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help="Seed of the battleground library and the dice",
+    )
+    parser.add_argument(
+        '--record', action='store_true',
+        help="Append the matches to the analytics store (see --db)",
+    )
+    parser.add_argument(
+        '--db', default=str(DEFAULT_DB),
+        help=f"Analytics database (default: {DEFAULT_DB})",
+    )
+    return parser.parse_args()
+
+
+# ============================================================
+# MATCHES
+# ============================================================
+
+def new_match_state(user_class: str, map_seed: int, encounter_size: int) -> dict:
+    """Builds the starting state of a match, as main.py does for a game."""
+    state = generate_scenario(encounter_size=encounter_size, seed=map_seed)
+    state['user_attributes'] = create_character(user_class)
+    state['turn_tracker'] = {
+        'current_turn': USER_ID,
+        'movement_used': 0,
+        'action_used': False,
+        'bonus_action_used': False,
+        'initiative': roll_initiative(state),
+        'round': 1,
+    }
+    state['combat_status'] = 'ongoing'
+    return state
+
+
+def play_match(spec: dict) -> dict:
+    """
+    Plays one match to the end. Runs in a worker process.
+
+    Args:
+        spec: {'user_class', 'user_policy', 'monster_policy', 'map_seed',
+            'encounter_size', 'seed'}
+
+    Returns:
+        dict: The spec plus 'winner' ('user', 'monster' or 'draw'),
+        'rounds', 'user_hp', 'monsters_alive' and 'row' (the analytics row)
+    """
+    # The rules roll dice with the module-level generator
+    random.seed(spec['seed'])
+    rng = random.Random(spec['seed'] + 1)
+    initial = new_match_state(spec['user_class'], spec['map_seed'], spec['encounter_size'])
+    state = dict(initial)
+    status = play_rounds(
+        state, POLICIES[spec['user_policy']], MONSTER_POLICIES[spec['monster_policy']], rng, MAX_ROUNDS,
+    )
+
+    winner = {'user_won': 'user', 'monster_won': 'monster'}.get(status, 'draw')
+    return dict(
+        spec,
+        winner=winner,
+        rounds=state['turn_tracker']['round'],
+        user_hp=state['user_attributes']['hp'],
+        monsters_alive=sum(state[cid]['hp'] > 0 for cid in monster_ids(state)),
+        row=outcome_row(
+            initial, state, 'tournament', winner,
+            user_policy=spec['user_policy'], monster_policy=spec['monster_policy'], seed=spec['seed'],
+        ),
+    )
+
+
+def schedule(policies, monster_policies, classes, maps: int, repeats: int, encounter_size: int, seed: int) -> list[dict]:
+    """Every user entry against every monster policy on every battleground."""
+    specs = []
+    for index, (user_class, user_policy, monster_policy, map_index, repeat) in enumerate(
+        itertools.product(classes, policies, monster_policies, range(maps), range(repeats))
+    ):
+        specs.append({
+            'user_class': user_class,
+            'user_policy': user_policy,
+            'monster_policy': monster_policy,
+            'map_seed': seed * 1000 + map_index,
+            'encounter_size': encounter_size,
+            'seed': seed * 1_000_000 + index,
+        })
+    return specs
+
+
+def run_tournament(specs: list[dict], workers: int | None = None) -> list[dict]:
+    """Plays every match on a process pool, results in schedule order."""
+    chunksize = max(1, len(specs) // ((workers or os.cpu_count() or 1) * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(play_match, specs, chunksize=chunksize))
+
+
+# ============================================================
+# RATINGS
+# ============================================================
+
+def user_entry(result: dict) -> str:
+    return f"{result['user_class']}/{result['user_policy']}"
+
+
+def monster_entry(result: dict) -> str:
+    return f"monster/{result['monster_policy']}"
+
+
+def elo_ratings(results: list[dict]) -> dict[str, float]:
+    """
+    Elo ratings of every user entry and monster policy, from the results
+    in schedule order (so the same tournament always gives the same
+    ratings). A draw counts half a win.
+    """
+    ratings: dict[str, float] = {}
+    for result in results:
+        user, monster = user_entry(result), monster_entry(result)
+        user_rating = ratings.setdefault(user, ELO_START)
+        monster_rating = ratings.setdefault(monster, ELO_START)
+        expected = 1 / (1 + 10 ** ((monster_rating - user_rating) / 400))
+        score = {'user': 1.0, 'monster': 0.0, 'draw': 0.5}[result['winner']]
+        ratings[user] = user_rating + ELO_K * (score - expected)
+        ratings[monster] = monster_rating - ELO_K * (score - expected)
+    return ratings
+
+
+def win_rates(results: list[dict]) -> dict:
+    """
+    Returns:
+        dict: {'matrix': {user entry: {monster policy: user win rate}},
+        'entries': {entry: {'matches', 'wins', 'draws', 'win_rate'}}}
+    """
+    matrix: dict[str, dict[str, list[int]]] = {}
+    entries: dict[str, dict] = {}
+    for result in results:
+        user, monster = user_entry(result), monster_entry(result)
+        cell = matrix.setdefault(user, {}).setdefault(result['monster_policy'], [0, 0])
+        cell[0] += result['winner'] == 'user'
+        cell[1] += 1
+        for entry, side in ((user, 'user'), (monster, 'monster')):
+            stats = entries.setdefault(entry, {'matches': 0, 'wins': 0, 'draws': 0})
+            stats['matches'] += 1
+            stats['wins'] += result['winner'] == side
+            stats['draws'] += result['winner'] == 'draw'
+    for stats in entries.values():
+        stats['win_rate'] = stats['wins'] / stats['matches']
+    return {
+        'matrix': {user: {m: wins / total for m, (wins, total) in row.items()} for user, row in matrix.items()},
+        'entries': entries,
+    }
+
+
+def format_results(results: list[dict]) -> list[str]:
+    rates = win_rates(results)
+    ratings = elo_ratings(results)
+    monsters = sorted({r['monster_policy'] for r in results})
+    lines = ["User win rate (rows: user class/policy, columns: monster policy)"]
+    lines.append(f"{'':24}" + ''.join(f"{m:>13}" for m in monsters))
+    for user, row in sorted(rates['matrix'].items()):
+        lines.append(f"{user:24}" + ''.join(f"{row.get(m, 0):13.0%}" for m in monsters))
+    lines.append("")
+    lines.append(f"{'entry':24}{'Elo':>7}{'matches':>9}{'wins':>7}{'draws':>7}{'win rate':>10}")
+    for entry, rating in sorted(ratings.items(), key=lambda item: -item[1]):
+        stats = rates['entries'][entry]
+        lines.append(
+            f"{entry:24}{rating:7.0f}{stats['matches']:9}{stats['wins']:7}"
+            f"{stats['draws']:7}{stats['win_rate']:10.0%}"
+        )
+    return lines
+
+
+def main(args):
+    monster_policies = args.monster_policies or args.policies
+    specs = schedule(args.policies, monster_policies, args.classes, args.maps, args.repeats, max(1, args.monsters), args.seed)
+    print(f"Playing {len(specs)} matches on {args.workers} worker(s)...")
+    started = time.perf_counter()
+    results = run_tournament(specs, args.workers)
+    elapsed = time.perf_counter() - started
+    rounds = sum(r['rounds'] for r in results) / len(results)
+    print(f"Done in {elapsed:.1f}s ({len(results) / elapsed:.0f} matches/s, {rounds:.1f} rounds per match)\n")
+    print("\n".join(format_results(results)))
+    if args.record:
+        store = CombatStore(args.db)
+        store.record_many(r['row'] for r in results)
+        store.close()
+        print(f"\nRecorded {store.written} matches in {args.db}")
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -8,10 +8,12 @@ Provides helper functions for:
 - Combat status display
 """
 
-from google.genai import types
 import random
 
-async def call_agent(runner, user_id, session_id, user_input, session_service):
+from subagents.grid import VIEWPORT_SIZE, get_grid, render_viewport
+from subagents.encounter import monster_ids, position_key
+
+async def call_agent(runner, user_id, session_id, user_input, session_service, on_state_delta=None):
     """
     Calls an agent and returns both the response and updated session state.
     
@@ -21,23 +23,33 @@ async def call_agent(runner, user_id, session_id, user_input, session_service):
         session_id: Session identifier  
         user_input: User's command or message
         session_service: Session state manager
+        on_state_delta: Optional callback given each event's state delta as
+            it arrives (e.g. a tool call moving a character mid-turn)
     
     Returns:
         tuple: (response_list, final_state_dict)
     """
+    # Imported here so the class menu does not wait for the google.genai stack
+    from google.genai import types
+    from subagents.resilience import turn_budget
+    
     new_message = types.Content(
         role='user', parts=[types.Part(text=user_input)]
     )
     try:
         response = []
-        async for event in runner.run_async(
-            user_id=user_id,
-            session_id=session_id,
-            new_message=new_message
-        ):
-            if event.is_final_response():
-                if event.content and event.content.parts:
-                    response.append(event.content.parts[0].text)
+        # Every model call of this turn shares one retry/throttling budget
+        with turn_budget():
+            async for event in runner.run_async(
+                user_id=user_id,
+                session_id=session_id,
+                new_message=new_message
+            ):
+                if on_state_delta and event.actions and event.actions.state_delta:
+                    on_state_delta(event.actions.state_delta)
+                if event.is_final_response():
+                    if event.content and event.content.parts:
+                        response.append(event.content.parts[0].text)
         
         # After all events, get the fresh session state
         updated_session = await session_service.get_session(
@@ -52,9 +64,10 @@ async def call_agent(runner, user_id, session_id, user_input, session_service):
         import traceback
         traceback.print_exc()
         return [], None
-def show_battle_ground(size: list[int], rectangle_position: list[list[int]], environment_emoji: str, user_position: list[int], monster_position: list[int], monster_emoji: str):
+def show_battle_ground(size: list[int], rectangle_position: list[list[int]], environment_emoji: str, user_position: list[int], monster_position: list[int], monster_emoji: str, terrain_layers: list[dict] | None = None, viewport: tuple[int, int] = VIEWPORT_SIZE, other_monsters: list[tuple[list[int], str]] | None = None):
     """
     Prints the battleground to the terminal using emoji with 2-char width.
+    Maps larger than the viewport scroll so the user stays centred.
     
     Args:
         size: [rows, cols]
@@ -63,60 +76,26 @@ def show_battle_ground(size: list[int], rectangle_position: list[list[int]], env
         user_position: [r, c]
         monster_position: [r, c]
         monster_emoji: monster emoji
+        terrain_layers: Optional extra terrain layers (see subagents/grid.py)
+        viewport: (rows, cols) of the visible window
+        other_monsters: Optional [(position, emoji), ...] for extra monsters
     """
-    rows, cols = size
-    # Initialize grid with dots for normal ground
-    grid = [[' .' for _ in range(cols)] for _ in range(rows)]
-    
-    # Fill special terrain positions (now supports list of positions)
-    if rectangle_position:
-        # Check if it's a list of positions or old rectangle format
-        if len(rectangle_position) == 2 and isinstance(rectangle_position[0], list) and len(rectangle_position[0]) == 2 and len(rectangle_position) == 2:
-            # Old rectangle format: [[r1, c1], [r2, c2]]
-            # Check if it looks like a rectangle (second position is bottom-right)
-            if rectangle_position[1][0] >= rectangle_position[0][0] and rectangle_position[1][1] >= rectangle_position[0][1]:
-                # Treat as rectangle
-                top_left = rectangle_position[0]
-                bottom_right = rectangle_position[1]
-                
-                r_start = max(0, top_left[0])
-                r_end = min(rows - 1, bottom_right[0])
-                c_start = max(0, top_left[1])
-                c_end = min(cols - 1, bottom_right[1])
+    grid = get_grid({
+        'size': size,
+        'rectangle_position': rectangle_position,
+        'environment_emoji': environment_emoji,
+        'terrain_layers': terrain_layers,
+    })
 
-                for r in range(r_start, r_end + 1):
-                    for c in range(c_start, c_end + 1):
-                        grid[r][c] = environment_emoji
-            else:
-                # Treat as list of two positions
-                for pos in rectangle_position:
-                    r, c = pos
-                    if 0 <= r < rows and 0 <= c < cols:
-                        grid[r][c] = environment_emoji
-        else:
-            # New format: list of individual positions
-            for pos in rectangle_position:
-                if isinstance(pos, list) and len(pos) == 2:
-                    r, c = pos
-                    if 0 <= r < rows and 0 <= c < cols:
-                        grid[r][c] = environment_emoji
+    # Place Monsters (overwrite terrain), then User (overwrites everything)
+    markers = {tuple(pos): emoji for pos, emoji in other_monsters or []}
+    markers[tuple(monster_position)] = monster_emoji
+    markers[tuple(user_position)] = '🧙'
 
-    # Place Monster (overwrites terrain)
-    if 0 <= monster_position[0] < rows and 0 <= monster_position[1] < cols:
-        grid[monster_position[0]][monster_position[1]] = monster_emoji
-        
-    # Place User (overwrites everything)
-    if 0 <= user_position[0] < rows and 0 <= user_position[1] < cols:
-        grid[user_position[0]][user_position[1]] = '🧙'
-
-    # Print to terminal with coordinate frame
-    header_nums = "  " + " ".join([str(i) for i in range(cols)])
-    print("\n " + header_nums)
-    print("  +" + "--" * cols + "+")
-    for r in range(rows):
-        row_str = "".join(grid[r])
-        print(f" {r}|{row_str}|")
-    print("  +" + "--" * cols + "+\n")
+    lines = render_viewport(grid, user_position, markers, viewport)
+    print()
+    print("\n".join(lines))
+    print()
 
 
 def create_character(_class: str):
@@ -172,9 +151,29 @@ def create_character(_class: str):
     
     return user_attributes
 
-def display_combat_state(user_attributes: dict, monster: dict, battleground: dict):
+def extra_monsters(state: dict) -> dict:
+    """
+    Returns {monster_id: attributes} for every monster besides the lead one.
+    """
+    return {cid: state.get(cid, {}) for cid in monster_ids(state)[1:]}
+
+
+def extra_monster_markers(state: dict) -> list[tuple[list[int], str]]:
+    """
+    Returns [(position, emoji), ...] for every living extra monster, for show_battle_ground.
+    """
+    battleground = state.get('battleground', {})
+    return [
+        (battleground.get(position_key(cid), [0, 0]), attributes.get('monster_emoji', '👾'))
+        for cid, attributes in extra_monsters(state).items()
+        if attributes.get('hp', 0) > 0
+    ]
+
+
+def display_combat_state(user_attributes: dict, monster: dict, battleground: dict, other_monsters: dict | None = None):
     """
     Displays the current combat state including HP, positions, spell slots, and terrain info.
+    other_monsters is an optional {monster_id: attributes} dict of extra monsters.
     """
     # Get positions
     user_pos = battleground.get('user_position', [0, 0])
@@ -219,6 +218,14 @@ def display_combat_state(user_attributes: dict, monster: dict, battleground: dic
     print(f"{monster_emoji} {monster_name.upper()}")
     print(f"   HP: {monster.get('hp', 0)} | AC: {monster.get('ac', 0)} | Position: {monster_pos}")
     
+    # Extra monsters of a multi-monster encounter
+    for cid, other in (other_monsters or {}).items():
+        other_pos = battleground.get(position_key(cid), [0, 0])
+        other_distance = abs(user_pos[0] - other_pos[0]) + abs(user_pos[1] - other_pos[1])
+        status = f"HP: {other.get('hp', 0)}" if other.get('hp', 0) > 0 else "DEFEATED"
+        print(f"{other.get('monster_emoji', '👾')} {other.get('name', 'Monster').upper()} ({cid})")
+        print(f"   {status} | AC: {other.get('ac', 0)} | Position: {other_pos} | Distance: {other_distance}")
+    
     print()
     print(f"Distance: {distance} squares | Terrain: {environment_emoji} {environment}")
     print("-" * 60)